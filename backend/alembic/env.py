@@ -1,9 +1,10 @@
 from logging.config import fileConfig
+import sqlalchemy as sa
 from sqlalchemy import engine_from_config
 from sqlalchemy import pool
 from alembic import context
+from alembic.script import ScriptDirectory
 from dotenv import load_dotenv
-import os
 
 # load environment variables
 load_dotenv()
@@ -12,8 +13,9 @@ load_dotenv()
 # access to the values within the .ini file in use.
 config = context.config
 
-# Set the SQLAlchemy URL from the .env file
-config.set_main_option("sqlalchemy.url", os.getenv("DATABASE_URL"))
+# Set the SQLAlchemy URL from the .env file (app.db falls back to a local SQLite file)
+from app.db import DATABASE_URL
+config.set_main_option("sqlalchemy.url", DATABASE_URL)
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -25,7 +27,72 @@ if config.config_file_name is not None:
 # from myapp import mymodel
 # target_metadata = mymodel.Base.metadata
 from app.db import Base
+import app.models  # noqa: F401  (registers the tables on Base.metadata)
 target_metadata = Base.metadata
+from app.partitions import DEFAULT_PARTITION, PARTITION_NAME
+
+# The first revisions predate Alembic: the initial migration is empty and
+# 93c0e171f888 drops tables that create_all used to make, leaving create_all
+# to rebuild them. An empty database therefore starts from the tables as they
+# stood after that revision and is stamped there; the rest of the chain then
+# runs as usual on either dialect.
+BOOTSTRAP_REVISION = "93c0e171f888"
+
+
+def bootstrap_tables(metadata: sa.MetaData):
+    sa.Table("users", metadata,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("email", sa.String(), nullable=False),
+        sa.Column("hashed_password", sa.String(), nullable=False),
+        sa.Index("ix_users_id", "id"),
+        sa.Index("ix_users_email", "email", unique=True),
+    )
+    sa.Table("categories", metadata,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False, unique=True),
+        sa.Column("is_custom", sa.Boolean()),
+        sa.Column("user_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Index("ix_categories_id", "id"),
+    )
+    sa.Table("budgets", metadata,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("name", sa.String(), nullable=False),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("owner_id", sa.Integer(), sa.ForeignKey("users.id")),
+        sa.Index("ix_budgets_id", "id"),
+    )
+    sa.Table("transactions", metadata,
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("amount", sa.Float(), nullable=False),
+        sa.Column("category_id", sa.Integer(), sa.ForeignKey("categories.id")),
+        sa.Column("date", sa.DateTime()),
+        sa.Column("budget_id", sa.Integer(), sa.ForeignKey("budgets.id")),
+        sa.Index("ix_transactions_id", "id"),
+    )
+    return metadata
+
+
+def bootstrap_empty_database(connection) -> None:
+    """Create the post-93c0e171f888 tables in a database with no tables at all, and stamp it."""
+    if not sa.inspect(connection).get_table_names():
+        bootstrap_tables(sa.MetaData()).create_all(connection)
+        context.configure(connection=connection, target_metadata=target_metadata)
+        context.get_context().stamp(ScriptDirectory.from_config(config), BOOTSTRAP_REVISION)
+    # Always end the transaction the inspection began: Alembic leaves an
+    # already open one to its owner and would never commit the migrations.
+    connection.commit()
+
+def include_name(name, type_, parent_names) -> bool:
+    """Leave the transactions partitions out of autogenerate and `alembic check`.
+
+    app.partitions creates, archives and drops them at runtime, and their
+    indexes are copies of the parent table's.
+    """
+    table = name if type_ == "table" else parent_names.get("table_name")
+    if table is None:
+        return True
+    table = table.removeprefix("archived_")
+    return table != DEFAULT_PARTITION and not PARTITION_NAME.match(table)
 
 # other values from the config, defined by the needs of env.py,
 # can be acquired:
@@ -49,8 +116,12 @@ def run_migrations_offline() -> None:
     context.configure(
         url=url,
         target_metadata=target_metadata,
+        include_name=include_name,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        # SQLite can't alter most things in place; autogenerate batch
+        # operations, which copy the table instead.
+        render_as_batch=url.startswith("sqlite"),
     )
 
     with context.begin_transaction():
@@ -71,8 +142,12 @@ def run_migrations_online() -> None:
     )
 
     with connectable.connect() as connection:
+        bootstrap_empty_database(connection)
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            render_as_batch=connection.dialect.name == "sqlite",
         )
 
         with context.begin_transaction():
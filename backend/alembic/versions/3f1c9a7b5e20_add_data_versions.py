@@ -0,0 +1,31 @@
+"""Add data versions
+
+Revision ID: 3f1c9a7b5e20
+Revises: 8d4a6e2f0c17
+Create Date: 2026-10-18 11:24:07.519302
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c9a7b5e20'
+down_revision: Union[str, None] = '8d4a6e2f0c17'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('data_versions',
+    sa.Column('scope', sa.String(), nullable=False),
+    sa.Column('key', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('scope', 'key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('data_versions')
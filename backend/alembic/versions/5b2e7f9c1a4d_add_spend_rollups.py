@@ -0,0 +1,46 @@
+"""Add spend rollups
+
+Revision ID: 5b2e7f9c1a4d
+Revises: 93c0e171f888
+Create Date: 2026-10-18 09:12:41.204118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5b2e7f9c1a4d'
+down_revision: Union[str, None] = '93c0e171f888'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('spend_rollups',
+    sa.Column('budget_id', sa.Integer(), nullable=False),
+    sa.Column('period', sa.Date(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('total', sa.Float(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['budget_id'], ['budgets.id'], ),
+    sa.PrimaryKeyConstraint('budget_id', 'period', 'category_id')
+    )
+    # Backfill from the existing history, the way app.services.rebuild_rollups
+    # would: one row per budget, month and category (0 for none).
+    if op.get_bind().dialect.name == 'postgresql':
+        period = "CAST(date_trunc('month', date) AS date)"
+    else:
+        period = "date(date, 'start of month')"
+    op.execute(
+        "INSERT INTO spend_rollups (budget_id, period, category_id, total, count) "
+        f"SELECT budget_id, {period}, COALESCE(category_id, 0), SUM(amount), COUNT(*) FROM transactions "
+        "WHERE budget_id IS NOT NULL AND date IS NOT NULL "
+        f"GROUP BY budget_id, {period}, COALESCE(category_id, 0)"
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('spend_rollups')
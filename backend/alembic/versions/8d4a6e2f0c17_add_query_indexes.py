@@ -0,0 +1,31 @@
+"""Add indexes for hot query paths
+
+Revision ID: 8d4a6e2f0c17
+Revises: 5b2e7f9c1a4d
+Create Date: 2026-10-18 10:03:55.817342
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d4a6e2f0c17'
+down_revision: Union[str, None] = '5b2e7f9c1a4d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_budgets_owner_id', 'budgets', ['owner_id'], unique=False)
+    op.create_index('ix_categories_user_id_name', 'categories', ['user_id', 'name'], unique=False)
+    op.create_index('ix_transactions_budget_id_date_id', 'transactions', ['budget_id', 'date', 'id'], unique=False)
+    op.create_index('ix_transactions_category_id_date_id', 'transactions', ['category_id', 'date', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_transactions_category_id_date_id', table_name='transactions')
+    op.drop_index('ix_transactions_budget_id_date_id', table_name='transactions')
+    op.drop_index('ix_categories_user_id_name', table_name='categories')
+    op.drop_index('ix_budgets_owner_id', table_name='budgets')
@@ -0,0 +1,42 @@
+"""Add anomaly detection
+
+Revision ID: a7c3e9d1f5b2
+Revises: 3f1c9a7b5e20
+Create Date: 2026-10-18 14:02:51.330418
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9d1f5b2'
+down_revision: Union[str, None] = '3f1c9a7b5e20'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('transactions', sa.Column('anomaly_score', sa.Float(), nullable=True))
+    op.add_column('transactions', sa.Column('is_anomaly', sa.Boolean(), server_default=sa.false(), nullable=False))
+    op.create_index('ix_transactions_anomalies', 'transactions', ['budget_id', 'date', 'id'], unique=False,
+                    postgresql_where=sa.text('is_anomaly'), sqlite_where=sa.text('is_anomaly'))
+    op.create_table('category_stats',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('category_id', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.Column('mean', sa.Float(), nullable=False),
+    sa.Column('m2', sa.Float(), nullable=False),
+    sa.Column('sketch', sa.LargeBinary(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('user_id', 'category_id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('category_stats')
+    op.drop_index('ix_transactions_anomalies', table_name='transactions')
+    op.drop_column('transactions', 'is_anomaly')
+    op.drop_column('transactions', 'anomaly_score')
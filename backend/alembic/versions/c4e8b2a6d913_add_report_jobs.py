@@ -0,0 +1,50 @@
+"""Add report jobs
+
+Revision ID: c4e8b2a6d913
+Revises: a7c3e9d1f5b2
+Create Date: 2026-10-18 15:37:12.804156
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8b2a6d913'
+down_revision: Union[str, None] = 'a7c3e9d1f5b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('report_jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('owner_id', sa.Integer(), nullable=False),
+    sa.Column('kind', sa.String(), nullable=False),
+    sa.Column('params', sa.String(), nullable=False),
+    sa.Column('params_hash', sa.String(), nullable=False),
+    sa.Column('state', sa.String(), nullable=False),
+    sa.Column('progress', sa.Float(), nullable=False),
+    sa.Column('result_path', sa.String(), nullable=True),
+    sa.Column('error', sa.String(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['owner_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_report_jobs_id'), 'report_jobs', ['id'], unique=False)
+    op.create_index(op.f('ix_report_jobs_owner_id'), 'report_jobs', ['owner_id'], unique=False)
+    op.create_index('ix_report_jobs_active', 'report_jobs', ['owner_id', 'params_hash'], unique=True,
+                    postgresql_where=sa.text("state IN ('queued', 'running')"),
+                    sqlite_where=sa.text("state IN ('queued', 'running')"))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_report_jobs_active', table_name='report_jobs')
+    op.drop_index(op.f('ix_report_jobs_owner_id'), table_name='report_jobs')
+    op.drop_index(op.f('ix_report_jobs_id'), table_name='report_jobs')
+    op.drop_table('report_jobs')
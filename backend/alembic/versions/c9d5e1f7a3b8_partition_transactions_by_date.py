@@ -0,0 +1,135 @@
+"""Partition transactions by date
+
+Revision ID: c9d5e1f7a3b8
+Revises: c4e8b2a6d913
+Create Date: 2026-10-18 16:48:30.117942
+
+On PostgreSQL, rebuilds `transactions` as a table range-partitioned by
+month on `date`: one partition per month from the oldest row until three
+months ahead, plus a DEFAULT partition. The primary key becomes (id, date),
+since it has to include the partition key, and `date` becomes NOT NULL.
+Rows are copied in one transaction, so expect this to take a while (and
+twice the table's disk space) on large histories. Afterwards, run
+`python -m app.partitions ensure` regularly (workers also run it at startup).
+
+Other databases only get the NOT NULL constraint on `date`.
+"""
+from datetime import date, datetime
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c9d5e1f7a3b8'
+down_revision: Union[str, None] = 'c4e8b2a6d913'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+COLUMNS = "id, amount, category_id, date, budget_id, anomaly_score, is_anomaly"
+
+
+def _add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _create_indexes():
+    op.create_index('ix_transactions_id', 'transactions', ['id'], unique=False)
+    op.create_index('ix_transactions_budget_id_date_id', 'transactions', ['budget_id', 'date', 'id'], unique=False)
+    op.create_index('ix_transactions_category_id_date_id', 'transactions', ['category_id', 'date', 'id'], unique=False)
+    op.create_index('ix_transactions_anomalies', 'transactions', ['budget_id', 'date', 'id'], unique=False,
+                    postgresql_where=sa.text('is_anomaly'))
+
+
+def _drop_indexes():
+    for name in ('ix_transactions_anomalies', 'ix_transactions_category_id_date_id',
+                 'ix_transactions_budget_id_date_id', 'ix_transactions_id'):
+        op.execute(f"DROP INDEX IF EXISTS {name}")
+
+
+def upgrade() -> None:
+    bind = op.get_bind()
+    # Undated rows are dated now; they had no month to be rolled up under.
+    now = datetime.utcnow()
+    bind.execute(sa.text(
+        "INSERT INTO spend_rollups (budget_id, period, category_id, total, count) "
+        "SELECT budget_id, :period, COALESCE(category_id, 0), SUM(amount), COUNT(*) FROM transactions "
+        "WHERE date IS NULL AND budget_id IS NOT NULL GROUP BY budget_id, COALESCE(category_id, 0) "
+        "ON CONFLICT (budget_id, period, category_id) DO UPDATE "
+        "SET total = spend_rollups.total + excluded.total, count = spend_rollups.count + excluded.count"
+    ), {"period": date(now.year, now.month, 1)})
+    bind.execute(sa.text("UPDATE transactions SET date = :now WHERE date IS NULL"), {"now": now})
+    if bind.dialect.name != "postgresql":
+        with op.batch_alter_table('transactions') as batch_op:
+            batch_op.alter_column('date', existing_type=sa.DateTime(), nullable=False)
+        return
+
+    op.execute("ALTER TABLE transactions RENAME TO transactions_unpartitioned")
+    op.execute("ALTER TABLE transactions_unpartitioned RENAME CONSTRAINT transactions_pkey TO transactions_unpartitioned_pkey")
+    op.execute("ALTER SEQUENCE transactions_id_seq OWNED BY NONE")
+    _drop_indexes()
+
+    op.execute("""
+        CREATE TABLE transactions (
+            id integer NOT NULL DEFAULT nextval('transactions_id_seq'),
+            amount double precision NOT NULL,
+            category_id integer REFERENCES categories (id),
+            date timestamp without time zone NOT NULL,
+            budget_id integer REFERENCES budgets (id),
+            anomaly_score double precision,
+            is_anomaly boolean NOT NULL DEFAULT false,
+            CONSTRAINT transactions_pkey PRIMARY KEY (id, date)
+        ) PARTITION BY RANGE (date)
+    """)
+    op.execute("ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id")
+    _create_indexes()
+
+    oldest, newest = bind.execute(sa.text("SELECT min(date), max(date) FROM transactions_unpartitioned")).one()
+    now = datetime.utcnow()
+    period = date((oldest or now).year, (oldest or now).month, 1)
+    last = _add_months(date(max(newest or now, now).year, max(newest or now, now).month, 1), MONTHS_AHEAD)
+    while period <= last:
+        op.execute(
+            f"CREATE TABLE transactions_p{period.year:04d}_{period.month:02d} PARTITION OF transactions "
+            f"FOR VALUES FROM ('{period.isoformat()}') TO ('{_add_months(period, 1).isoformat()}')"
+        )
+        period = _add_months(period, 1)
+    op.execute("CREATE TABLE transactions_default PARTITION OF transactions DEFAULT")
+
+    op.execute(f"INSERT INTO transactions ({COLUMNS}) SELECT {COLUMNS} FROM transactions_unpartitioned")
+    op.execute("DROP TABLE transactions_unpartitioned")
+    op.execute("ANALYZE transactions")
+
+
+def downgrade() -> None:
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        with op.batch_alter_table('transactions') as batch_op:
+            batch_op.alter_column('date', existing_type=sa.DateTime(), nullable=True)
+        return
+
+    # Partitions detached by app.partitions (archived_*) are left as they are.
+    op.execute("ALTER TABLE transactions RENAME TO transactions_partitioned")
+    op.execute("ALTER TABLE transactions_partitioned RENAME CONSTRAINT transactions_pkey TO transactions_partitioned_pkey")
+    op.execute("ALTER SEQUENCE transactions_id_seq OWNED BY NONE")
+    _drop_indexes()
+
+    op.execute("""
+        CREATE TABLE transactions (
+            id integer NOT NULL DEFAULT nextval('transactions_id_seq'),
+            amount double precision NOT NULL,
+            category_id integer REFERENCES categories (id),
+            date timestamp without time zone,
+            budget_id integer REFERENCES budgets (id),
+            anomaly_score double precision,
+            is_anomaly boolean NOT NULL DEFAULT false,
+            CONSTRAINT transactions_pkey PRIMARY KEY (id)
+        )
+    """)
+    op.execute("ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id")
+    op.execute(f"INSERT INTO transactions ({COLUMNS}) SELECT {COLUMNS} FROM transactions_partitioned")
+    op.execute("DROP TABLE transactions_partitioned")
+    _create_indexes()
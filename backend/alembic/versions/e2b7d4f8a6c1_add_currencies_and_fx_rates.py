@@ -0,0 +1,41 @@
+"""Add currencies and fx rates
+
+Revision ID: e2b7d4f8a6c1
+Revises: c9d5e1f7a3b8
+Create Date: 2026-10-18 19:12:40.518237
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b7d4f8a6c1'
+down_revision: Union[str, None] = 'c9d5e1f7a3b8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Existing budgets, and the transactions in them, are in the default currency.
+    op.add_column('budgets', sa.Column('currency', sa.String(length=3), server_default='USD', nullable=False))
+    op.add_column('transactions', sa.Column('currency', sa.String(length=3), nullable=True))
+    op.add_column('transactions', sa.Column('original_amount', sa.Float(), nullable=True))
+    op.create_table('fx_rates',
+    sa.Column('base', sa.String(length=3), nullable=False),
+    sa.Column('quote', sa.String(length=3), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('rate', sa.Float(), nullable=False),
+    sa.PrimaryKeyConstraint('base', 'quote', 'date')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('fx_rates')
+    with op.batch_alter_table('transactions') as batch_op:
+        batch_op.drop_column('original_amount')
+        batch_op.drop_column('currency')
+    with op.batch_alter_table('budgets') as batch_op:
+        batch_op.drop_column('currency')
@@ -0,0 +1,27 @@
+"""Add report job worker
+
+Revision ID: f3c8a1d6b4e2
+Revises: e2b7d4f8a6c1
+Create Date: 2026-10-18 21:04:27.316845
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3c8a1d6b4e2'
+down_revision: Union[str, None] = 'e2b7d4f8a6c1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('report_jobs', sa.Column('worker', sa.String(), nullable=True))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('report_jobs') as batch_op:
+        batch_op.drop_column('worker')
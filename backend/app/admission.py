@@ -0,0 +1,203 @@
+# app/admission.py
+
+import asyncio
+import json
+import math
+import os
+import time
+from jose import jwt, JWTError
+from app.cache import TTLCache
+from app.db import DB_MAX_OVERFLOW, DB_POOL_SIZE
+from app.metrics import Counter, Histogram
+from app.services import ALGORITHM, AUTH_CACHE_SIZE, AUTH_CACHE_TTL_SECONDS, SECRET_KEY
+
+# Sustained requests per second and burst allowed per user (per client
+# address for anonymous requests); 0, the default, turns the rate limit off.
+RATE_LIMIT_PER_SECOND = float(os.getenv("RATE_LIMIT_PER_SECOND", "0"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "40"))
+# Behind a reverse proxy every request comes from the proxy's address. Name
+# the header it appends the client address to (e.g. X-Forwarded-For) and
+# anonymous requests are keyed on its last entry instead. Only set this when
+# the proxy overwrites or appends to the header, or clients can pick their key.
+RATE_LIMIT_FORWARDED_HEADER = os.getenv("RATE_LIMIT_FORWARDED_HEADER", "").lower().encode("latin-1")
+# Requests allowed to run at once; by default what the pool can serve
+# without waiting for a connection. 0 turns the cap off.
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(DB_POOL_SIZE + DB_MAX_OVERFLOW)))
+# Requests waiting for a slot longer than this, or arriving when this many
+# are already waiting, are shed with 503.
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "500"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "100"))
+# Probes, metrics and long-lived event streams don't hold a pooled connection.
+ADMISSION_EXEMPT_PATHS = frozenset(("/", "/metrics", "/ready", "/budgets/stream", "/docs", "/openapi.json"))
+
+ADMISSIONS = Counter("admission_requests_total", "Requests by admission outcome.", ("result",))
+QUEUE_WAIT = Histogram("admission_queue_wait_seconds", "Time admitted requests waited for an in-flight slot.")
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, burst: float):
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, rate: float, burst: float) -> float:
+        """Take one token; returns 0 on success or the seconds until one is available."""
+        now = time.monotonic()
+        self.tokens = min(burst, self.tokens + (now - self.updated) * rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / rate
+
+
+class RateLimiter:
+    """Per-key token buckets. Idle buckets expire once they would be full again."""
+
+    def __init__(self, rate: float = RATE_LIMIT_PER_SECOND, burst: float = RATE_LIMIT_BURST, maxsize: int = 100000):
+        self.rate = rate
+        self.burst = burst
+        self.buckets = TTLCache(maxsize=maxsize, ttl=max(burst / rate, 1.0) if rate > 0 else 1.0)
+
+    def check(self, key) -> float:
+        if self.rate <= 0:
+            return 0.0
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.burst)
+        wait = bucket.take(self.rate, self.burst)
+        self.buckets.set(key, bucket)
+        return wait
+
+
+class ConcurrencyLimiter:
+    """Caps requests in flight; callers queue for a slot up to a deadline."""
+
+    def __init__(self, limit: int = ADMISSION_MAX_IN_FLIGHT, timeout_ms: float = ADMISSION_QUEUE_TIMEOUT_MS,
+                 max_queue: int = ADMISSION_MAX_QUEUE):
+        self.limit = limit
+        self.timeout = timeout_ms / 1000
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.waiting = 0
+        self._semaphore = asyncio.Semaphore(limit) if limit > 0 else None
+
+    async def acquire(self) -> bool:
+        """Take a slot, waiting up to the deadline; False means the request should be shed."""
+        if self._semaphore is None:
+            return True
+        if not self._semaphore.locked():
+            await self._semaphore.acquire()
+        else:
+            if self.waiting >= self.max_queue:
+                return False
+            self.waiting += 1
+            started = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+            except asyncio.TimeoutError:
+                return False
+            finally:
+                self.waiting -= 1
+            QUEUE_WAIT.observe(time.perf_counter() - started)
+            ADMISSIONS.inc(result="queued")
+        self.in_flight += 1
+        return True
+
+    def release(self):
+        if self._semaphore is not None:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {"in_flight": self.in_flight, "waiting": self.waiting, "limit": self.limit}
+
+
+# Maps a bearer token to its verified subject ("" if it doesn't verify), so
+# each token is decoded once per TTL rather than on every request.
+subject_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+
+
+def token_subject(token: str) -> str:
+    subject = subject_cache.get(token)
+    if subject is not None:
+        return subject
+    try:
+        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        subject_cache.set(token, "")
+        return ""
+    subject = payload.get("sub") or ""
+    subject_cache.set(token, subject, ttl=payload["exp"] - time.time() if "exp" in payload else None)
+    return subject
+
+
+def principal_key(scope) -> str:
+    """The rate limit key: the token's subject if it verifies, else the client address."""
+    forwarded = None
+    for name, value in scope.get("headers", ()):
+        if name == b"authorization":
+            scheme, _, token = value.decode("latin-1").partition(" ")
+            if scheme.lower() == "bearer" and token:
+                subject = token_subject(token)
+                if subject:
+                    return f"user:{subject}"
+        elif RATE_LIMIT_FORWARDED_HEADER and name == RATE_LIMIT_FORWARDED_HEADER:
+            forwarded = value
+    if forwarded:
+        address = forwarded.decode("latin-1").rsplit(",", 1)[-1].strip()
+        if address:
+            return f"addr:{address}"
+    client = scope.get("client")
+    return f"addr:{client[0] if client else 'unknown'}"
+
+
+async def _reject(send, status_code: int, detail: str, retry_after: float):
+    body = json.dumps({"detail": detail}).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware that rate limits each user and sheds load before the pool saturates.
+
+    A user over their token bucket gets 429; a request that can't get an
+    in-flight slot within ADMISSION_QUEUE_TIMEOUT_MS gets 503. Both carry
+    Retry-After.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in ADMISSION_EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        retry_after = rate_limiter.check(principal_key(scope))
+        if retry_after:
+            ADMISSIONS.inc(result="rate_limited")
+            await _reject(send, 429, "Too many requests.", retry_after)
+            return
+        if not await limiter.acquire():
+            ADMISSIONS.inc(result="shed")
+            await _reject(send, 503, "Server is busy, try again shortly.", 1)
+            return
+        ADMISSIONS.inc(result="admitted")
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+rate_limiter = RateLimiter()
+limiter = ConcurrencyLimiter()
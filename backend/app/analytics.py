@@ -0,0 +1,119 @@
+# app/analytics.py
+
+import math
+import os
+from datetime import datetime
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import services
+from app.models import Budget, Transaction
+
+FORECAST_WINDOW_DAYS = int(os.getenv("FORECAST_WINDOW_DAYS", "30"))
+# Exhaustion dates further out than this are reported as None.
+FORECAST_HORIZON_DAYS = int(os.getenv("FORECAST_HORIZON_DAYS", "3650"))
+
+
+async def load_series(db: AsyncSession, budget_ids):
+    """Fetch (budget_id, day, amount) columns for the given budgets as NumPy arrays.
+
+    Rows come back ordered by budget, so each budget's slice is contiguous.
+    """
+    bounds = await services.transaction_date_bounds(db, budget_ids=budget_ids)
+    result = await db.execute(
+        select(Transaction.budget_id, Transaction.date, Transaction.amount)
+        .where(Transaction.budget_id.in_(budget_ids), *services.date_bounds_clause(bounds))
+        .order_by(Transaction.budget_id)
+    )
+    # Transpose the raw tuples into columns instead of indexing every Row.
+    budgets, days, amounts = list(zip(*result.tuples())) or ((), (), ())
+    return (
+        np.array(budgets, dtype=np.int64),
+        np.array(days, dtype="datetime64[D]"),
+        np.array(amounts, dtype=np.float64),
+    )
+
+
+def forecast(days, amounts, budget_amount: float, today, window: int = FORECAST_WINDOW_DAYS) -> dict:
+    """Compute burn rates and an exhaustion projection for one budget's series.
+
+    days is a datetime64[D] array and amounts the matching float64 array; they
+    need not be sorted. The burn rate is the rolling mean of daily spend over
+    the last `window` days ending today.
+    """
+    today = np.datetime64(today, "D")
+    if len(days) == 0:
+        start = today
+        daily = np.zeros(1)
+    else:
+        start = min(days.min(), today)
+        end = max(days.max(), today)
+        offsets = (days - start).astype(np.int64)
+        daily = np.bincount(offsets, weights=amounts, minlength=int((end - start).astype(np.int64)) + 1)
+
+    cumulative = np.cumsum(daily)
+    # Rolling mean via the cumulative sum: sum(daily[i-window+1:i+1]) / window.
+    shifted = np.concatenate((np.zeros(window), cumulative[:-window] if len(cumulative) > window else np.zeros(0)))
+    rolling = (cumulative - shifted[:len(cumulative)]) / window
+
+    today_index = int((today - start).astype(np.int64))
+    spent = float(cumulative[-1])
+    daily_burn = float(rolling[today_index])
+    remaining = budget_amount - spent
+
+    exhausted = remaining <= 0
+    days_remaining = None
+    exhaustion_date = None
+    if exhausted:
+        # The first day spend reached the amount. Refunds make the running
+        # total non-monotonic, so this can't be a binary search.
+        reached = cumulative >= budget_amount
+        index = int(np.argmax(reached)) if reached.any() else len(cumulative) - 1
+        exhaustion_date = (start + np.timedelta64(index, "D")).astype(object)
+        days_remaining = 0.0
+    elif daily_burn > 0:
+        days_remaining = remaining / daily_burn
+        if days_remaining <= FORECAST_HORIZON_DAYS:
+            exhaustion_date = (today + np.timedelta64(math.ceil(days_remaining), "D")).astype(object)
+
+    history_start = max(0, today_index - window + 1)
+    history_days = start + np.arange(history_start, today_index + 1).astype("timedelta64[D]")
+    return {
+        "amount": budget_amount,
+        "spent": spent,
+        "remaining": remaining,
+        "daily_burn_rate": daily_burn,
+        "weekly_burn_rate": daily_burn * 7,
+        "days_remaining": days_remaining,
+        "exhaustion_date": exhaustion_date,
+        "exhausted": exhausted,
+        "history": [
+            {"date": day, "spent": float(spent_on_day), "rolling_average": float(average)}
+            for day, spent_on_day, average in zip(
+                history_days.astype(object),
+                daily[history_start:today_index + 1],
+                rolling[history_start:today_index + 1],
+            )
+        ],
+    }
+
+
+async def forecast_budgets(db: AsyncSession, budgets, window: int = FORECAST_WINDOW_DAYS, today=None):
+    """Forecast several budgets from a single query, splitting the arrays per budget."""
+    today = today or datetime.utcnow().date()
+    if not budgets:
+        return []
+    budget_col, days, amounts = await load_series(db, [budget.id for budget in budgets])
+    ids, starts = np.unique(budget_col, return_index=True)
+    bounds = dict(zip(ids.tolist(), zip(starts.tolist(), np.append(starts[1:], len(budget_col)).tolist())))
+
+    forecasts = []
+    for budget in budgets:
+        lo, hi = bounds.get(budget.id, (0, 0))
+        result = forecast(days[lo:hi], amounts[lo:hi], budget.amount, today, window)
+        forecasts.append({"budget_id": budget.id, **result})
+    return forecasts
+
+
+async def forecast_budget(db: AsyncSession, budget: Budget, window: int = FORECAST_WINDOW_DAYS, today=None):
+    return (await forecast_budgets(db, [budget], window, today))[0]
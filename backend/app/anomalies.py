@@ -0,0 +1,180 @@
+# app/anomalies.py
+
+import math
+import os
+import numpy as np
+from sqlalchemy import delete, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db import dialect_insert, tuple_in
+from app.models import Budget, CategoryStats, Transaction
+
+# A transaction is flagged when it is at least ANOMALY_Z_THRESHOLD standard
+# deviations above the category mean *and* above the ANOMALY_QUANTILE of the
+# decayed histogram, once the category has ANOMALY_MIN_COUNT transactions.
+ANOMALY_MIN_COUNT = int(os.getenv("ANOMALY_MIN_COUNT", "20"))
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3.0"))
+ANOMALY_QUANTILE = float(os.getenv("ANOMALY_QUANTILE", "0.99"))
+# Histogram weights are multiplied by this on every insert, so recent spend
+# counts more (a weight halves after ~700 newer transactions at 0.999).
+SKETCH_DECAY = float(os.getenv("ANOMALY_SKETCH_DECAY", "0.999"))
+
+# Log-spaced buckets from 0.01 to 1e8, each 20% wider than the last.
+SKETCH_GAMMA = 1.2
+SKETCH_MIN = 0.01
+SKETCH_BUCKETS = int(math.ceil(math.log(1e8 / SKETCH_MIN, SKETCH_GAMMA))) + 1
+
+
+def bucket_of(amount: float) -> int:
+    if amount <= SKETCH_MIN:
+        return 0
+    return min(SKETCH_BUCKETS - 1, int(math.log(amount / SKETCH_MIN, SKETCH_GAMMA)) + 1)
+
+
+def load_sketch(blob) -> np.ndarray:
+    if not blob:
+        return np.zeros(SKETCH_BUCKETS, dtype=np.float32)
+    return np.frombuffer(blob, dtype=np.float32).copy()
+
+
+def quantile_rank(sketch: np.ndarray, amount: float) -> float:
+    """Fraction of the decayed weight below amount (half of its own bucket counts)."""
+    total = float(sketch.sum())
+    if total <= 0:
+        return 0.0
+    bucket = bucket_of(amount)
+    return (float(sketch[:bucket].sum()) + float(sketch[bucket]) / 2) / total
+
+
+def score(stats: CategoryStats, sketch: np.ndarray, amount: float):
+    """Return (z-score, flagged) for amount against the history in stats."""
+    if stats.count < 2:
+        return None, False
+    std = math.sqrt(stats.m2 / (stats.count - 1))
+    # Floor the deviation so a perfectly regular history doesn't divide by zero.
+    std = max(std, abs(stats.mean) * 0.01, 0.01)
+    z = (amount - stats.mean) / std
+    flagged = (
+        stats.count >= ANOMALY_MIN_COUNT
+        and z >= ANOMALY_Z_THRESHOLD
+        and quantile_rank(sketch, amount) >= ANOMALY_QUANTILE
+    )
+    return round(z, 4), flagged
+
+
+def add(stats: CategoryStats, sketch: np.ndarray, amount: float):
+    stats.count += 1
+    delta = amount - stats.mean
+    stats.mean += delta / stats.count
+    stats.m2 += delta * (amount - stats.mean)
+    sketch *= SKETCH_DECAY
+    sketch[bucket_of(amount)] += 1
+
+
+def remove(stats: CategoryStats, sketch: np.ndarray, amount: float):
+    """Undo add() for amount. The histogram part is approximate: decay isn't undone."""
+    if stats.count <= 1:
+        stats.count, stats.mean, stats.m2 = 0, 0.0, 0.0
+        sketch[:] = 0
+        return
+    stats.count -= 1
+    delta = amount - stats.mean
+    stats.mean -= delta / stats.count
+    stats.m2 = max(0.0, stats.m2 - delta * (amount - stats.mean))
+    bucket = bucket_of(amount)
+    sketch[bucket] = max(0.0, sketch[bucket] - 1)
+
+
+async def _owners(db: AsyncSession, budget_ids):
+    if not budget_ids:
+        return {}
+    rows = await db.execute(select(Budget.id, Budget.owner_id).where(Budget.id.in_(budget_ids)))
+    return dict(rows.all())
+
+
+async def _lock_stats(db: AsyncSession, keys):
+    """Load (and lock) the stats rows for keys, creating missing ones."""
+    keys = sorted(keys)
+    if not keys:
+        return {}
+    query = select(CategoryStats).where(tuple_in(db, (CategoryStats.user_id, CategoryStats.category_id), keys))
+    stats = {(row.user_id, row.category_id): row for row in await db.scalars(query.with_for_update())}
+    missing = [key for key in keys if key not in stats]
+    if missing:
+        values = [{"user_id": user_id, "category_id": category_id, "count": 0, "mean": 0.0, "m2": 0.0}
+                  for user_id, category_id in missing]
+        stmt = dialect_insert(db, CategoryStats)
+        if stmt is not None:
+            await db.execute(stmt.on_conflict_do_nothing(index_elements=["user_id", "category_id"]), values)
+            query = select(CategoryStats).where(tuple_in(db, (CategoryStats.user_id, CategoryStats.category_id), missing))
+            stats.update({(row.user_id, row.category_id): row for row in await db.scalars(query.with_for_update())})
+        else:
+            for value in values:
+                row = CategoryStats(**value)
+                db.add(row)
+                stats[(row.user_id, row.category_id)] = row
+    return stats
+
+
+async def _apply(db: AsyncSession, values, fold, scoring: bool):
+    owners = await _owners(db, {value["budget_id"] for value in values if value.get("budget_id") is not None})
+    keyed = [
+        ((owners[value["budget_id"]], value.get("category_id") or 0), value)
+        for value in values if value.get("budget_id") in owners
+    ]
+    stats = await _lock_stats(db, {key for key, _ in keyed})
+    sketches = {}
+    for key, value in keyed:
+        sketch = sketches.get(key)
+        if sketch is None:
+            sketch = sketches[key] = load_sketch(stats[key].sketch)
+        if scoring:
+            value["anomaly_score"], value["is_anomaly"] = score(stats[key], sketch, value["amount"])
+        fold(stats[key], sketch, value["amount"])
+    for key, sketch in sketches.items():
+        stats[key].sketch = sketch.tobytes()
+
+
+async def observe(db: AsyncSession, values):
+    """Score new transaction rows and fold them into their category stats.
+
+    values are dicts with budget_id, category_id and amount; anomaly_score
+    and is_anomaly are set on each. Runs inside the caller's transaction and
+    costs two small queries however long the history is.
+    """
+    for value in values:
+        value.setdefault("anomaly_score", None)
+        value.setdefault("is_anomaly", False)
+    await _apply(db, values, add, scoring=True)
+
+
+async def forget(db: AsyncSession, values):
+    """Take deleted (or about to be changed) transaction rows out of the stats."""
+    await _apply(db, values, remove, scoring=False)
+
+
+async def rebuild_stats(db: AsyncSession) -> int:
+    """Recompute every category's stats from the transactions table, oldest first."""
+    await db.execute(delete(CategoryStats))
+    rows = (
+        select(Budget.owner_id, Transaction.category_id, Transaction.amount)
+        .join(Budget, Budget.id == Transaction.budget_id)
+        .order_by(Transaction.date, Transaction.id)
+    )
+    stats = {}
+    sketches = {}
+    result = await db.stream(rows.execution_options(yield_per=10000))
+    async for owner_id, category_id, amount in result:
+        key = (owner_id, category_id or 0)
+        if key not in stats:
+            stats[key] = CategoryStats(user_id=key[0], category_id=key[1], count=0, mean=0.0, m2=0.0)
+            sketches[key] = load_sketch(None)
+        add(stats[key], sketches[key], amount)
+    values = [
+        {"user_id": row.user_id, "category_id": row.category_id, "count": row.count,
+         "mean": row.mean, "m2": row.m2, "sketch": sketches[key].tobytes()}
+        for key, row in stats.items()
+    ]
+    if values:
+        await db.execute(insert(CategoryStats), values)
+    await db.commit()
+    return len(values)
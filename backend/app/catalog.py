@@ -0,0 +1,156 @@
+# app/catalog.py
+
+import asyncio
+import os
+import time
+from sqlalchemy import select
+from app.db import open_session
+from app.models import Category, DataVersion
+from app.pubsub import broker
+
+# Upper bound on how stale a worker's catalog can get if it misses an
+# invalidation (e.g. categories seeded from another process).
+CATEGORY_CATALOG_TTL_SECONDS = float(os.getenv("CATEGORY_CATALOG_TTL_SECONDS", "300"))
+# Lookups that miss reload a snapshot older than this, for categories
+# created on another worker that hasn't told us yet.
+CATALOG_MISS_RELOAD_SECONDS = float(os.getenv("CATALOG_MISS_RELOAD_SECONDS", "1"))
+# With the memory pub/sub backend other workers' writes are never announced,
+# so the TTL drops to this to bound how long they go unseen.
+CATEGORY_CATALOG_LOCAL_TTL_SECONDS = float(os.getenv("CATEGORY_CATALOG_LOCAL_TTL_SECONDS", "5"))
+CATALOG_TOPIC = "catalog:categories"
+
+
+class CatalogSnapshot:
+    """An immutable view of every category, indexed for O(1) lookups."""
+
+    def __init__(self, categories, versions):
+        self.by_id = {category["id"]: category for category in categories}
+        # Category names are unique across the table.
+        self.by_name = {category["name"]: category for category in categories}
+        self.global_ids = [category["id"] for category in categories if category["user_id"] is None]
+        self.user_ids = {}
+        for category in categories:
+            if category["user_id"] is not None:
+                self.user_ids.setdefault(category["user_id"], []).append(category["id"])
+        self.versions = versions
+
+    def visible(self, user_id: int):
+        """The global categories plus user_id's own, as response dicts."""
+        return [self.by_id[category_id] for category_id in self.global_ids + self.user_ids.get(user_id, [])]
+
+    def is_visible(self, category_id: int, user_id: int) -> bool:
+        category = self.by_id.get(category_id)
+        return category is not None and category["user_id"] in (None, user_id)
+
+    def resolve(self, name: str, user_id: int = None):
+        """Return the category named name (visible to user_id, if given), or None."""
+        category = self.by_name.get(name)
+        if category is None or (user_id is not None and category["user_id"] not in (None, user_id)):
+            return None
+        return category
+
+    def data_versions(self, user_id: int):
+        """The same versions get_data_versions returns for categories_version_keys(user_id)."""
+        return [self.versions.get(0, 0), self.versions.get(user_id, 0)]
+
+
+class CategoryCatalog:
+    """Per-worker cache of the categories table.
+
+    Loaded from the primary on first use and reloaded after invalidate(),
+    which category writes call after committing; other workers hear about it
+    over pub/sub. A reload that races an invalidation is served once but not
+    kept.
+    """
+
+    def __init__(self, ttl: float = CATEGORY_CATALOG_TTL_SECONDS):
+        self.ttl = ttl
+        self.snapshot = None
+        self.loaded_at = 0.0
+        self.generation = 0
+        self.loads = 0
+        self._lock = asyncio.Lock()
+        self._listener = None
+
+    def fresh(self, max_age: float) -> bool:
+        return self.snapshot is not None and time.monotonic() - self.loaded_at < max_age
+
+    async def get(self, max_age: float = None) -> CatalogSnapshot:
+        """Return the current snapshot, reloading it if it is older than max_age (default the TTL)."""
+        max_age = self.ttl if max_age is None else min(max_age, self.ttl)
+        if self.fresh(max_age):
+            return self.snapshot
+        async with self._lock:
+            if self.fresh(max_age):
+                return self.snapshot
+            generation = self.generation
+            snapshot = await self._load()
+            if generation == self.generation:
+                self.snapshot, self.loaded_at = snapshot, time.monotonic()
+            return snapshot
+
+    async def matching(self, versions, user_id: int) -> CatalogSnapshot:
+        """Return a snapshot at least as new as versions, user_id's category versions read from the database.
+
+        Reloads when the current snapshot is behind, which catches writes on
+        workers whose invalidation hasn't arrived (or never will).
+        """
+        snapshot = await self.get()
+        if any(have < want for have, want in zip(snapshot.data_versions(user_id), versions)):
+            snapshot = await self.get(max_age=0)
+        return snapshot
+
+    async def _load(self) -> CatalogSnapshot:
+        self.loads += 1
+        async with open_session() as db:
+            rows = (await db.execute(
+                select(Category.id, Category.name, Category.is_custom, Category.user_id).order_by(Category.id)
+            )).all()
+            versions = dict((await db.execute(
+                select(DataVersion.key, DataVersion.version).where(DataVersion.scope == "categories")
+            )).all())
+        categories = [
+            {"id": id, "name": name, "is_custom": bool(is_custom), "user_id": user_id}
+            for id, name, is_custom, user_id in rows
+        ]
+        return CatalogSnapshot(categories, versions)
+
+    def invalidate_local(self):
+        self.generation += 1
+        self.snapshot = None
+
+    async def invalidate(self):
+        """Drop this worker's snapshot and tell the other workers to drop theirs."""
+        self.invalidate_local()
+        if not broker.backend.local_only:
+            await broker.publish(CATALOG_TOPIC, self.generation)
+
+    async def start(self):
+        if broker.backend.local_only:
+            self.ttl = min(self.ttl, CATEGORY_CATALOG_LOCAL_TTL_SECONDS)
+            return
+        self._listener = asyncio.get_running_loop().create_task(self._listen())
+
+    async def stop(self):
+        if self._listener is not None:
+            self._listener.cancel()
+            self._listener = None
+
+    async def _listen(self):
+        while True:
+            subscription = broker.subscribe([CATALOG_TOPIC])
+            try:
+                while not subscription.dropped:
+                    if await subscription.get(CATEGORY_CATALOG_TTL_SECONDS) is not None:
+                        self.invalidate_local()
+            finally:
+                broker.unsubscribe(subscription)
+            # Dropped for falling behind, so messages may have been lost.
+            self.invalidate_local()
+
+    def stats(self) -> dict:
+        snapshot = self.snapshot
+        return {"categories": len(snapshot.by_id) if snapshot else 0, "loads": self.loads}
+
+
+catalog = CategoryCatalog()
@@ -0,0 +1,266 @@
+# app/check_query_plans.py
+#
+# Seeds a scratch database with a realistic data volume, runs every service
+# query against it and checks the EXPLAIN output, so a dropped or unusable
+# index shows up as a failure instead of a production slowdown:
+#
+#     python -m app.check_query_plans --database-url sqlite:///plans.db
+#
+# Point it at a throwaway database: it creates the schema and inserts data.
+
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, event, insert, text
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+from app import analytics, anomalies, export, services
+from app.db import Base, async_url
+from app.models import Budget, Category, DataVersion, Transaction, User
+from app.seed_categories import PREDEFINED_CATEGORIES
+
+CHECKED_TABLES = {"users", "budgets", "categories", "transactions", "spend_rollups", "category_stats", "data_versions"}
+# Calls allowed to sort in memory, and why the rows they sort stay few.
+IN_MEMORY_SORTS = {
+    "list_anomalies": "merges the flagged rows of the owner's budgets, read from the partial index",
+    "list_anomalies(cursor)": "merges the flagged rows of the owner's budgets, read from the partial index",
+    "get_budget_overview": "orders one row per budget and category, and the latest few transactions per budget",
+    "get_budget_balances(owner)": "orders one row per budget",
+    "get_budget_balances(budgets)": "orders one row per budget",
+}
+SQLITE_FULL_SCAN = re.compile(r"^SCAN (\w+)(?! USING (COVERING )?INDEX)")
+ASYNCPG_PLACEHOLDER = re.compile(r"\$(\d+)")
+
+
+def seed(session: Session, users: int, budgets_per_user: int, transactions_per_budget: int):
+    """Insert synthetic users, budgets, categories and transactions.
+
+    The tables are freshly created, so ids are assigned in insertion order.
+    """
+    rng = random.Random(42)
+    session.execute(insert(User), [
+        {"email": f"user{i}@example.com", "hashed_password": "x"}
+        for i in range(1, users + 1)
+    ])
+    session.execute(insert(Category), [
+        {"name": name, "is_custom": False, "user_id": None}
+        for name in PREDEFINED_CATEGORIES
+    ])
+    session.execute(insert(Category), [
+        {"name": f"Custom {i}", "is_custom": True, "user_id": i}
+        for i in range(1, users + 1)
+    ])
+    session.execute(insert(Budget), [
+        {"name": f"Budget {b}", "amount": 10000.0, "owner_id": u}
+        for u in range(1, users + 1)
+        for b in range(1, budgets_per_user + 1)
+    ])
+    session.execute(insert(DataVersion), [
+        {"scope": scope, "key": key, "version": 1}
+        for scope, count in (("budgets", users), ("categories", users), ("transactions", users * budgets_per_user))
+        for key in range(1, count + 1)
+    ])
+    start = datetime(2020, 1, 1)
+    for budget_id in range(1, users * budgets_per_user + 1):
+        session.execute(insert(Transaction), [
+            {
+                "amount": round(rng.uniform(1, 500), 2),
+                "category_id": rng.randint(1, len(PREDEFINED_CATEGORIES)),
+                "budget_id": budget_id,
+                "date": start + timedelta(minutes=rng.randint(0, 5 * 365 * 24 * 60)),
+                "is_anomaly": rng.random() < 0.01,
+            }
+            for _ in range(transactions_per_budget)
+        ])
+    session.commit()
+
+
+async def service_calls(session: AsyncSession):
+    """Yield (name, coroutine factory) pairs covering every query the services issue."""
+    first_page, cursor = await services.list_transactions(session, budget_id=1, limit=50)
+    _, anomaly_cursor = await services.list_anomalies(session, owner_id=1, limit=2)
+    budget = await services.get_budget(session, 1, 1)
+    bounds = await services.transaction_date_bounds(session, budget_id=1)
+    token = services.create_access_token({"sub": "user1@example.com"})
+    yield "get_current_user", lambda: services.get_current_user(token=token, db=session)
+    yield "get_budgets", lambda: services.get_budgets(session, owner_id=1)
+    yield "get_budget", lambda: services.get_budget(session, 1, owner_id=1)
+    yield "get_owned_budget_ids", lambda: services.get_owned_budget_ids(session, 1, {1, 2, 3})
+    yield "list_transactions(budget)", lambda: services.list_transactions(session, budget_id=1)
+    yield "list_transactions(budget, cursor)", lambda: services.list_transactions(session, budget_id=1, cursor=cursor)
+    yield "list_transactions(budget, range)", lambda: services.list_transactions(
+        session, budget_id=1, date_from=datetime(2021, 1, 1), date_to=datetime(2022, 1, 1)
+    )
+    yield "list_transactions(category)", lambda: services.list_transactions(session, category_id=1, owner_id=1)
+    yield "get_transaction_by_id", lambda: services.get_transaction_by_id(session, first_page[0].id, owner_id=1)
+    yield "analytics.load_series", lambda: analytics.load_series(session, [1, 2, 3])
+    yield "export_query(budget)", lambda: session.execute(export.export_query(1, budget_id=1, bounds=bounds))
+    yield "get_budget_summary", lambda: services.get_budget_summary(session, budget)
+    yield "list_anomalies", lambda: services.list_anomalies(session, owner_id=1)
+    yield "list_anomalies(cursor)", lambda: services.list_anomalies(session, owner_id=1, cursor=anomaly_cursor)
+    yield "anomalies.observe", lambda: observe_rolled_back(session, [
+        {"budget_id": budget_id, "category_id": category_id, "amount": 100.0}
+        for budget_id in (1, 2, 3) for category_id in (1, 2, 3)
+    ])
+    yield "get_budget_overview", lambda: services.get_budget_overview(session, owner_id=1)
+    yield "get_budget_balances(owner)", lambda: services.get_budget_balances(session, owner_id=1)
+    yield "get_budget_balances(budgets)", lambda: services.get_budget_balances(session, budget_ids=[1, 2, 3])
+    yield "get_data_versions", lambda: services.get_data_versions(
+        session, [services.budgets_version_key(1), *services.categories_version_keys(1)]
+    )
+
+
+# Owner-scoped calls whose statement count must not grow with the number of budgets.
+def constant_statement_calls(session: AsyncSession):
+    return {
+        "get_budget_overview": lambda: services.get_budget_overview(session, owner_id=1),
+        "get_budget_balances": lambda: services.get_budget_balances(session, owner_id=1),
+        "list_anomalies": lambda: services.list_anomalies(session, owner_id=1),
+    }
+
+
+async def observe_rolled_back(session: AsyncSession, values):
+    """Score and fold values into the stats like an insert would, then undo it."""
+    try:
+        await anomalies.observe(session, values)
+    finally:
+        await session.rollback()
+
+
+def _postgresql_problems(connection, statement, parameters, in_memory_sort: bool = False):
+    # Captured from asyncpg, whose placeholders are numbered (and not always
+    # in order); the sync engine's psycopg2 takes them in order as %s.
+    statement = statement.replace("%", "%%")
+    parameters = tuple(parameters[int(number) - 1] for number in ASYNCPG_PLACEHOLDER.findall(statement))
+    statement = ASYNCPG_PLACEHOLDER.sub("%s", statement)
+    plan = connection.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    problems = []
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node["Node Type"] == "Seq Scan" and node.get("Relation Name") in CHECKED_TABLES:
+            problems.append(f"Seq Scan on {node['Relation Name']}")
+        nodes.extend(node.get("Plans", []))
+    return problems
+
+
+def _sqlite_problems(connection, statement, parameters, in_memory_sort: bool = False):
+    rows = connection.exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    problems = []
+    for row in rows:
+        detail = row[-1]
+        match = SQLITE_FULL_SCAN.match(detail)
+        if match and match.group(1) in CHECKED_TABLES:
+            problems.append(detail)
+        elif "TEMP B-TREE FOR ORDER BY" in detail and not in_memory_sort:
+            problems.append(detail)
+    return problems
+
+
+async def check_plans(engine, session: AsyncSession):
+    """Run each service call, EXPLAIN the statements it issued and return failures.
+
+    Statements are captured from the async engine and explained on the sync
+    engine pointed at the same database.
+    """
+    explain = _postgresql_problems if engine.dialect.name == "postgresql" else _sqlite_problems
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT"):
+            captured.append((statement, parameters))
+
+    failures = []
+    async for name, call in service_calls(session):
+        captured.clear()
+        event.listen(session.bind.sync_engine, "before_cursor_execute", capture)
+        try:
+            await call()
+        finally:
+            event.remove(session.bind.sync_engine, "before_cursor_execute", capture)
+        with engine.connect() as connection:
+            for statement, parameters in captured:
+                problems = explain(connection, statement, parameters, in_memory_sort=name in IN_MEMORY_SORTS)
+                status = "FAIL" if problems else "ok"
+                print(f"[{status}] {name}: {' '.join(statement.split())[:120]}")
+                for problem in problems:
+                    print(f"       {problem}")
+                    failures.append((name, problem))
+    return failures
+
+
+async def count_statements(session: AsyncSession, call) -> int:
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(session.bind.sync_engine, "before_cursor_execute", capture)
+    try:
+        await call()
+    finally:
+        event.remove(session.bind.sync_engine, "before_cursor_execute", capture)
+    return len(statements)
+
+
+async def check_statement_counts(session: AsyncSession, extra_budgets: int = 20):
+    """Check that owner-scoped calls issue the same statements with extra_budgets more budgets."""
+    calls = constant_statement_calls(session)
+    before = {name: await count_statements(session, call) for name, call in calls.items()}
+    await session.execute(insert(Budget), [
+        {"name": f"Extra budget {i}", "amount": 1000.0, "owner_id": 1} for i in range(extra_budgets)
+    ])
+    await session.commit()
+    failures = []
+    for name, call in calls.items():
+        after = await count_statements(session, call)
+        status = "ok" if before[name] == after else "FAIL"
+        print(f"[{status}] {name}: {before[name]} statements, {after} with {extra_budgets} more budgets")
+        if before[name] != after:
+            failures.append((name, f"{before[name]} -> {after} statements"))
+    return failures
+
+
+async def run(engine, database_url):
+    async_engine = create_async_engine(async_url(database_url))
+    try:
+        async with AsyncSession(async_engine, expire_on_commit=False) as session:
+            await services.rebuild_rollups(session)
+            await anomalies.rebuild_stats(session)
+            with engine.begin() as connection:
+                connection.execute(text("ANALYZE"))
+            failures = await check_plans(engine, session)
+            return failures + await check_statement_counts(session)
+    finally:
+        await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that service queries use indexes.")
+    parser.add_argument("--database-url", required=True, help="Scratch database to seed and inspect.")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--budgets-per-user", type=int, default=5)
+    parser.add_argument("--transactions-per-budget", type=int, default=100)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    with Session(bind=engine) as session:
+        seed(session, args.users, args.budgets_per_user, args.transactions_per_budget)
+    failures = asyncio.run(run(engine, args.database_url))
+
+    if failures:
+        print(f"{len(failures)} query plan regression(s) found.")
+        sys.exit(1)
+    print("All service queries use indexes.")
+
+
+if __name__ == "__main__":
+    main()
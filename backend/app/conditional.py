@@ -0,0 +1,63 @@
+# app/conditional.py
+
+import hashlib
+import os
+from fastapi import Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.cache import TTLCache
+from app.metrics import Counter
+from app.services import get_data_versions
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "300"))
+
+# Maps (user, path, query, etag) to an encoded response body. Entries never
+# go stale: a write bumps the version and with it the ETag in the key.
+response_cache = TTLCache(maxsize=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL_SECONDS)
+
+CONDITIONAL_RESPONSES = Counter(
+    "conditional_responses_total", "Versioned list responses by outcome.", ("route", "result")
+)
+
+
+def make_etag(user_id: int, request: Request, versions) -> str:
+    digest = hashlib.blake2b(digest_size=12)
+    digest.update(f"{user_id}|{request.url.path}|{request.url.query}|{versions}".encode())
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = {tag.strip() for tag in if_none_match.split(",")}
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+async def conditional_response(request: Request, db: AsyncSession, user_id: int, version_keys, build, versions=None):
+    """Answer a list request from its data versions before running the list query.
+
+    Returns 304 when If-None-Match carries the current ETag, a cached body when
+    one exists for this version, and otherwise awaits build() (which returns a
+    Response) and caches its body. Callers that already know the versions of
+    version_keys pass them to skip the lookup.
+    """
+    route = request.scope["route"].path
+    if versions is None:
+        versions = await get_data_versions(db, version_keys)
+    etag = make_etag(user_id, request, versions)
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        CONDITIONAL_RESPONSES.inc(route=route, result="not_modified")
+        return Response(status_code=304, headers=headers)
+
+    key = (user_id, request.url.path, request.url.query, etag)
+    cached = response_cache.get(key)
+    if cached is None:
+        CONDITIONAL_RESPONSES.inc(route=route, result="miss")
+        response = await build()
+        cached = (response.body, response.media_type)
+        response_cache.set(key, cached)
+    else:
+        CONDITIONAL_RESPONSES.inc(route=route, result="hit")
+    body, media_type = cached
+    return Response(body, media_type=media_type, headers=headers)
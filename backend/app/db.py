@@ -1,24 +1,362 @@
-from sqlalchemy import create_engine
+from sqlalchemy import and_, create_engine, event, or_, text, tuple_
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import as_declarative
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import StaticPool
+from starlette.requests import Request
+import asyncio
+import contextlib
+import itertools
+import logging
 import os
 from dotenv import load_dotenv
+from app.cache import TTLCache
+from app.metrics import Counter, TimedAsyncQueuePool, TimedQueuePool, instrument_engine
 
 load_dotenv()
 
-DATABASE_URL = os.getenv("DATABASE_URL")
+logger = logging.getLogger("app.db")
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Without a DATABASE_URL the app runs on a local SQLite file, which is fine
+# for a single node. "sqlite://" is an in-memory database for tests: it lives
+# behind the async engine, which serves requests and report jobs (see
+# app.reports.ReportRunner), but the sync engine (SessionLocal and the
+# command-line tools) and replica engines open databases of their own.
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./cfo_assistant.db")
+# Comma-separated read replica URLs. Read-only sessions are spread over the
+# healthy ones; with none configured every session uses the primary.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# After a user commits, their reads stay on the primary for this long so they
+# see their own writes despite replication lag. Only on the worker process
+# that took the write, though (see recent_writers): run several workers
+# behind a load balancer that pins each user to one, or a read that lands on
+# another worker may miss the write until the replica catches up.
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+REPLICA_HEALTH_INTERVAL = float(os.getenv("REPLICA_HEALTH_INTERVAL", "10"))
+REPLICA_HEALTH_TIMEOUT = float(os.getenv("REPLICA_HEALTH_TIMEOUT", "2"))
+
+# Pool settings, shared by the sync and async engines.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# Connections opened at startup so the first requests don't pay for them.
+DB_POOL_PREWARM = int(os.getenv("DB_POOL_PREWARM", str(DB_POOL_SIZE)))
+# Create missing tables at startup; deployments managed by Alembic can turn this off.
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "true").lower() in ("1", "true", "yes")
+
+# Pragmas set on every SQLite connection. WAL lets readers run alongside the
+# writer, and with it synchronous=NORMAL only syncs at checkpoints. That is
+# still safe against corruption, but a power loss can drop the last commits.
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+# How long a writer waits for the database lock before "database is locked".
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+ASYNC_DRIVERS = {"postgresql": "postgresql+asyncpg", "sqlite": "sqlite+aiosqlite"}
+# Requests with these methods get a read-only session.
+READ_ONLY_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+SESSION_ROUTES = Counter("db_session_routes_total", "Statements by the engine they were routed to.", ("target",))
+
+
+def async_url(url):
+    """Swap the sync DBAPI driver in url for its asyncio counterpart."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend in ASYNC_DRIVERS and not url.get_dialect().is_async:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+    return url
+
+
+def is_memory_sqlite(url) -> bool:
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and (
+        url.database in (None, "", ":memory:") or url.query.get("mode") == "memory"
+    )
+
+
+def pool_options(url, is_async: bool = False) -> dict:
+    """Engine keyword arguments for the configured connection pool."""
+    if is_memory_sqlite(url):
+        # One shared connection, or every checkout would see its own empty
+        # database. Each engine still has a database of its own, so only
+        # the async engine's is the app's.
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    if make_url(url).get_backend_name() == "sqlite":
+        return {}
+    return {
+        "poolclass": TimedAsyncQueuePool if is_async else TimedQueuePool,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def sqlite_pragmas(engine):
+    """Set the SQLITE_* pragmas (and enforce foreign keys) on each new connection of a SQLite engine."""
+    if engine.dialect.name != "sqlite":
+        return engine
+    pragmas = [
+        f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+        "PRAGMA foreign_keys = ON",
+        f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}",
+    ]
+    if not is_memory_sqlite(engine.url):
+        pragmas += [f"PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}", f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}"]
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for pragma in pragmas:
+                cursor.execute(pragma)
+        finally:
+            cursor.close()
+
+    return engine
+
+
+# The application serves requests through the async engine. The sync engine
+# is kept for migrations and command-line tools. Both are built on first use
+# so importing the app never touches the database.
+_engines = {}
+
+
+def get_engine():
+    if "sync" not in _engines:
+        engine = sqlite_pragmas(create_engine(DATABASE_URL, **pool_options(DATABASE_URL)))
+        instrument_engine(engine)
+        _engines["sync"] = engine
+        _engines["sync_sessions"] = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    return _engines["sync"]
+
+
+def _create_async_engine(url):
+    engine = create_async_engine(async_url(url), **pool_options(url, is_async=True))
+    sqlite_pragmas(engine.sync_engine)
+    instrument_engine(engine.sync_engine)
+    return engine
+
+
+def get_async_engine():
+    if "async" not in _engines:
+        engine = _create_async_engine(DATABASE_URL)
+        _engines["async"] = engine
+        _engines["async_sessions"] = async_sessionmaker(
+            engine, sync_session_class=RoutingSession, autoflush=False, expire_on_commit=False
+        )
+    return _engines["async"]
+
+
+class ReplicaSet:
+    """Round-robin over the replica engines that passed their last health check."""
+
+    def __init__(self, engines):
+        self.engines = list(engines)
+        self.healthy = [True] * len(self.engines)
+        self._counter = itertools.count()
+        self._task = None
+
+    def choose(self):
+        """Return the next healthy replica engine, or None to use the primary."""
+        for _ in range(len(self.engines)):
+            index = next(self._counter) % len(self.engines)
+            if self.healthy[index]:
+                return self.engines[index]
+        return None
+
+    async def _probe(self, engine) -> bool:
+        try:
+            async with engine.connect() as connection:
+                await asyncio.wait_for(connection.execute(text("SELECT 1")), REPLICA_HEALTH_TIMEOUT)
+            return True
+        except Exception as exc:
+            logger.warning("Replica %s failed its health check: %s", engine.url.render_as_string(), exc)
+            return False
+
+    async def check(self):
+        self.healthy = list(await asyncio.gather(*(self._probe(engine) for engine in self.engines)))
+
+    async def _run(self):
+        while True:
+            await self.check()
+            await asyncio.sleep(REPLICA_HEALTH_INTERVAL)
+
+    def start(self):
+        if self.engines and self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._task
+            self._task = None
+
+    def stats(self) -> dict:
+        healthy = sum(self.healthy)
+        return {"healthy": healthy, "unhealthy": len(self.engines) - healthy}
+
+
+def get_replica_set() -> ReplicaSet:
+    if "replicas" not in _engines:
+        _engines["replicas"] = ReplicaSet(_create_async_engine(url) for url in DATABASE_REPLICA_URLS)
+    return _engines["replicas"]
+
+
+# Principals (user ids) that committed within the last REPLICA_STICKY_SECONDS.
+# Per process: other workers don't hear about the write.
+recent_writers = TTLCache(maxsize=100000, ttl=REPLICA_STICKY_SECONDS)
+
+
+class RoutingSession(Session):
+    """Session that sends read-only work to a replica.
+
+    session.info carries the intent: "read_only" is set when the session is
+    opened and "principal" once the caller is known. Flushes, read-write
+    sessions and principals that wrote recently always use the primary. A
+    session keeps the replica it picked first.
+    """
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        primary = get_async_engine().sync_engine
+        if not self.info.get("read_only") or self._flushing:
+            SESSION_ROUTES.inc(target="primary")
+            return primary
+        principal = self.info.get("principal")
+        if principal is not None and recent_writers.get(principal):
+            SESSION_ROUTES.inc(target="primary_sticky")
+            return primary
+        if "replica" not in self.info:
+            self.info["replica"] = get_replica_set().choose()
+        replica = self.info["replica"]
+        if replica is None:
+            SESSION_ROUTES.inc(target="primary")
+            return primary
+        SESSION_ROUTES.inc(target="replica")
+        return replica.sync_engine
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _remember_writer(session):
+    principal = session.info.get("principal")
+    if principal is not None and not session.info.get("read_only"):
+        recent_writers.set(principal, True)
+
+
+def get_sessionmaker():
+    get_engine()
+    return _engines["sync_sessions"]
+
+
+def get_async_sessionmaker():
+    get_async_engine()
+    return _engines["async_sessions"]
+
+
+def __getattr__(name):
+    # Lazy module attributes for callers that import the engines by name.
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_sessionmaker()
+    if name == "async_engine":
+        return get_async_engine()
+    if name == "AsyncSessionLocal":
+        return get_async_sessionmaker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def dialect_insert(db, model):
+    """Return an INSERT supporting ON CONFLICT for the session's dialect, or None."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(model)
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(model)
+    return None
+
+
+def tuple_in(db, columns, keys):
+    """Return a (columns) IN keys clause that can search a composite index on the session's dialect.
+
+    SQLite scans the whole table for a row-value IN with more than one row,
+    so there it becomes an OR of per-key equalities instead.
+    """
+    if db.get_bind().dialect.name == "sqlite":
+        return or_(*(and_(*(column == value for column, value in zip(columns, key))) for key in keys))
+    return tuple_(*columns).in_(keys)
+
+
+async def create_tables():
+    async with get_async_engine().begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+
+
+async def prewarm_pool(count: int = DB_POOL_PREWARM) -> int:
+    """Warm the primary and every replica pool; returns the connections opened.
+
+    A replica that can't be reached is logged and left to the health check.
+    """
+    warmed = await _prewarm_engine(get_async_engine(), count)
+    replicas = get_replica_set().engines
+    for engine, result in zip(replicas, await asyncio.gather(
+        *(_prewarm_engine(engine, count) for engine in replicas), return_exceptions=True
+    )):
+        if isinstance(result, Exception):
+            logger.warning("Could not pre-warm replica %s: %s", engine.url.render_as_string(), result)
+        else:
+            warmed += result
+    return warmed
+
+
+async def _prewarm_engine(engine, count: int) -> int:
+    """Open up to count pooled connections concurrently and return them to the pool."""
+    if hasattr(engine.pool, "size"):
+        count = min(count, engine.pool.size())
+    if count <= 0:
+        return 0
+    connections = await asyncio.gather(*(engine.connect().start() for _ in range(count)))
+    try:
+        await asyncio.gather(*(connection.execute(text("SELECT 1")) for connection in connections))
+    finally:
+        await asyncio.gather(*(connection.close() for connection in connections))
+    return count
+
+
+async def check_connection():
+    async with get_async_engine().connect() as connection:
+        await connection.execute(text("SELECT 1"))
+
+
+async def dispose_engines():
+    if "replicas" in _engines:
+        await _engines["replicas"].stop()
+        for replica in _engines["replicas"].engines:
+            await replica.dispose()
+    if "async" in _engines:
+        await _engines["async"].dispose()
+    if "sync" in _engines:
+        _engines["sync"].dispose()
+    _engines.clear()
 
 @as_declarative()
 class Base:
     pass
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def open_session(read_only: bool = False, principal: int = None):
+    """Open an AsyncSession with the given intent; read-only sessions may use a replica."""
+    return get_async_sessionmaker()(info={"read_only": read_only, "principal": principal})
 
+async def get_db(request: Request):
+    """Request-scoped session: read-only for GET/HEAD/OPTIONS, read-write otherwise."""
+    async with open_session(read_only=request.method in READ_ONLY_METHODS) as db:
+        yield db
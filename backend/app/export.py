@@ -0,0 +1,104 @@
+# app/export.py
+
+import csv
+import io
+import json
+import os
+import zlib
+from sqlalchemy import select
+from app.db import open_session
+from app.services import date_bounds_clause
+from app.models import Budget, Category, Transaction
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "5000"))
+# amount is in budget_currency; the entered_* columns are set for
+# transactions entered in another currency.
+EXPORT_COLUMNS = (
+    "id", "budget_id", "category_id", "category", "date", "amount", "budget_currency", "entered_currency", "entered_amount",
+)
+EXPORT_FORMATS = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+
+def export_query(owner_id: int, budget_id: int = None, date_from=None, date_to=None, bounds=None):
+    """Select plain columns (no ORM objects) for the owner's transactions.
+
+    bounds is their services.transaction_date_bounds range, looked up by the
+    caller: the query runs later on a session of its own.
+    """
+    query = (
+        select(
+            Transaction.id,
+            Transaction.budget_id,
+            Transaction.category_id,
+            Category.name,
+            Transaction.date,
+            Transaction.amount,
+            Budget.currency,
+            Transaction.currency,
+            Transaction.original_amount,
+        )
+        .join(Budget, Budget.id == Transaction.budget_id)
+        .outerjoin(Category, Category.id == Transaction.category_id)
+        .where(Budget.owner_id == owner_id, *date_bounds_clause(bounds))
+        .order_by(Transaction.budget_id, Transaction.date, Transaction.id)
+    )
+    if budget_id is not None:
+        query = query.where(Transaction.budget_id == budget_id)
+    if date_from is not None:
+        query = query.where(Transaction.date >= date_from)
+    if date_to is not None:
+        query = query.where(Transaction.date < date_to)
+    return query
+
+
+async def iter_batches(query, batch_size: int = EXPORT_BATCH_SIZE, principal: int = None):
+    """Yield lists of row tuples from a server-side cursor.
+
+    The generator owns a read-only session: request-scoped sessions are closed
+    before a streaming response body is sent.
+    """
+    async with open_session(read_only=True, principal=principal) as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for partition in result.partitions():
+            yield partition
+
+
+def _encode_csv(rows, header: bool = False) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow([
+            value.isoformat() if hasattr(value, "isoformat") else value
+            for value in row
+        ])
+    return buffer.getvalue().encode("utf-8")
+
+
+def _encode_ndjson(rows) -> bytes:
+    return "".join(
+        json.dumps(dict(zip(EXPORT_COLUMNS, row)), default=lambda value: value.isoformat()) + "\n"
+        for row in rows
+    ).encode("utf-8")
+
+
+async def stream_export(query, fmt: str = "csv", compress: bool = False, batch_size: int = EXPORT_BATCH_SIZE, principal: int = None):
+    """Encode batches as they arrive, optionally through a streaming gzip compressor.
+
+    The compressor is sync-flushed after every batch so clients see rows while
+    the query is still running.
+    """
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(chunk: bytes) -> bytes:
+        if compressor is None:
+            return chunk
+        return compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    if fmt == "csv":
+        yield encode(_encode_csv([], header=True))
+    async for rows in iter_batches(query, batch_size, principal):
+        yield encode(_encode_csv(rows) if fmt == "csv" else _encode_ndjson(rows))
+    if compressor is not None:
+        yield compressor.flush()
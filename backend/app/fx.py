@@ -0,0 +1,216 @@
+# app/fx.py
+#
+# Exchange rates for converting amounts between currencies as of a date.
+# Rates live in the fx_rates table and are loaded from a local CSV file with
+# a date,base,quote,rate header (rate = units of quote per unit of base):
+#
+#     python -m app.fx load rates.csv
+#
+# Each worker keeps every pair in memory as sorted day/rate arrays, so a
+# batch is converted with one binary search and one multiply per pair.
+
+import argparse
+import asyncio
+import csv
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import date
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from app.db import dialect_insert, open_session
+from app.models import DEFAULT_CURRENCY, FxRate
+
+# Pairs with no rate of their own are crossed through this currency.
+FX_PIVOT_CURRENCY = os.getenv("FX_PIVOT_CURRENCY", DEFAULT_CURRENCY)
+# How stale a worker's rates can get after a load from another process.
+FX_RATES_TTL_SECONDS = float(os.getenv("FX_RATES_TTL_SECONDS", "300"))
+FX_LOAD_BATCH_SIZE = 5000
+CURRENCY_CODE = re.compile(r"^[A-Z]{3}$")
+
+
+def as_days(values) -> np.ndarray:
+    return np.asarray(values, dtype="datetime64[D]")
+
+
+class RateIndex:
+    """The rates of one currency pair, sorted by the day they take effect."""
+
+    __slots__ = ("days", "rates")
+
+    def __init__(self, days, rates):
+        days = as_days(days)
+        order = np.argsort(days, kind="stable")
+        self.days = days[order]
+        self.rates = np.asarray(rates, dtype=np.float64)[order]
+
+    def __len__(self):
+        return len(self.days)
+
+    def at(self, days) -> np.ndarray:
+        """The rate in effect on each of days (the latest on or before it); NaN before the first."""
+        positions = np.searchsorted(self.days, as_days(days), side="right") - 1
+        return np.where(positions >= 0, self.rates[np.maximum(positions, 0)], np.nan)
+
+
+class RateTable:
+    """Every loaded pair, answering as-of lookups directly, inverted or through the pivot currency."""
+
+    def __init__(self, indexes):
+        self.indexes = indexes
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build from (base, quote, date, rate) rows in any order."""
+        pairs = defaultdict(lambda: ([], []))
+        for base, quote, day, rate in rows:
+            days, rates = pairs[base, quote]
+            days.append(day)
+            rates.append(rate)
+        return cls({pair: RateIndex(days, rates) for pair, (days, rates) in pairs.items()})
+
+    def rates(self, source: str, target: str, days) -> np.ndarray:
+        """Units of target per unit of source as of each of days; NaN where no rate is known."""
+        days = as_days(days)
+        if source == target:
+            return np.ones(len(days))
+        if (source, target) in self.indexes:
+            return self.indexes[source, target].at(days)
+        if (target, source) in self.indexes:
+            return 1.0 / self.indexes[target, source].at(days)
+        if FX_PIVOT_CURRENCY not in (source, target):
+            return self.rates(source, FX_PIVOT_CURRENCY, days) * self.rates(FX_PIVOT_CURRENCY, target, days)
+        return np.full(len(days), np.nan)
+
+    def convert(self, amounts, days, sources, targets) -> np.ndarray:
+        """Convert amounts[i] from sources[i] to targets[i] as of days[i]; NaN where no rate is known.
+
+        sources and targets may also be single currency codes. Rows are
+        grouped by pair, so each distinct pair costs one vectorized lookup.
+        """
+        amounts = np.asarray(amounts, dtype=np.float64)
+        days = as_days(days)
+        pairs = np.char.add(
+            np.broadcast_to(np.asarray(sources, dtype="U3"), amounts.shape),
+            np.broadcast_to(np.asarray(targets, dtype="U3"), amounts.shape),
+        )
+        converted = np.empty_like(amounts)
+        for pair in np.unique(pairs):
+            rows = pairs == pair
+            converted[rows] = amounts[rows] * self.rates(pair[:3], pair[3:], days[rows])
+        return converted
+
+    def stats(self) -> dict:
+        return {"pairs": len(self.indexes), "rates": sum(len(index) for index in self.indexes.values())}
+
+
+async def load_table(db: AsyncSession) -> RateTable:
+    """Read every rate into a new RateTable."""
+    return RateTable.from_rows(await db.execute(select(FxRate.base, FxRate.quote, FxRate.date, FxRate.rate)))
+
+
+class RateCache:
+    """Per-worker RateTable, loaded from the primary on first use and every FX_RATES_TTL_SECONDS after."""
+
+    def __init__(self, ttl: float = FX_RATES_TTL_SECONDS):
+        self.ttl = ttl
+        self.table = None
+        self.loaded_at = 0.0
+        self.loads = 0
+        self._lock = asyncio.Lock()
+
+    def fresh(self) -> bool:
+        return self.table is not None and time.monotonic() - self.loaded_at < self.ttl
+
+    async def get(self) -> RateTable:
+        if self.fresh():
+            return self.table
+        async with self._lock:
+            if not self.fresh():
+                self.table, self.loaded_at = await self._load(), time.monotonic()
+                self.loads += 1
+            return self.table
+
+    async def _load(self) -> RateTable:
+        async with open_session() as db:
+            return await load_table(db)
+
+    def invalidate(self):
+        self.table = None
+
+    def stats(self) -> dict:
+        table = self.table
+        return {**(table.stats() if table else {"pairs": 0, "rates": 0}), "loads": self.loads}
+
+
+rates = RateCache()
+
+
+def read_csv(path: str):
+    """Yield fx_rates rows from a date,base,quote,rate CSV file, validating every line."""
+    with open(path, newline="") as handle:
+        for line, row in enumerate(csv.DictReader(handle), start=2):
+            try:
+                base, quote = row["base"].strip().upper(), row["quote"].strip().upper()
+                value = {"base": base, "quote": quote, "date": date.fromisoformat(row["date"].strip()),
+                         "rate": float(row["rate"])}
+            except (KeyError, AttributeError, ValueError) as exc:
+                raise ValueError(f"{path}:{line}: {exc}") from exc
+            if not (CURRENCY_CODE.match(base) and CURRENCY_CODE.match(quote)) or base == quote:
+                raise ValueError(f"{path}:{line}: invalid currency pair {base}/{quote}")
+            if not value["rate"] > 0:
+                raise ValueError(f"{path}:{line}: rate must be positive")
+            yield value
+
+
+def load_rates(session: Session, rows) -> int:
+    """Insert or replace rates in batches; returns the number of rows written."""
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= FX_LOAD_BATCH_SIZE:
+            written += _write_batch(session, batch)
+            batch = []
+    if batch:
+        written += _write_batch(session, batch)
+    return written
+
+
+def _write_batch(session: Session, batch) -> int:
+    stmt = dialect_insert(session, FxRate)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["base", "quote", "date"], set_={"rate": stmt.excluded.rate}
+        )
+        session.execute(stmt, batch)
+    else:
+        for row in batch:
+            session.merge(FxRate(**row))
+    return len(batch)
+
+
+def main():
+    from app.db import engine
+
+    parser = argparse.ArgumentParser(description="Manage the exchange rates used for currency conversion.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    load = commands.add_parser("load", help="Load rates from a date,base,quote,rate CSV file.")
+    load.add_argument("path")
+    args = parser.parse_args()
+
+    with Session(bind=engine) as session:
+        try:
+            count = load_rates(session, read_csv(args.path))
+            session.commit()
+        except ValueError as exc:
+            session.rollback()
+            parser.exit(1, f"Error loading rates: {exc}\n")
+    print(f"Loaded {count} rates from {args.path}. Workers pick them up within {FX_RATES_TTL_SECONDS:.0f} s.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,92 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app.routes import users, budgets, transactions
-from app.db import Base, engine
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app.routes import users, budgets, transactions, categories, reports as report_routes
+from app import admission, catalog, conditional, db, fx, metrics, partitions, passwords, pubsub, reports, services, write_behind
+import logging
 import sys
 import os
+import time
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+logger = logging.getLogger("app.startup")
 
-# Initialize database tables
-Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    started = time.perf_counter()
+    if db.DB_CREATE_ALL:
+        await db.create_tables()
+    await partitions.ensure_partitions_at_startup()
+    warmed = await db.prewarm_pool()
+    db.get_replica_set().start()
+    await pubsub.broker.start()
+    await catalog.catalog.start()
+    if write_behind.TRANSACTION_WRITE_MODE == "batched":
+        await write_behind.writer.start()
+    reports.runner.start()
+    app.state.startup_seconds = time.perf_counter() - started
+    app.state.ready = True
+    logger.info("Startup finished in %.3f s (%d pooled connections warmed)", app.state.startup_seconds, warmed)
+    yield
+    app.state.ready = False
+    await write_behind.writer.stop()
+    reports.runner.shutdown()
+    await catalog.catalog.stop()
+    await pubsub.broker.stop()
+    passwords.shutdown()
+    await db.dispose_engines()
+
+app = FastAPI(lifespan=lifespan)
+app.state.ready = False
+# Admission sits inside the metrics middleware so shed requests are still counted.
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.Gauge("app_startup_seconds", "Time spent in the startup handler (table creation and pool pre-warm).",
+              lambda: getattr(app.state, "startup_seconds", None))
+metrics.Gauge("db_pool_checked_out", "Connections currently checked out of the pool.",
+              lambda: db.get_async_engine().pool.checkedout() if hasattr(db.get_async_engine().pool, "checkedout") else None)
+metrics.Gauge("db_replicas", "Read replicas by health check state.",
+              lambda: db.get_replica_set().stats(), labelname="state")
+metrics.Gauge("auth_principal_cache", "Principal cache size and hit/miss/eviction counts.",
+              services.principal_cache.stats, labelname="stat")
+metrics.Gauge("response_cache", "Versioned list response cache size and hit/miss/eviction counts.",
+              conditional.response_cache.stats, labelname="stat")
+metrics.Gauge("category_catalog", "Categories in this worker's catalog and how often it was loaded.",
+              catalog.catalog.stats, labelname="stat")
+metrics.Gauge("fx_rates", "Currency pairs and rates in this worker's rate table and how often it was loaded.",
+              fx.rates.stats, labelname="stat")
+metrics.Gauge("pubsub_subscribers", "Open pub/sub subscriptions in this worker.", pubsub.broker.subscriber_count)
+metrics.Gauge("admission_slots", "Admission in-flight requests, queued requests and the in-flight limit.",
+              admission.limiter.stats, labelname="state")
+metrics.Gauge("report_jobs", "Report worker threads and jobs submitted but not finished in this worker.",
+              reports.runner.stats, labelname="stat")
+metrics.Gauge("password_hash_pool", "bcrypt process pool usage.", passwords.stats, labelname="stat")
 
 # Include routers
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(budgets.router, prefix="/budgets", tags=["budgets"])
 app.include_router(transactions.router, prefix="/transactions", tags=["transactions"])
+app.include_router(categories.router, prefix="/categories", tags=["categories"])
+app.include_router(report_routes.router, prefix="/reports", tags=["reports"])
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/ready", include_in_schema=False)
+async def ready():
+    """Readiness probe: 200 once startup has finished and the database answers."""
+    if not app.state.ready:
+        return JSONResponse({"status": "starting"}, status_code=503)
+    try:
+        await db.check_connection()
+    except Exception as exc:
+        logger.warning("Readiness check failed: %s", exc)
+        return JSONResponse({"status": "unavailable"}, status_code=503)
+    return {"status": "ready"}
 
 @app.get("/")
 def root():
@@ -0,0 +1,262 @@
+# app/metrics.py
+
+import contextvars
+import logging
+import os
+import threading
+import time
+from sqlalchemy import event
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# Requests issuing more statements than this are counted (and logged) as
+# likely N+1 query patterns.
+METRICS_QUERY_THRESHOLD = int(os.getenv("METRICS_QUERY_THRESHOLD", "25"))
+# Requests slower than this are logged with the SQL they issued; 0 disables.
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "0"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100)
+
+logger = logging.getLogger("app.metrics")
+
+_registry = []
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                for bound, bucket_count in zip(self.buckets, counts):
+                    labels = _format_labels(self.labelnames, key, [("le", bound)])
+                    lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+                labels = _format_labels(self.labelnames, key, [("le", "+Inf")])
+                lines.append(f"{self.name}_bucket{labels} {count}")
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f"{self.name}_sum{labels} {total}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge:
+    """A gauge whose values are read from a callback at scrape time.
+
+    The callback returns either a number or a {label_value: number} dict.
+    """
+
+    def __init__(self, name: str, help: str, callback, labelname: str = None):
+        self.name = name
+        self.help = help
+        self.callback = callback
+        self.labelname = labelname
+        _registry.append(self)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.callback()
+        except Exception:
+            logger.exception("Gauge %s failed", self.name)
+            return lines
+        if isinstance(values, dict):
+            for label, value in sorted(values.items()):
+                lines.append(f"{self.name}{_format_labels((self.labelname,), (label,))} {value}")
+        elif values is not None:
+            lines.append(f"{self.name} {values}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route.", ("method", "route", "status")
+)
+REQUEST_QUERIES = Histogram(
+    "http_request_db_queries", "SQL statements issued per request.", ("method", "route"),
+    buckets=QUERY_COUNT_BUCKETS,
+)
+REQUEST_DB_TIME = Histogram(
+    "http_request_db_seconds", "Time spent in SQL per request.", ("method", "route")
+)
+QUERY_THRESHOLD_EXCEEDED = Counter(
+    "http_request_query_threshold_exceeded_total",
+    "Requests that issued more statements than METRICS_QUERY_THRESHOLD (likely N+1).",
+    ("method", "route"),
+)
+DB_STATEMENT_LATENCY = Histogram("db_statement_duration_seconds", "Latency of individual SQL statements.")
+POOL_CHECKOUT_WAIT = Histogram("db_pool_checkout_seconds", "Time spent waiting for a pooled connection.")
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "pool_wait_seconds", "statements")
+
+    def __init__(self, capture_statements: bool = False):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.pool_wait_seconds = 0.0
+        self.statements = [] if capture_statements else None
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_started"].pop()
+    DB_STATEMENT_LATENCY.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.queries += 1
+        stats.db_seconds += elapsed
+        if stats.statements is not None:
+            stats.statements.append((round(elapsed * 1000, 2), statement))
+
+
+def _handle_error(context):
+    # after_cursor_execute doesn't fire for a failed statement; drop its start
+    # time so the connection's stack doesn't grow with every error.
+    started = context.connection.info.get("query_started") if context.connection is not None else None
+    if started:
+        started.pop()
+
+
+def instrument_engine(engine):
+    """Time every statement run through engine (a sync Engine or AsyncEngine.sync_engine)."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+def _record_pool_wait(elapsed: float):
+    POOL_CHECKOUT_WAIT.observe(elapsed)
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.pool_wait_seconds += elapsed
+
+
+class _TimedCheckout:
+    # Pool events only fire once a connection has been handed out, so the wait
+    # is measured around the pool's own checkout routine.
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            _record_pool_wait(time.perf_counter() - started)
+
+
+class TimedQueuePool(_TimedCheckout, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(_TimedCheckout, AsyncAdaptedQueuePool):
+    pass
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency and SQL activity per route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(capture_statements=SLOW_REQUEST_MS > 0)
+        token = _request_stats.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _request_stats.reset(token)
+            route = scope.get("route")
+            path = getattr(route, "path", "unmatched")
+            method = scope["method"]
+            REQUEST_LATENCY.observe(elapsed, method=method, route=path, status=status_code)
+            REQUEST_QUERIES.observe(stats.queries, method=method, route=path)
+            REQUEST_DB_TIME.observe(stats.db_seconds, method=method, route=path)
+            if stats.queries > METRICS_QUERY_THRESHOLD:
+                QUERY_THRESHOLD_EXCEEDED.inc(method=method, route=path)
+                logger.warning(
+                    "%s %s issued %d SQL statements (threshold %d)",
+                    method, path, stats.queries, METRICS_QUERY_THRESHOLD,
+                )
+            if SLOW_REQUEST_MS and elapsed * 1000 > SLOW_REQUEST_MS:
+                logger.warning(
+                    "Slow request %s %s: %.1f ms, %d statements, %.1f ms in SQL, %.1f ms pool wait\n%s",
+                    method, scope["path"], elapsed * 1000, stats.queries,
+                    stats.db_seconds * 1000, stats.pool_wait_seconds * 1000,
+                    "\n".join(f"  [{ms} ms] {' '.join(sql.split())}" for ms, sql in stats.statements),
+                )
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
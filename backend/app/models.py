@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Boolean, Index, LargeBinary, false, text
 from sqlalchemy.orm import relationship
 from .db import Base
 from datetime import datetime
@@ -11,27 +11,52 @@ class User(Base):
     budgets = relationship("Budget", back_populates="owner")
     categories = relationship("Category", back_populates="user", cascade="all, delete")
 
+# Currency of budgets created without one, and of every budget that predates currencies.
+DEFAULT_CURRENCY = "USD"
+
 class Budget(Base):
     __tablename__ = "budgets"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     amount = Column(Float, nullable=False)
-    owner_id = Column(Integer, ForeignKey("users.id"))
+    currency = Column(String(3), nullable=False, default=DEFAULT_CURRENCY, server_default=DEFAULT_CURRENCY)
+    owner_id = Column(Integer, ForeignKey("users.id"), index=True)
     owner = relationship("User", back_populates="budgets")
     transactions = relationship("Transaction", back_populates="budget")
 
 class Transaction(Base):
     __tablename__ = "transactions"
     id = Column(Integer, primary_key=True, index=True)
+    # Always in the budget's currency, so rollups and stats can sum it as is.
     amount = Column(Float, nullable=False)
+    # Set when the transaction was entered in another currency: what was
+    # entered, converted into amount at the rate as of date (see app.fx).
+    currency = Column(String(3))
+    original_amount = Column(Float)
     category_id = Column(Integer, ForeignKey("categories.id"))
     category = relationship("Category")
-    date = Column(DateTime, default=datetime.utcnow)
+    # On PostgreSQL the table is range-partitioned by month on date and its
+    # primary key is (id, date); see app.partitions.
+    date = Column(DateTime, nullable=False, default=datetime.utcnow)
     budget_id = Column(Integer, ForeignKey("budgets.id"))
+    # Scored against the owner's history for the category when written (see app.anomalies).
+    anomaly_score = Column(Float)
+    is_anomaly = Column(Boolean, nullable=False, default=False, server_default=false())
     
     category = relationship("Category")
     budget = relationship("Budget", back_populates="transactions")
 
+    __table_args__ = (
+        # Keyset pagination: WHERE budget_id/category_id = ? ORDER BY date DESC, id DESC
+        Index("ix_transactions_budget_id_date_id", "budget_id", "date", "id"),
+        Index("ix_transactions_category_id_date_id", "category_id", "date", "id"),
+        # Flagged transactions only, so listing anomalies never scans the table.
+        Index(
+            "ix_transactions_anomalies", "budget_id", "date", "id",
+            postgresql_where=text("is_anomaly"), sqlite_where=text("is_anomaly"),
+        ),
+    )
+
 class Category(Base):
     __tablename__ = "categories"
     id = Column(Integer, primary_key=True, index=True)
@@ -39,3 +64,76 @@ class Category(Base):
     is_custom = Column(Boolean, default=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
     user = relationship("User", back_populates="categories")
+
+    __table_args__ = (
+        Index("ix_categories_user_id_name", "user_id", "name"),
+    )
+
+# Running spend totals per (budget, month, category). category_id is 0 for
+# uncategorised transactions so the composite primary key can be the upsert target.
+class SpendRollup(Base):
+    __tablename__ = "spend_rollups"
+    budget_id = Column(Integer, ForeignKey("budgets.id"), primary_key=True)
+    period = Column(Date, primary_key=True)
+    category_id = Column(Integer, primary_key=True, default=0)
+    total = Column(Float, nullable=False, default=0.0)
+    count = Column(Integer, nullable=False, default=0)
+
+# Counters bumped in the same transaction as every write to a user's lists;
+# list endpoints derive their ETags from them. scope is "budgets" or
+# "categories" (key = user id, 0 for the global categories) or
+# "transactions" (key = budget id).
+class DataVersion(Base):
+    __tablename__ = "data_versions"
+    scope = Column(String, primary_key=True)
+    key = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+
+# Streaming spend statistics per (user, category): Welford count/mean/M2 and
+# a decayed log-bucket histogram packed as float32 (see app.anomalies).
+class CategoryStats(Base):
+    __tablename__ = "category_stats"
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    category_id = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+    sketch = Column(LargeBinary)
+
+# Background report jobs (see app.reports). At most one queued or running job
+# per owner and parameter set; identical submissions join it.
+class ReportJob(Base):
+    __tablename__ = "report_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    kind = Column(String, nullable=False)
+    params = Column(String, nullable=False)
+    params_hash = Column(String, nullable=False)
+    state = Column(String, nullable=False, default="queued")
+    progress = Column(Float, nullable=False, default=0.0)
+    result_path = Column(String)
+    error = Column(String)
+    # The process running the job (app.reports.WORKER_ID); it refreshes
+    # updated_at while the job runs.
+    worker = Column(String)
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index(
+            "ix_report_jobs_active", "owner_id", "params_hash", unique=True,
+            postgresql_where=text("state IN ('queued', 'running')"),
+            sqlite_where=text("state IN ('queued', 'running')"),
+        ),
+    )
+
+# Exchange rates: one base unit costs rate units of quote from date on, until
+# the next row for the pair (see app.fx).
+class FxRate(Base):
+    __tablename__ = "fx_rates"
+    base = Column(String(3), primary_key=True)
+    quote = Column(String(3), primary_key=True)
+    date = Column(Date, primary_key=True)
+    rate = Column(Float, nullable=False)
@@ -0,0 +1,238 @@
+# app/partitions.py
+#
+# Maintenance for the monthly range partitions of `transactions` on
+# PostgreSQL (created by the c9d5e1f7a3b8 migration). Run it from cron, e.g.
+# nightly:
+#
+#     python -m app.partitions ensure --months-ahead 3
+#     python -m app.partitions archive --before 2019-01-01 [--drop]
+#
+# Workers also call ensure at startup. On other databases, or before the
+# migration has run, every command is a no-op.
+
+import argparse
+import logging
+import os
+import re
+from datetime import date, datetime
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from app.anomalies import load_sketch, remove
+from app.models import CategoryStats
+from app.services import data_version_statement, transactions_version_key
+
+logger = logging.getLogger("app.partitions")
+
+# Months of partitions kept ready beyond the current one; negative skips the startup run.
+TRANSACTION_PARTITION_MONTHS_AHEAD = int(os.getenv("TRANSACTION_PARTITION_MONTHS_AHEAD", "3"))
+PARENT_TABLE = "transactions"
+DEFAULT_PARTITION = "transactions_default"
+PARTITION_NAME = re.compile(r"^transactions_p(\d{4})_(\d{2})$")
+# Serialises concurrent ensure/archive runs (several workers starting at once).
+ADVISORY_LOCK_KEY = 0x7472616E73  # "trans"
+
+
+def month_start(value) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(value: date, months: int) -> date:
+    index = value.year * 12 + value.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(period: date) -> str:
+    return f"{PARENT_TABLE}_p{period.year:04d}_{period.month:02d}"
+
+
+def is_partitioned(connection: Connection) -> bool:
+    if connection.dialect.name != "postgresql":
+        return False
+    return bool(connection.execute(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = :name AND c.relnamespace = to_regnamespace(current_schema())::oid"
+    ), {"name": PARENT_TABLE}).scalar())
+
+
+def list_partitions(connection: Connection):
+    """Return [(period, name)] for the monthly partitions attached to transactions, oldest first."""
+    names = connection.execute(text(
+        "SELECT c.relname FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+        "WHERE p.relname = :name AND p.relnamespace = to_regnamespace(current_schema())::oid"
+    ), {"name": PARENT_TABLE}).scalars()
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    return sorted(partitions)
+
+
+def create_partition_sql(period: date) -> str:
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(period)} PARTITION OF {PARENT_TABLE} "
+        f"FOR VALUES FROM ('{period.isoformat()}') TO ('{add_months(period, 1).isoformat()}')"
+    )
+
+
+def default_partition_has_rows(connection: Connection, period: date) -> bool:
+    """True if the DEFAULT partition holds rows for the month starting at period."""
+    if connection.execute(text("SELECT to_regclass(:name)"), {"name": DEFAULT_PARTITION}).scalar() is None:
+        return False
+    return bool(connection.execute(text(
+        f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end)"
+    ), {"start": period, "end": add_months(period, 1)}).scalar())
+
+
+def create_partition_from_default(connection: Connection, period: date) -> int:
+    """Create the partition for period and move its rows out of DEFAULT; returns the number moved.
+
+    PostgreSQL refuses to create a partition whose range has rows in the
+    DEFAULT partition, so DEFAULT is detached for the move and reattached
+    after it. The parent stays locked against writes until the caller commits.
+    """
+    connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {DEFAULT_PARTITION}"))
+    connection.execute(text(create_partition_sql(period)))
+    moved = connection.execute(text(
+        f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} WHERE date >= :start AND date < :end RETURNING *) "
+        f"INSERT INTO {PARENT_TABLE} SELECT * FROM moved"
+    ), {"start": period, "end": add_months(period, 1)}).rowcount
+    connection.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT"))
+    return moved
+
+
+def ensure_partitions(connection: Connection, months_ahead: int = TRANSACTION_PARTITION_MONTHS_AHEAD, today=None):
+    """Create the partitions for this month and the next months_ahead; returns the names created.
+
+    Creating partitions ahead of time keeps the DEFAULT partition empty, so
+    attaching a new month never has to scan it. When DEFAULT does hold rows
+    for a missing month (e.g. ensure didn't run for a while), they are moved
+    into the new partition.
+    """
+    if not is_partitioned(connection):
+        return []
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+    existing = {name for _, name in list_partitions(connection)}
+    current = month_start(today or datetime.utcnow())
+    created = []
+    for offset in range(months_ahead + 1):
+        period = add_months(current, offset)
+        if partition_name(period) in existing:
+            continue
+        if default_partition_has_rows(connection, period):
+            moved = create_partition_from_default(connection, period)
+            logger.warning("Moved %d rows from %s into %s", moved, DEFAULT_PARTITION, partition_name(period))
+        else:
+            connection.execute(text(create_partition_sql(period)))
+        created.append(partition_name(period))
+    return created
+
+
+def forget_partition(session: Session, name: str):
+    """Take a partition's rows out of the anomaly stats and bump their budgets' transaction versions.
+
+    Runs in the caller's transaction, before the partition is detached, so
+    cached transaction lists and the stats change together with the table.
+    As with forget(), the histogram part of the stats is approximate.
+    """
+    budget_ids = session.scalars(text(f"SELECT DISTINCT budget_id FROM {name} WHERE budget_id IS NOT NULL")).all()
+    if budget_ids:
+        session.execute(*data_version_statement(session, [transactions_version_key(budget_id) for budget_id in budget_ids]))
+
+    rows = f"FROM {name} t JOIN budgets b ON b.id = t.budget_id"
+    keys = [tuple(key) for key in session.execute(text(f"SELECT DISTINCT b.owner_id, COALESCE(t.category_id, 0) {rows}"))]
+    if not keys:
+        return
+    query = select(CategoryStats).where(tuple_(CategoryStats.user_id, CategoryStats.category_id).in_(sorted(keys)))
+    stats = {(row.user_id, row.category_id): row for row in session.scalars(query.with_for_update())}
+    sketches = {key: load_sketch(row.sketch) for key, row in stats.items()}
+    amounts = session.execute(
+        text(f"SELECT b.owner_id, COALESCE(t.category_id, 0), t.amount {rows}").execution_options(yield_per=10000)
+    )
+    for owner_id, category_id, amount in amounts:
+        key = (owner_id, category_id)
+        if key in stats:
+            remove(stats[key], sketches[key], amount)
+    for key, sketch in sketches.items():
+        stats[key].sketch = sketch.tobytes()
+    session.flush()
+
+
+def archive_partitions(connection: Connection, before, drop: bool = False):
+    """Detach every monthly partition that ends on or before `before`; returns their names.
+
+    Detached partitions are renamed archived_<name> and stay in the database
+    as plain tables to dump or drop later (or are dropped right away with
+    drop=True). Their rows leave the anomaly stats, and the transaction
+    lists of the budgets they belonged to get new versions, in the same
+    transaction.
+
+    Spend rollups are left alone, so budget summaries keep the archived
+    months until the rollups are rebuilt: rebuild_rollups recomputes them
+    from the transactions table and so drops every archived month.
+    """
+    if not is_partitioned(connection):
+        return []
+    connection.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+    archived = []
+    with Session(bind=connection) as session:
+        for period, name in list_partitions(connection):
+            if add_months(period, 1) > before:
+                break
+            forget_partition(session, name)
+            connection.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+            if drop:
+                connection.execute(text(f"DROP TABLE {name}"))
+            else:
+                connection.execute(text(f"ALTER TABLE {name} RENAME TO archived_{name}"))
+            archived.append(name)
+    return archived
+
+
+async def ensure_partitions_at_startup():
+    """Best-effort ensure_partitions on the primary; failures are logged, not raised."""
+    from app.db import get_async_engine
+
+    engine = get_async_engine()
+    if engine.dialect.name != "postgresql" or TRANSACTION_PARTITION_MONTHS_AHEAD < 0:
+        return []
+    try:
+        async with engine.begin() as connection:
+            created = await connection.run_sync(ensure_partitions)
+    except Exception:
+        logger.exception("Could not create upcoming transaction partitions")
+        return []
+    if created:
+        logger.info("Created transaction partitions: %s", ", ".join(created))
+    return created
+
+
+def main():
+    from app.db import engine
+
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions of the transactions table.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="Create partitions for the coming months.")
+    ensure.add_argument("--months-ahead", type=int, default=TRANSACTION_PARTITION_MONTHS_AHEAD)
+    archive = commands.add_parser("archive", help="Detach partitions older than a date.")
+    archive.add_argument("--before", type=date.fromisoformat, required=True,
+                         help="Detach months that end on or before this date.")
+    archive.add_argument("--drop", action="store_true", help="Drop detached partitions instead of keeping them.")
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        if not is_partitioned(connection):
+            print("transactions is not a partitioned table; nothing to do.")
+            return
+        if args.command == "ensure":
+            names = ensure_partitions(connection, args.months_ahead)
+            print(f"Created {len(names)} partitions: {', '.join(names) or '-'}")
+        else:
+            names = archive_partitions(connection, args.before, drop=args.drop)
+            print(f"{'Dropped' if args.drop else 'Detached'} {len(names)} partitions: {', '.join(names) or '-'}")
+
+
+if __name__ == "__main__":
+    main()
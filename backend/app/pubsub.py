@@ -0,0 +1,274 @@
+# app/pubsub.py
+
+import asyncio
+import json
+import logging
+import os
+from collections import defaultdict
+from sqlalchemy.engine import make_url
+from app.metrics import Counter
+
+logger = logging.getLogger("app.pubsub")
+
+# "memory" delivers within this worker only; "postgres" relays every message
+# through LISTEN/NOTIFY so subscribers on all workers receive it.
+PUBSUB_BACKEND = os.getenv("PUBSUB_BACKEND", "memory")
+PUBSUB_CHANNEL = os.getenv("PUBSUB_CHANNEL", "cfo_assistant_events")
+# Messages buffered per subscriber before it is considered too slow and dropped.
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("SUBSCRIBER_QUEUE_SIZE", "100"))
+# Idle Server-Sent Event streams send a comment this often to keep proxies from closing them.
+SSE_HEARTBEAT_SECONDS = float(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+# How often the postgres backend checks its LISTEN connection, and how long
+# the check (a SELECT 1) may take before the connection is replaced.
+PUBSUB_HEALTH_INTERVAL = float(os.getenv("PUBSUB_HEALTH_INTERVAL", "10"))
+PUBSUB_HEALTH_TIMEOUT = float(os.getenv("PUBSUB_HEALTH_TIMEOUT", "2"))
+PUBSUB_RECONNECT_MAX_DELAY = 30.0
+
+MESSAGES = Counter("pubsub_messages_total", "Messages handed to subscribers by outcome.", ("result",))
+
+
+class Subscription:
+    """A subscriber's bounded queue of (topic, message) pairs."""
+
+    def __init__(self, topics, maxsize: int = SUBSCRIBER_QUEUE_SIZE):
+        self.topics = frozenset(topics)
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = False
+
+    def offer(self, topic: str, message) -> bool:
+        try:
+            self.queue.put_nowait((topic, message))
+            return True
+        except asyncio.QueueFull:
+            self.dropped = True
+            return False
+
+    def drop(self):
+        """Mark the subscription dropped and wake a reader blocked in get()."""
+        self.dropped = True
+        try:
+            self.queue.put_nowait(None)
+        except asyncio.QueueFull:
+            pass  # the reader has plenty to get through before it notices
+
+    async def get(self, timeout: float = None):
+        """Return the next (topic, message), or None if timeout passes (or drop() is called) first."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class MemoryBackend:
+    local_only = True
+
+    def __init__(self):
+        self.deliver = lambda topic, message: None
+
+    async def start(self, deliver, reset):
+        self.deliver = deliver
+
+    async def publish(self, topic: str, message):
+        self.deliver(topic, message)
+
+    async def stop(self):
+        pass
+
+
+class PostgresBackend:
+    """Relays messages between workers with PostgreSQL LISTEN/NOTIFY.
+
+    Messages published here come back through the listener like everyone
+    else's, so each worker delivers them to its own subscribers exactly once.
+    NOTIFY payloads are limited to 8000 bytes.
+
+    The LISTEN connection is watched: when it closes or fails a health check
+    it is replaced, and since notifications sent in between are lost, reset()
+    is called to drop every subscriber (see Broker.reset).
+    """
+
+    local_only = False
+
+    def __init__(self, url: str, channel: str = PUBSUB_CHANNEL):
+        self.dsn = make_url(url).set(drivername="postgresql").render_as_string(hide_password=False)
+        self.channel = channel
+        self.connection = None
+        self.lock = asyncio.Lock()
+        self.deliver = lambda topic, message: None
+        self.reset = lambda: None
+        self._lost = asyncio.Event()
+        self._watcher = None
+
+    async def start(self, deliver, reset):
+        self.deliver, self.reset = deliver, reset
+        await self._connect()
+        self._watcher = asyncio.get_running_loop().create_task(self._watch())
+
+    def _on_notify(self, connection, pid, channel, payload):
+        topic, message = json.loads(payload)
+        self.deliver(topic, message)
+
+    async def _connect(self):
+        import asyncpg
+
+        connection = await asyncpg.connect(self.dsn)
+        connection.add_termination_listener(lambda connection: self._lost.set())
+        await connection.add_listener(self.channel, self._on_notify)
+        self._lost.clear()
+        self.connection = connection
+
+    async def _healthy(self) -> bool:
+        try:
+            async with self.lock:
+                await self.connection.fetchval("SELECT 1", timeout=PUBSUB_HEALTH_TIMEOUT)
+            return True
+        except Exception as exc:
+            logger.warning("Pub/sub connection failed its health check: %s", exc)
+            return False
+
+    async def _watch(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._lost.wait(), PUBSUB_HEALTH_INTERVAL)
+            except asyncio.TimeoutError:
+                if await self._healthy():
+                    continue
+            await self._reconnect()
+
+    async def _reconnect(self):
+        old, self.connection = self.connection, None
+        if old is not None:
+            old.terminate()
+        delay = 0.5
+        while True:
+            try:
+                await self._connect()
+                break
+            except Exception as exc:
+                logger.warning("Pub/sub reconnect failed, retrying in %.1f s: %s", delay, exc)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, PUBSUB_RECONNECT_MAX_DELAY)
+        logger.info("Pub/sub connection re-established; resetting subscribers")
+        self.reset()
+
+    async def publish(self, topic: str, message):
+        if self.connection is None:
+            raise ConnectionError("Pub/sub connection is being re-established")
+        async with self.lock:
+            await self.connection.execute("SELECT pg_notify($1, $2)", self.channel, json.dumps([topic, message]))
+
+    async def stop(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+        if self.connection is not None:
+            await self.connection.close()
+            self.connection = None
+
+
+class Broker:
+    """In-process fan-out of topic messages to subscriber queues.
+
+    A subscriber that lets its queue fill up is dropped rather than allowed
+    to slow down publishers; its stream ends and the client reconnects.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._subscribers = defaultdict(set)
+
+    async def start(self):
+        await self.backend.start(self._deliver, self.reset)
+
+    async def stop(self):
+        await self.backend.stop()
+
+    def subscribe(self, topics) -> Subscription:
+        subscription = Subscription(topics)
+        for topic in subscription.topics:
+            self._subscribers[topic].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._subscribers.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._subscribers[topic]
+
+    def idle(self) -> bool:
+        """True when no subscriber anywhere can be listening, so publishers may skip work."""
+        return self.backend.local_only and not self._subscribers
+
+    def wants(self, topic: str) -> bool:
+        return not self.backend.local_only or topic in self._subscribers
+
+    async def publish(self, topic: str, message):
+        try:
+            await self.backend.publish(topic, message)
+        except Exception:
+            # Notifications are best effort; the write they describe has committed.
+            logger.exception("Failed to publish to %s", topic)
+
+    def _deliver(self, topic: str, message):
+        for subscription in list(self._subscribers.get(topic, ())):
+            if subscription.offer(topic, message):
+                MESSAGES.inc(result="delivered")
+            else:
+                MESSAGES.inc(result="dropped")
+                logger.warning("Dropping slow subscriber on %s", topic)
+                self.unsubscribe(subscription)
+
+    def reset(self):
+        """Drop every subscriber after messages may have been lost.
+
+        Event streams end, so clients reconnect and refetch; the category
+        catalog treats the drop as an invalidation and reloads.
+        """
+        for subscribers in list(self._subscribers.values()):
+            for subscription in list(subscribers):
+                subscription.drop()
+                self.unsubscribe(subscription)
+
+    def subscriber_count(self) -> int:
+        return len({subscription for subscribers in self._subscribers.values() for subscription in subscribers})
+
+
+def format_sse(event: str, data) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def sse_stream(subscription: Subscription, event: str, initial=(), accept=None, heartbeat: float = SSE_HEARTBEAT_SECONDS):
+    """Render a subscription as a Server-Sent Events body.
+
+    Sends the initial messages first, then every message passing accept(),
+    with a heartbeat comment whenever the stream is idle. Ends once the broker
+    drops the subscription and unsubscribes when the client goes away.
+    """
+    try:
+        yield f"retry: {int(heartbeat * 1000)}\n\n".encode("utf-8")
+        for message in initial:
+            yield format_sse(event, message)
+        while not subscription.dropped:
+            item = await subscription.get(heartbeat)
+            if item is None:
+                yield b": heartbeat\n\n"
+                continue
+            _, message = item
+            if accept is None or accept(message):
+                yield format_sse(event, message)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def create_backend(name: str = PUBSUB_BACKEND):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "postgres":
+        from app.db import DATABASE_URL
+        return PostgresBackend(DATABASE_URL)
+    raise ValueError(f"Unknown PUBSUB_BACKEND {name!r}")
+
+
+broker = Broker(create_backend())
@@ -0,0 +1,28 @@
+# app/rebuild_rollups.py
+
+import argparse
+import asyncio
+from app.anomalies import rebuild_stats
+from app.db import AsyncSessionLocal
+from app.services import rebuild_rollups
+
+
+async def main(budget_id: int = None, category_stats: bool = False):
+    async with AsyncSessionLocal() as session:
+        try:
+            count = await rebuild_rollups(session, budget_id=budget_id)
+            print(f"Rebuilt {count} rollup rows.")
+            if category_stats:
+                count = await rebuild_stats(session)
+                print(f"Rebuilt {count} category stats rows.")
+        except Exception as e:
+            await session.rollback()
+            print(f"Error rebuilding rollups: {e}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recompute spend rollups from the transactions table.")
+    parser.add_argument("--budget-id", type=int, help="Only rebuild rollups for this budget.")
+    parser.add_argument("--category-stats", action="store_true", help="Also rebuild the anomaly detection stats.")
+    args = parser.parse_args()
+    asyncio.run(main(args.budget_id, args.category_stats))
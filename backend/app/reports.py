@@ -0,0 +1,371 @@
+# app/reports.py
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import numpy as np
+from sqlalchemy import func, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import NullPool
+from app import fx, services
+from app.db import DATABASE_URL, get_async_engine, is_memory_sqlite, open_session, sqlite_pragmas
+from app.models import Budget, Category, ReportJob, Transaction
+
+logger = logging.getLogger("app.reports")
+
+# Jobs run this many at a time, each on its own thread, event loop and
+# database connection, so they never occupy request workers or the pool.
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+# Submissions beyond this many waiting jobs per process get 503.
+REPORT_MAX_QUEUE = int(os.getenv("REPORT_MAX_QUEUE", "32"))
+REPORTS_DIR = os.getenv("REPORTS_DIR", "reports")
+# Identifies this process on the jobs it claims.
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+# Each process refreshes updated_at on its running jobs this often, and
+# fails running jobs that no live process has refreshed for
+# REPORT_STALE_SECONDS, whenever they were claimed.
+REPORT_HEARTBEAT_SECONDS = float(os.getenv("REPORT_HEARTBEAT_SECONDS", "15"))
+REPORT_STALE_SECONDS = float(os.getenv("REPORT_STALE_SECONDS", "60"))
+REPORT_BATCH_SIZE = int(os.getenv("REPORT_BATCH_SIZE", "10000"))
+# Progress is written at most this often.
+REPORT_PROGRESS_INTERVAL = 1.0
+
+ACTIVE_STATES = ("queued", "running")
+
+
+def params_hash(kind: str, params: dict) -> str:
+    raw = json.dumps([kind, params], sort_keys=True, default=str).encode()
+    return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def job_response(job: ReportJob) -> dict:
+    return {
+        "id": job.id,
+        "kind": job.kind,
+        "params": json.loads(job.params),
+        "state": job.state,
+        "progress": job.progress,
+        "error": job.error,
+        "result_url": f"/reports/{job.id}/result" if job.state == "succeeded" else None,
+        "created_at": job.created_at,
+        "started_at": job.started_at,
+        "finished_at": job.finished_at,
+    }
+
+
+async def find_active_job(db: AsyncSession, owner_id: int, digest: str):
+    return await db.scalar(select(ReportJob).where(
+        ReportJob.owner_id == owner_id, ReportJob.params_hash == digest, ReportJob.state.in_(ACTIVE_STATES)
+    ))
+
+
+async def create_job(db: AsyncSession, owner_id: int, kind: str, params: dict):
+    """Queue a job, or return the queued/running one with the same parameters.
+
+    Returns (job, created). A partial unique index backs the check, so
+    concurrent identical submissions still end up sharing one job.
+    """
+    digest = params_hash(kind, params)
+    job = await find_active_job(db, owner_id, digest)
+    if job is not None:
+        return job, False
+    job = ReportJob(owner_id=owner_id, kind=kind, params=json.dumps(params, sort_keys=True),
+                    params_hash=digest, state="queued", progress=0.0, created_at=datetime.utcnow())
+    db.add(job)
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        job = await find_active_job(db, owner_id, digest)
+        if job is None:
+            raise
+        return job, False
+    return job, True
+
+
+async def get_job(db: AsyncSession, job_id: int, owner_id: int):
+    return await db.scalar(select(ReportJob).where(ReportJob.id == job_id, ReportJob.owner_id == owner_id))
+
+
+class Progress:
+    """Throttled progress writer for a running job."""
+
+    def __init__(self, sessions, job_id: int):
+        self.sessions = sessions
+        self.job_id = job_id
+        self.written = 0.0
+
+    async def __call__(self, fraction: float):
+        now = time.monotonic()
+        if now - self.written < REPORT_PROGRESS_INTERVAL:
+            return
+        self.written = now
+        await _set_job(self.sessions, self.job_id, progress=round(min(fraction, 1.0), 4), updated_at=datetime.utcnow())
+
+
+async def category_year_report(db: AsyncSession, owner_id: int, params: dict, progress: Progress):
+    """Monthly spend per category for one calendar year, across the owner's budgets.
+
+    Amounts are in each budget's currency, or all converted into
+    params["currency"] as of their dates, a batch at a time.
+    """
+    year = params["year"]
+    currency = params.get("currency")
+    table = await fx.load_table(db) if currency else None
+    query = (
+        select(Transaction.category_id, Transaction.date, Transaction.amount, Transaction.is_anomaly, Budget.currency)
+        .join(Budget, Budget.id == Transaction.budget_id)
+        .where(Budget.owner_id == owner_id,
+               Transaction.date >= datetime(year, 1, 1), Transaction.date < datetime(year + 1, 1, 1))
+    )
+    if params.get("budget_id") is not None:
+        query = query.where(Transaction.budget_id == params["budget_id"])
+    total_rows = await db.scalar(select(func.count()).select_from(query.subquery()))
+
+    categories = defaultdict(lambda: {"months": [0.0] * 12, "total": 0.0, "count": 0, "max": None, "anomalies": 0})
+    seen = 0
+    result = await db.stream(query.execution_options(yield_per=REPORT_BATCH_SIZE))
+    async for partition in result.partitions():
+        amounts = [row.amount for row in partition]
+        if table is not None:
+            converted = table.convert(
+                amounts, [row.date for row in partition], [row.currency for row in partition], currency
+            )
+            if np.isnan(converted).any():
+                raise ValueError(f"Missing exchange rates into {currency} for some transactions")
+            amounts = converted.tolist()
+        for (category_id, value, _, is_anomaly, _), amount in zip(partition, amounts):
+            entry = categories[category_id or 0]
+            entry["months"][value.month - 1] += amount
+            entry["total"] += amount
+            entry["count"] += 1
+            entry["max"] = amount if entry["max"] is None else max(entry["max"], amount)
+            entry["anomalies"] += bool(is_anomaly)
+        seen += len(partition)
+        await progress(seen / total_rows if total_rows else 1.0)
+
+    names = dict((await db.execute(
+        select(Category.id, Category.name).where(Category.id.in_(list(categories)))
+    )).all())
+    rows = [
+        {"category_id": category_id or None, "category": names.get(category_id), **entry,
+         "months": [round(total, 2) for total in entry["months"]], "total": round(entry["total"], 2)}
+        for category_id, entry in sorted(categories.items(), key=lambda item: -item[1]["total"])
+    ]
+    return {"year": year, "budget_id": params.get("budget_id"), "currency": currency, "transactions": seen,
+            "categories": rows}
+
+
+async def rollups_report(db: AsyncSession, owner_id: int, params: dict, progress: Progress):
+    """Recompute the spend rollups of one or all of the owner's budgets."""
+    if params.get("budget_id") is not None:
+        budget_ids = [params["budget_id"]]
+    else:
+        budget_ids = list(await db.scalars(select(Budget.id).where(Budget.owner_id == owner_id).order_by(Budget.id)))
+    rows = 0
+    for index, budget_id in enumerate(budget_ids):
+        rows += await services.rebuild_rollups(db, budget_id=budget_id)
+        await progress((index + 1) / len(budget_ids))
+    return {"budgets": len(budget_ids), "rollup_rows": rows}
+
+
+REPORT_KINDS = {
+    "category_year": category_year_report,
+    "rollups": rollups_report,
+}
+
+
+async def _set_job(sessions, job_id: int, **values):
+    async with sessions() as db:
+        await db.execute(update(ReportJob).where(ReportJob.id == job_id).values(**values))
+        await db.commit()
+
+
+def _write_result(job_id: int, result) -> str:
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    path = os.path.join(REPORTS_DIR, f"report-{job_id}.json")
+    with open(path + ".tmp", "w") as handle:
+        json.dump(result, handle, default=str)
+    os.replace(path + ".tmp", path)
+    return path
+
+
+def _job_sessions():
+    """A session factory on a private engine for one job thread.
+
+    It connects like the app's engine (same URL and SQLite pragmas) but
+    without a pool: a job holds one connection for its whole run, and the
+    app's pool belongs to the main event loop.
+    """
+    engine = create_async_engine(get_async_engine().url, poolclass=NullPool)
+    sqlite_pragmas(engine.sync_engine)
+    return engine, async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+
+async def execute(job_id: int, sessions=None):
+    """Claim a queued job and run it to completion; a no-op if another worker got it.
+
+    sessions defaults to a private engine (see _job_sessions). Whatever
+    goes wrong, a claimed or still queued job ends up failed, never stuck.
+    """
+    engine = None
+    if sessions is None:
+        engine, sessions = _job_sessions()
+    try:
+        await _run_job(sessions, job_id)
+    except Exception as exc:
+        logger.exception("Report job %d failed", job_id)
+        try:
+            async with sessions() as db:
+                await db.execute(
+                    update(ReportJob).where(ReportJob.id == job_id, ReportJob.state.in_(ACTIVE_STATES))
+                    .values(state="failed", error=str(exc) or type(exc).__name__,
+                            finished_at=datetime.utcnow(), updated_at=datetime.utcnow())
+                )
+                await db.commit()
+        except Exception:
+            logger.exception("Could not mark report job %d as failed", job_id)
+    finally:
+        if engine is not None:
+            await engine.dispose()
+
+
+async def _run_job(sessions, job_id: int):
+    async with sessions() as db:
+        now = datetime.utcnow()
+        claimed = await db.execute(
+            update(ReportJob).where(ReportJob.id == job_id, ReportJob.state == "queued")
+            .values(state="running", worker=WORKER_ID, started_at=now, updated_at=now)
+        )
+        await db.commit()
+        if claimed.rowcount == 0:
+            return
+        job = await db.get(ReportJob, job_id)
+        kind, owner_id, params = job.kind, job.owner_id, json.loads(job.params)
+
+    progress = Progress(sessions, job_id)
+    async with sessions() as db:
+        result = await REPORT_KINDS[kind](db, owner_id, params, progress)
+    path = _write_result(job_id, result)
+    await _set_job(sessions, job_id, state="succeeded", progress=1.0, result_path=path,
+                   finished_at=datetime.utcnow(), updated_at=datetime.utcnow())
+
+
+class ReportRunner:
+    """Bounded thread pool running report jobs, each in its own event loop.
+
+    An in-memory SQLite database only exists behind the app's own engine, so
+    with one, jobs run as tasks on the app's event loop instead.
+    """
+
+    def __init__(self, workers: int = REPORT_WORKERS, max_queue: int = REPORT_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.pending = 0
+        self.submitted = set()
+        self._executor = None
+        self._tasks = set()
+        self._maintenance = None
+        self._lock = threading.Lock()
+
+    def full(self) -> bool:
+        return self.pending >= self.workers + self.max_queue
+
+    def submit(self, job_id: int):
+        with self._lock:
+            self.pending += 1
+            self.submitted.add(job_id)
+        if is_memory_sqlite(DATABASE_URL):
+            task = asyncio.get_running_loop().create_task(execute(job_id, sessions=open_session))
+            self._tasks.add(task)
+            task.add_done_callback(lambda task: self._done(job_id, task))
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="report")
+        future = self._executor.submit(asyncio.run, execute(job_id))
+        future.add_done_callback(lambda future: self._done(job_id, future))
+
+    def _done(self, job_id: int, future):
+        self._tasks.discard(future)
+        with self._lock:
+            self.pending -= 1
+            self.submitted.discard(job_id)
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Report worker crashed", exc_info=future.exception())
+
+    def start(self):
+        """Recover orphaned jobs now, then heartbeat and recover every REPORT_HEARTBEAT_SECONDS."""
+        self._maintenance = asyncio.get_running_loop().create_task(self._maintain())
+
+    async def _maintain(self):
+        while True:
+            try:
+                async with open_session() as db:
+                    await heartbeat(db)
+                    await recover(db)
+            except Exception:
+                logger.exception("Report job maintenance failed")
+            await asyncio.sleep(REPORT_HEARTBEAT_SECONDS)
+
+    def shutdown(self):
+        # Unstarted jobs stay queued in the table and are picked up by recover().
+        if self._maintenance is not None:
+            self._maintenance.cancel()
+            self._maintenance = None
+        for task in list(self._tasks):
+            task.cancel()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "pending": self.pending}
+
+
+runner = ReportRunner()
+
+
+async def heartbeat(db: AsyncSession):
+    """Mark the jobs this process is running as alive."""
+    await db.execute(
+        update(ReportJob).where(ReportJob.worker == WORKER_ID, ReportJob.state == "running")
+        .values(updated_at=datetime.utcnow())
+    )
+    await db.commit()
+
+
+async def recover(db: AsyncSession):
+    """Fail jobs orphaned by a dead process and submit queued ones nobody is running.
+
+    A running job is orphaned once no process has heartbeated it for
+    REPORT_STALE_SECONDS, however long ago it was claimed. A queued job
+    another process has submitted too runs wherever it is claimed first.
+    """
+    now = datetime.utcnow()
+    await db.execute(
+        update(ReportJob)
+        .where(ReportJob.state == "running", or_(
+            ReportJob.updated_at.is_(None), ReportJob.updated_at < now - timedelta(seconds=REPORT_STALE_SECONDS)
+        ))
+        .values(state="failed", error="Interrupted", finished_at=now, updated_at=now)
+    )
+    await db.commit()
+    queued = list(await db.scalars(select(ReportJob.id).where(ReportJob.state == "queued").order_by(ReportJob.id)))
+    submitted = 0
+    for job_id in queued:
+        if runner.full():
+            break
+        if job_id not in runner.submitted:
+            runner.submit(job_id)
+            submitted += 1
+    return submitted
@@ -1,29 +1,99 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from typing import List
-from app import schemas, services, models
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import date
+from typing import List, Optional
+from app import analytics, conditional, export, pubsub, schemas, serialization, services, models
+from app.analytics import FORECAST_WINDOW_DAYS
 from app.services import get_db, get_current_user
 
 router = APIRouter()
 
+def _export_response(query, name: str, fmt: str, compress: bool, principal: int):
+    filename = f"{name}.{fmt}" + (".gz" if compress else "")
+    return StreamingResponse(
+        export.stream_export(query, fmt, compress, principal=principal),
+        media_type="application/gzip" if compress else export.EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 @router.post("/", response_model=schemas.BudgetResponse)
-def create_budget(budget: schemas.BudgetCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return services.create_budget(db, budget, owner_id=current_user.id)
+async def create_budget(budget: schemas.BudgetCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    return await services.create_budget(db, budget, owner_id=current_user.id)
 
 @router.get("/", response_model=List[schemas.BudgetResponse])
-def get_all_budgets(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    return services.get_budgets(db, owner_id=current_user.id)
+async def get_all_budgets(request: Request, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    async def build():
+        budgets = await services.get_budget_rows(db, owner_id=current_user.id)
+        return serialization.json_response(serialization.rows_to_dicts(budgets), List[schemas.BudgetResponse])
+    return await conditional.conditional_response(request, db, current_user.id, [services.budgets_version_key(current_user.id)], build)
+
+@router.get("/overview", response_model=List[schemas.BudgetOverview])
+async def get_budgets_overview(latest: int = Query(services.OVERVIEW_LATEST_TRANSACTIONS, ge=0, le=50), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    """Dashboard data for every budget in one call: totals, per-category spend and the latest transactions."""
+    overview = await services.get_budget_overview(db, owner_id=current_user.id, latest=latest)
+    return serialization.json_response(overview, List[schemas.BudgetOverview])
+
+@router.get("/forecast", response_model=List[schemas.BudgetForecast])
+async def forecast_all_budgets(window: int = Query(FORECAST_WINDOW_DAYS, ge=1, le=365), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    budgets = await services.get_budgets(db, owner_id=current_user.id)
+    return await analytics.forecast_budgets(db, budgets, window)
 
-@router.put("/{budget_id}", response_model=schemas.BudgetResponse)
-def update_budget(budget_id: int, budget: schemas.BudgetCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    updated_budget = services.update_budget(db, budget_id, budget, owner_id=current_user.id)
+@router.get("/export")
+async def export_all_transactions(format: str = Query("csv", pattern="^(csv|ndjson)$"), gzip: bool = False, date_from: Optional[date] = None, date_to: Optional[date] = None, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    bounds = await services.transaction_date_bounds(db, owner_id=current_user.id)
+    query = export.export_query(current_user.id, date_from=date_from, date_to=date_to, bounds=bounds)
+    return _export_response(query, "transactions", format, gzip, current_user.id)
+
+@router.get("/stream")
+async def stream_budget_balances(budget_id: Optional[List[int]] = Query(None), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    """Server-Sent Events: current balances, then a "balance" event whenever one changes."""
+    subscription = pubsub.broker.subscribe([services.balance_topic(current_user.id)])
+    try:
+        balances = await services.get_budget_balances(db, budget_ids=budget_id, owner_id=current_user.id)
+    except Exception:
+        pubsub.broker.unsubscribe(subscription)
+        raise
+    wanted = set(budget_id) if budget_id else None
+    return StreamingResponse(
+        pubsub.sse_stream(subscription, "balance", balances, accept=lambda message: wanted is None or message["budget_id"] in wanted),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@router.put("/{budget_id}",response_model=schemas.BudgetResponse)
+async def update_budget(budget_id: int, budget: schemas.BudgetCreate, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    updated_budget = await services.update_budget(db, budget_id, budget, owner_id=current_user.id)
     if not updated_budget:
         raise HTTPException(status_code=404, detail="Budget not found")
     return updated_budget
 
 @router.delete("/{budget_id}", response_model=schemas.BudgetResponse)
-def delete_budget(budget_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    deleted_budget = services.delete_budget(db, budget_id, owner_id=current_user.id)
+async def delete_budget(budget_id: int, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    deleted_budget = await services.delete_budget(db, budget_id, owner_id=current_user.id)
     if not deleted_budget:
         raise HTTPException(status_code=404, detail="Budget not found")
     return deleted_budget
+
+@router.get("/{budget_id}/summary", response_model=schemas.BudgetSummary)
+async def get_budget_summary(budget_id: int, period_from: Optional[date] = None, period_to: Optional[date] = None, currency: Optional[str] = Query(None, pattern=schemas.CURRENCY_PATTERN), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    budget = await services.get_budget(db, budget_id, owner_id=current_user.id)
+    if not budget:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    return await services.get_budget_summary(db, budget, period_from, period_to, currency)
+
+@router.get("/{budget_id}/forecast", response_model=schemas.BudgetForecast)
+async def forecast_budget(budget_id: int, window: int = Query(FORECAST_WINDOW_DAYS, ge=1, le=365), db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    budget = await services.get_budget(db, budget_id, owner_id=current_user.id)
+    if not budget:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    return await analytics.forecast_budget(db, budget, window)
+
+@router.get("/{budget_id}/export")
+async def export_budget_transactions(budget_id: int, format: str = Query("csv", pattern="^(csv|ndjson)$"), gzip: bool = False, date_from: Optional[date] = None, date_to: Optional[date] = None, db: AsyncSession = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    budget = await services.get_budget(db, budget_id, owner_id=current_user.id)
+    if not budget:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    bounds = await services.transaction_date_bounds(db, budget_id=budget_id)
+    query = export.export_query(current_user.id, budget_id=budget_id, date_from=date_from, date_to=date_to, bounds=bounds)
+    return _export_response(query, f"budget-{budget_id}-transactions", format, gzip, current_user.id)
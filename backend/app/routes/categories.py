@@ -1,50 +1,94 @@
 # app/routes/categories.py
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.models import Category, Transaction
-from app.schemas import CategoryResponse, CategoryCreate
-from app.services import get_db, get_current_user
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import conditional, serialization
+from app.catalog import catalog
+from app.models import Category, User
+from app.schemas import CategoryResponse, CategoryCreate, TransactionPage
+from app.services import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    bump_data_versions,
+    categories_version_keys,
+    get_db,
+    get_current_user,
+    get_data_versions,
+    list_transactions,
+    resolve_category,
+)
 
 router = APIRouter()
 
 @router.get("/", response_model=list[CategoryResponse])
-def get_categories(
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+async def get_categories(
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
-    categories = db.query(Category).filter(
-        (Category.user_id == None) | (Category.user_id == current_user["id"])
-    ).all()
-    return categories
+    # The ETag comes from the database, not the snapshot, so a worker that
+    # missed an invalidation can't hand out a stale one.
+    version_keys = categories_version_keys(current_user.id)
+    versions = await get_data_versions(db, version_keys)
+
+    async def build():
+        snapshot = await catalog.matching(versions, current_user.id)
+        return serialization.json_response(snapshot.visible(current_user.id), list[CategoryResponse])
+    return await conditional.conditional_response(
+        request, db, current_user.id, version_keys, build, versions=versions,
+    )
 
 @router.post("/", response_model=CategoryResponse)
-def create_category(
+async def create_category(
     category: CategoryCreate,
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
-    existing = db.query(Category).filter(
-        Category.name == category.name,
-        (Category.user_id == None) | (Category.user_id == current_user["id"])
-    ).first()
-    if existing:
+    if await resolve_category(category.name, current_user.id) is not None:
         raise HTTPException(status_code=400, detail="Category already exists.")
     
-    new_category = Category(name=category.name, is_custom=True, user_id=current_user["id"])
+    new_category = Category(name=category.name, is_custom=True, user_id=current_user.id)
     db.add(new_category)
-    db.commit()
-    db.refresh(new_category)
+    await bump_data_versions(db, categories_version_keys(current_user.id)[1:])
+    try:
+        await db.commit()
+    except IntegrityError:
+        # Names are unique table-wide, including other users' categories.
+        await db.rollback()
+        raise HTTPException(status_code=400, detail="Category already exists.")
+    await db.refresh(new_category)
+    await catalog.invalidate()
     return new_category
 
-@router.get("/{category_id}/transactions", response_model=list[TransactionResponse])
-def get_transactions_by_category(
+@router.get("/{category_id}/transactions", response_model=TransactionPage)
+async def get_transactions_by_category(
     category_id: int,
-    db: Session = Depends(get_db),
-    current_user: dict = Depends(get_current_user),
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
 ):
-    transactions = db.query(Transaction).filter(
-        Transaction.category_id == category_id
-    ).all()
-    if not transactions:
+    try:
+        transactions, next_cursor = await list_transactions(
+            db,
+            category_id=category_id,
+            owner_id=current_user.id,
+            date_from=date_from,
+            date_to=date_to,
+            min_amount=min_amount,
+            max_amount=max_amount,
+            cursor=cursor,
+            limit=limit,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    if not transactions and cursor is None:
         raise HTTPException(status_code=404, detail="No transactions found for this category.")
-    return transactions
+    page = {"items": serialization.rows_to_dicts(transactions), "next_cursor": next_cursor}
+    return serialization.json_response(page, TransactionPage)
@@ -0,0 +1,60 @@
+# app/routes/reports.py
+import os
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import reports
+from app.models import User
+from app.schemas import ReportCreate, ReportJobResponse
+from app.services import get_budget, get_current_user, get_db
+
+router = APIRouter()
+
+@router.post("/", response_model=ReportJobResponse, status_code=202)
+async def create_report(
+    report: ReportCreate,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    """Queue a report job. Submitting the same report again while it is queued or running returns that job."""
+    if report.kind == "category_year" and report.year is None:
+        raise HTTPException(status_code=422, detail="category_year reports need a year.")
+    if report.budget_id is not None and await get_budget(db, report.budget_id, current_user.id) is None:
+        raise HTTPException(status_code=404, detail="Budget not found")
+    if reports.runner.full():
+        raise HTTPException(status_code=503, detail="Too many reports queued, please retry.", headers={"Retry-After": "5"})
+
+    params = report.model_dump(exclude={"kind"}, exclude_none=True)
+    job, created = await reports.create_job(db, current_user.id, report.kind, params)
+    if created:
+        reports.runner.submit(job.id)
+    return JSONResponse(
+        ReportJobResponse.model_validate(reports.job_response(job)).model_dump(mode="json"),
+        status_code=202, headers={"Location": f"/reports/{job.id}"},
+    )
+
+@router.get("/{job_id}", response_model=ReportJobResponse)
+async def get_report(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    job = await reports.get_job(db, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    return reports.job_response(job)
+
+@router.get("/{job_id}/result")
+async def get_report_result(
+    job_id: int,
+    db: AsyncSession = Depends(get_db),
+    current_user: User = Depends(get_current_user),
+):
+    job = await reports.get_job(db, job_id, current_user.id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+    if job.state != "succeeded":
+        raise HTTPException(status_code=409, detail=f"Report is {job.state}.")
+    if not job.result_path or not os.path.exists(job.result_path):
+        raise HTTPException(status_code=410, detail="Report result is no longer available.")
+    return FileResponse(job.result_path, media_type="application/json", filename=f"report-{job.id}.json")
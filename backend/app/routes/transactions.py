@@ -1,54 +1,237 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from app.schemas import TransactionCreate, TransactionResponse, TransactionUpdate
+import csv
+import json
+import time
+from datetime import datetime
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import conditional, serialization, write_behind
+from app.schemas import (
+    AnomalyPage,
+    BulkTransactionResult,
+    TransactionCreate,
+    TransactionPage,
+    TransactionResponse,
+    TransactionUpdate,
+)
 from app.services import (
+    BULK_CHUNK_SIZE,
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
     get_db,
     get_current_user, 
+    bulk_create_transactions as bulk_create_transactions_service,
     create_transaction as create_transaction_service, 
-    get_transactions_by_budget,
-    get_transaction_by_id,
+    get_budget,
+    get_owned_budget_ids,
+    get_visible_category_ids,
+    list_anomalies,
+    list_transactions,
+    transactions_version_key,
     update_transaction as update_transaction_service,
     delete_transaction as delete_transaction_service,
 )
-from app.models import Transaction
 
 router = APIRouter()
 
+CSV_CONTENT_TYPES = {"text/csv", "application/csv"}
+NDJSON_CONTENT_TYPES = {"application/x-ndjson", "application/jsonl", "application/json"}
+
+
+async def _iter_lines(stream):
+    """Split an async byte stream into decoded lines without buffering the body."""
+    pending = b""
+    async for chunk in stream:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line.decode("utf-8").rstrip("\r")
+    if pending:
+        yield pending.decode("utf-8").rstrip("\r")
+
+
+async def _iter_rows(lines, fmt: str):
+    """Yield (row_number, row, error) for every non-blank line of the upload."""
+    header = None
+    row_number = 0
+    async for line in lines:
+        if not line.strip():
+            continue
+        if fmt == "csv" and header is None:
+            header = [name.strip() for name in next(csv.reader([line]))]
+            continue
+        row_number += 1
+        if fmt == "csv":
+            values = next(csv.reader([line]))
+            if len(values) != len(header):
+                yield row_number, None, f"Expected {len(header)} columns, got {len(values)}"
+                continue
+            yield row_number, {k: (v or None) for k, v in zip(header, values)}, None
+        else:
+            try:
+                row = json.loads(line)
+            except ValueError as exc:
+                yield row_number, None, f"Invalid JSON: {exc}"
+                continue
+            if not isinstance(row, dict):
+                yield row_number, None, "Expected a JSON object"
+                continue
+            yield row_number, row, None
+
+
+def _detect_format(request: Request, fmt: Optional[str]) -> str:
+    if fmt in ("csv", "ndjson"):
+        return fmt
+    if fmt is not None:
+        raise HTTPException(status_code=400, detail="format must be 'csv' or 'ndjson'.")
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    if content_type in CSV_CONTENT_TYPES:
+        return "csv"
+    if content_type in NDJSON_CONTENT_TYPES:
+        return "ndjson"
+    raise HTTPException(status_code=415, detail="Upload a text/csv or application/x-ndjson body.")
+
+
+@router.post("/bulk", response_model=BulkTransactionResult)
+async def bulk_create_transactions_route(
+    request: Request,
+    format: Optional[str] = None,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    """Stream a CSV or NDJSON upload into the database in chunks."""
+    fmt = _detect_format(request, format)
+    started = time.perf_counter()
+    received = 0
+    inserted = 0
+    errors = []
+    chunk = []
+
+    async def flush():
+        nonlocal inserted
+        count, chunk_errors = await bulk_create_transactions_service(db, chunk, current_user.id)
+        inserted += count
+        errors.extend(chunk_errors)
+        chunk.clear()
+
+    async for row_number, row, error in _iter_rows(_iter_lines(request.stream()), fmt):
+        received += 1
+        if error:
+            errors.append((row_number, error))
+            continue
+        chunk.append((row_number, row))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            await flush()
+    if chunk:
+        await flush()
+
+    elapsed = time.perf_counter() - started
+    errors.sort()
+    return {
+        "received": received,
+        "inserted": inserted,
+        "failed": len(errors),
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(received / elapsed, 1) if elapsed else 0.0,
+        "errors": [{"row": row, "error": error} for row, error in errors],
+    }
+
 @router.post("/", response_model=TransactionResponse)
-def create_transaction_route(
+async def create_transaction_route(
     transaction: TransactionCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(get_current_user),
+):
+    if not await get_owned_budget_ids(db, current_user.id, {transaction.budget_id}):
+        raise HTTPException(status_code=404, detail="Budget not found")
+    if not await get_visible_category_ids(current_user.id, {transaction.category_id}):
+        raise HTTPException(status_code=404, detail="Category not found")
+    if write_behind.writer.running:
+        try:
+            return await write_behind.writer.submit(transaction, principal=current_user.id)
+        except write_behind.WriterUnavailable:
+            pass
+    return await create_transaction_service(db, transaction)
+
+
+@router.get("/anomalies", response_model=AnomalyPage)
+async def get_anomalies(
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
-    return create_transaction_service(db, transaction)
+    """Transactions flagged as unusually large for their category, newest first."""
+    try:
+        anomalies, next_cursor = await list_anomalies(db, current_user.id, cursor=cursor, limit=limit)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    page = {"items": serialization.rows_to_dicts(anomalies), "next_cursor": next_cursor}
+    return serialization.json_response(page, AnomalyPage)
 
 
-@router.get("/{budget_id}", response_model=list[TransactionResponse])
-def get_transactions(
+@router.get("/{budget_id}", response_model=TransactionPage)
+async def get_transactions(
+    request: Request,
     budget_id: int,
-    db: Session = Depends(get_db),
+    category_id: Optional[int] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    min_amount: Optional[float] = None,
+    max_amount: Optional[float] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
-    transactions = db.query(Transaction).filter(Transaction.budget_id == budget_id).all()
-    if not transactions:
-        raise HTTPException(status_code=404, detail="No transactions found for this budget.")
-    return transactions
+    if not await get_budget(db, budget_id, owner_id=current_user.id):
+        raise HTTPException(status_code=404, detail="Budget not found")
+
+    async def build():
+        try:
+            transactions, next_cursor = await list_transactions(
+                db,
+                budget_id=budget_id,
+                category_id=category_id,
+                date_from=date_from,
+                date_to=date_to,
+                min_amount=min_amount,
+                max_amount=max_amount,
+                cursor=cursor,
+                limit=limit,
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+        if not transactions and cursor is None:
+            raise HTTPException(status_code=404, detail="No transactions found for this budget.")
+        page = {"items": serialization.rows_to_dicts(transactions), "next_cursor": next_cursor}
+        return serialization.json_response(page, TransactionPage)
+
+    return await conditional.conditional_response(
+        request, db, current_user.id, [transactions_version_key(budget_id)], build
+    )
 
 
 @router.put("/{transaction_id}", response_model=TransactionResponse)
-def update_transaction_route(
+async def update_transaction_route(
     transaction_id: int,
     transaction_data: TransactionUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
-    return update_transaction_service(db, transaction_id, transaction_data)
+    transaction = await update_transaction_service(db, transaction_id, transaction_data, owner_id=current_user.id)
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return transaction
 
 
 @router.delete("/{transaction_id}")
-def delete_transaction_route(
+async def delete_transaction_route(
     transaction_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(get_current_user),
 ):
-    return delete_transaction_service(db, transaction_id)
+    transaction = await delete_transaction_service(db, transaction_id, owner_id=current_user.id)
+    if not transaction:
+        raise HTTPException(status_code=404, detail="Transaction not found")
+    return transaction
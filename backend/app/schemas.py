@@ -1,6 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional, List
-from datetime import datetime
+from pydantic import BaseModel, Field
+from typing import Any, Dict, Literal, Optional, List
+from datetime import date, datetime
 
 class UserBase(BaseModel):
     email: str
@@ -14,20 +14,55 @@ class UserResponse(UserBase):
     class Config:
         from_attributes = True
 
+# ISO 4217 currency code
+CURRENCY_PATTERN = "^[A-Z]{3}$"
+
 class BudgetBase(BaseModel):
     name: str
     amount: float
 
 class BudgetCreate(BudgetBase):
-    pass
+    currency: Optional[str] = Field(None, pattern=CURRENCY_PATTERN)
 
 class BudgetResponse(BudgetBase):
     id: int
     owner_id: int
+    currency: str
 
     class Config:
         from_attributes = True
 
+class SpendRollupResponse(BaseModel):
+    period: date
+    category_id: Optional[int] = None
+    total: float
+    count: int
+
+class BudgetSummary(BaseModel):
+    budget_id: int
+    currency: str
+    amount: float
+    spent: float
+    remaining: float
+    rollups: List[SpendRollupResponse]
+
+class ForecastPoint(BaseModel):
+    date: date
+    spent: float
+    rolling_average: float
+
+class BudgetForecast(BaseModel):
+    budget_id: int
+    amount: float
+    spent: float
+    remaining: float
+    daily_burn_rate: float
+    weekly_burn_rate: float
+    days_remaining: Optional[float] = None
+    exhaustion_date: Optional[date] = None
+    exhausted: bool
+    history: List[ForecastPoint]
+
 class TransactionBase(BaseModel):
     amount: float
     category_id: int
@@ -35,14 +70,90 @@ class TransactionBase(BaseModel):
 
 class TransactionCreate(TransactionBase):
     budget_id: int
+    # Defaults to the budget's currency; other currencies are converted into it.
+    currency: Optional[str] = Field(None, pattern=CURRENCY_PATTERN)
 
 class TransactionResponse(TransactionBase):
     id: int
     budget_id: int
+    currency: Optional[str] = None
+    original_amount: Optional[float] = None
 
     class Config:
         from_attributes = True
 
+class TransactionPage(BaseModel):
+    items: List[TransactionResponse]
+    next_cursor: Optional[str] = None
+
+class AnomalyResponse(TransactionResponse):
+    anomaly_score: Optional[float] = None
+
+class AnomalyPage(BaseModel):
+    items: List[AnomalyResponse]
+    next_cursor: Optional[str] = None
+
 class TransactionUpdate(BaseModel):
     amount: Optional[float] = None
-    category: Optional[str] = None
\ No newline at end of file
+    category: Optional[str] = None
+
+class CategorySpend(BaseModel):
+    category_id: Optional[int] = None
+    category: Optional[str] = None
+    spent: float
+    count: int
+
+class BudgetOverview(BaseModel):
+    id: int
+    name: str
+    currency: str
+    amount: float
+    spent: float
+    remaining: float
+    categories: List[CategorySpend]
+    latest_transactions: List[TransactionResponse]
+
+class CategoryBase(BaseModel):
+    name: str
+
+class CategoryCreate(CategoryBase):
+    pass
+
+class CategoryResponse(CategoryBase):
+    id: int
+    is_custom: bool
+    user_id: Optional[int] = None
+
+    class Config:
+        from_attributes = True
+
+class BulkTransactionError(BaseModel):
+    row: int
+    error: str
+
+class BulkTransactionResult(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    elapsed_seconds: float
+    rows_per_second: float
+    errors: List[BulkTransactionError]
+
+class ReportCreate(BaseModel):
+    kind: Literal["category_year", "rollups"]
+    year: Optional[int] = None
+    budget_id: Optional[int] = None
+    # category_year only: report in this currency instead of each budget's.
+    currency: Optional[str] = Field(None, pattern=CURRENCY_PATTERN)
+
+class ReportJobResponse(BaseModel):
+    id: int
+    kind: str
+    params: Dict[str, Any]
+    state: str
+    progress: float
+    error: Optional[str] = None
+    result_url: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
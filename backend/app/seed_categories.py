@@ -1,8 +1,10 @@
 # app/seed_categories.py
 
+from sqlalchemy import insert, select
 from sqlalchemy.orm import Session
-from app.db import engine, SessionLocal
+from app.db import dialect_insert, engine
 from app.models import Category
+from app.services import data_version_statement
 
 # Define the predefined categories
 PREDEFINED_CATEGORIES = [
@@ -19,13 +21,22 @@ PREDEFINED_CATEGORIES = [
 def seed_categories():
     session = Session(bind=engine)
     try:
-        for category_name in PREDEFINED_CATEGORIES:
-            # Check if category already exists
-            existing_category = session.query(Category).filter_by(name=category_name).first()
-            if not existing_category:
-                category = Category(name=category_name, is_custom=False)
-                session.add(category)
-        
+        rows = [{"name": name, "is_custom": False} for name in PREDEFINED_CATEGORIES]
+        stmt = dialect_insert(session, Category)
+        if stmt is not None:
+            # One round trip; names that already exist are left alone.
+            added = session.execute(stmt.values(rows).on_conflict_do_nothing(index_elements=["name"])).rowcount > 0
+        else:
+            existing = set(session.scalars(select(Category.name).where(Category.name.in_(PREDEFINED_CATEGORIES))))
+            missing = [row for row in rows if row["name"] not in existing]
+            if missing:
+                session.execute(insert(Category), missing)
+            added = bool(missing)
+
+        # Invalidate cached category lists (see app.conditional)
+        statement = data_version_statement(session, [("categories", 0)]) if added else None
+        if statement is not None:
+            session.execute(*statement)
         session.commit()
         print("Categories seeded successfully!")
     except Exception as e:
@@ -34,7 +45,6 @@ def seed_categories():
     finally:
         session.close()
 
-
 if __name__ == "__main__":
     seed_categories()
 
@@ -0,0 +1,32 @@
+# app/serialization.py
+
+import os
+from functools import lru_cache
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import TypeAdapter
+
+# Rows selected from our own tables are trusted and encoded as-is. Set to true
+# to run them through the response schema (in one TypeAdapter call) first.
+VALIDATE_RESPONSES = os.getenv("VALIDATE_RESPONSES", "false").lower() in ("1", "true", "yes")
+
+
+@lru_cache(maxsize=None)
+def _adapter(schema):
+    return TypeAdapter(schema)
+
+
+def rows_to_dicts(rows):
+    """Convert column rows (sqlalchemy Row objects) to plain dicts."""
+    return [dict(row._mapping) for row in rows]
+
+
+def json_response(content, schema=None, validate: bool = VALIDATE_RESPONSES) -> Response:
+    """Encode content straight to JSON, bypassing per-object response_model work.
+
+    With validate set and a schema given, content is validated and dumped by
+    pydantic-core in bulk; otherwise it is encoded with orjson.
+    """
+    if validate and schema is not None:
+        adapter = _adapter(schema)
+        return Response(adapter.dump_json(adapter.validate_python(content)), media_type="application/json")
+    return ORJSONResponse(content)
@@ -1,34 +1,64 @@
-from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 import os
-from datetime import datetime, timedelta
+import base64
+import json
+import logging
+import math
+import time
+from collections import defaultdict
+from datetime import date, datetime, timedelta
 from jose import jwt, JWTError
-from app.models import User, Transaction
-from app.db import SessionLocal
-from sqlalchemy.orm import Session
-from . import models, schemas
+from pydantic import ValidationError
+from app.cache import TTLCache
+from app.catalog import CATALOG_MISS_RELOAD_SECONDS, catalog
+from app.pubsub import broker
+from app.models import DataVersion, User, Transaction, SpendRollup
+from app.db import dialect_insert, get_db, tuple_in
+from sqlalchemy import delete, event, func, insert, select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, make_transient_to_detached
+from . import anomalies, fx, models, schemas
 from app.schemas import TransactionCreate, TransactionUpdate
 
+logger = logging.getLogger("app.services")
+
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key")
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+BULK_CHUNK_SIZE = int(os.getenv("BULK_CHUNK_SIZE", "1000"))
+DEFAULT_PAGE_SIZE = 50
+OVERVIEW_LATEST_TRANSACTIONS = 5
+MAX_PAGE_SIZE = 500
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL_SECONDS = float(os.getenv("AUTH_CACHE_TTL_SECONDS", "60"))
 
-# Set up the password context for hashing
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Columns selected by list endpoints instead of full ORM objects.
+BUDGET_COLUMNS = (
+    models.Budget.id, models.Budget.name, models.Budget.amount, models.Budget.currency, models.Budget.owner_id,
+)
+TRANSACTION_COLUMNS = (
+    Transaction.id, Transaction.budget_id, Transaction.category_id, Transaction.date, Transaction.amount,
+    Transaction.currency, Transaction.original_amount,
+)
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-def get_db():
-    """Provides a database session."""
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Maps a bearer token to a detached snapshot of the user it resolved to.
+principal_cache = TTLCache(maxsize=AUTH_CACHE_SIZE, ttl=AUTH_CACHE_TTL_SECONDS)
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_db)):
+    """Retrieve the currently authenticated user from the JWT token.
+
+    Resolved users are cached per token until the token expires or the cache
+    TTL passes, so repeat requests skip the users lookup entirely. The user id
+    is recorded on the session for read-your-writes replica routing.
+    """
+    cached = principal_cache.get(token)
+    if cached is not None:
+        db.info["principal"] = cached.id
+        return await db.merge(cached, load=False)
 
-def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-    """Retrieve the currently authenticated user from the JWT token."""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -42,19 +72,69 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     except JWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.email == email).first()
+    user = await get_user_by_email(db, email)
     if user is None:
         raise credentials_exception
 
+    expires_in = payload["exp"] - time.time() if "exp" in payload else None
+    principal_cache.set(token, _snapshot_user(user), ttl=expires_in)
+    db.info["principal"] = user.id
     return user
 
-def get_password_hash(password: str) -> str:
-    """Hash a plain password using bcrypt."""
-    return pwd_context.hash(password)
+def _snapshot_user(user: User) -> User:
+    """Copy the user's columns into a detached instance that is safe to share."""
+    snapshot = User(id=user.id, email=user.email, hashed_password=user.hashed_password)
+    make_transient_to_detached(snapshot)
+    return snapshot
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verify a plain password against its hashed version."""
-    return pwd_context.verify(plain_password, hashed_password)
+def invalidate_user(user_id: int):
+    """Drop every cached token that resolves to user_id."""
+    return principal_cache.invalidate_where(lambda token, user: user.id == user_id)
+
+# Users changed by a session, dropped from the cache once it commits: flush
+# events fire before the change is visible to other sessions, and a
+# concurrent request could re-cache the old row in between. ALL_USERS stands
+# for a bulk UPDATE/DELETE, whose rows aren't known.
+ALL_USERS = object()
+
+def _stale_users(session: Session) -> set:
+    return session.info.setdefault("stale_users", set())
+
+@event.listens_for(Session, "after_flush")
+def _collect_flushed_users(session, flush_context):
+    _stale_users(session).update(
+        obj.id for obj in (*session.dirty, *session.deleted) if isinstance(obj, User)
+    )
+
+@event.listens_for(Session, "do_orm_execute")
+def _collect_bulk_user_writes(orm_execute_state):
+    if orm_execute_state.is_update or orm_execute_state.is_delete:
+        if orm_execute_state.statement.table.name == User.__tablename__:
+            _stale_users(orm_execute_state.session).add(ALL_USERS)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_committed_users(session):
+    stale = session.info.pop("stale_users", None)
+    if not stale:
+        return
+    if ALL_USERS in stale:
+        principal_cache.clear()
+    else:
+        principal_cache.invalidate_where(lambda token, user: user.id in stale)
+
+@event.listens_for(Session, "after_rollback")
+def _forget_stale_users(session):
+    session.info.pop("stale_users", None)
+
+async def get_user_by_email(db: AsyncSession, email: str):
+    return await db.scalar(select(User).where(User.email == email))
+
+async def create_user(db: AsyncSession, email: str, hashed_password: str):
+    new_user = User(email=email, hashed_password=hashed_password)
+    db.add(new_user)
+    await db.commit()
+    await db.refresh(new_user)
+    return new_user
 
 def create_access_token(data: dict, expires_delta: timedelta = None):
     """Create a JWT access token."""
@@ -67,76 +147,752 @@ def create_access_token(data: dict, expires_delta: timedelta = None):
     encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
     return encoded_jwt
 
-def create_budget(db: Session, budget: schemas.BudgetCreate, owner_id: int):
-    db_budget = models.Budget(**budget.dict(), owner_id=owner_id)
+async def create_budget(db: AsyncSession, budget: schemas.BudgetCreate, owner_id: int):
+    db_budget = models.Budget(**budget.dict(exclude_none=True), owner_id=owner_id)
     db.add(db_budget)
-    db.commit()
-    db.refresh(db_budget)
+    await bump_data_versions(db, [budgets_version_key(owner_id)])
+    await db.commit()
+    await db.refresh(db_budget)
     return db_budget
 
-def get_budgets(db: Session, owner_id: int):
-    return db.query(models.Budget).filter(models.Budget.owner_id == owner_id).all()
+async def get_budgets(db: AsyncSession, owner_id: int):
+    return (await db.scalars(select(models.Budget).where(models.Budget.owner_id == owner_id))).all()
+
+async def get_budget_rows(db: AsyncSession, owner_id: int):
+    """Like get_budgets, but returns plain column rows for serialization."""
+    return (await db.execute(select(*BUDGET_COLUMNS).where(models.Budget.owner_id == owner_id))).all()
 
-def update_budget(db: Session, budget_id: int, budget: schemas.BudgetCreate, owner_id: int):
-    db_budget = db.query(models.Budget).filter(models.Budget.id == budget_id, models.Budget.owner_id == owner_id).first()
+async def update_budget(db: AsyncSession, budget_id: int, budget: schemas.BudgetCreate, owner_id: int):
+    db_budget = await get_budget(db, budget_id, owner_id)
     if db_budget:
-        for key, value in budget.dict().items():
+        values = budget.dict(exclude_none=True)
+        if values.get("currency", db_budget.currency) != db_budget.currency and await db.scalar(
+            select(SpendRollup.budget_id).where(SpendRollup.budget_id == budget_id, SpendRollup.count > 0).limit(1)
+        ) is not None:
+            # Its amounts are stored in the old currency.
+            raise HTTPException(status_code=409, detail="Can't change the currency of a budget with transactions.")
+        for key, value in values.items():
             setattr(db_budget, key, value)
-        db.commit()
-        db.refresh(db_budget)
+        await bump_data_versions(db, [budgets_version_key(owner_id)])
+        await db.commit()
+        await db.refresh(db_budget)
+        await publish_budget_balances(db, [budget_id])
     return db_budget
 
-def delete_budget(db: Session, budget_id: int, owner_id: int):
-    db_budget = db.query(models.Budget).filter(models.Budget.id == budget_id, models.Budget.owner_id == owner_id).first()
+async def get_budget(db: AsyncSession, budget_id: int, owner_id: int):
+    return await db.scalar(select(models.Budget).where(models.Budget.id == budget_id, models.Budget.owner_id == owner_id))
+
+async def delete_budget(db: AsyncSession, budget_id: int, owner_id: int):
+    db_budget = await get_budget(db, budget_id, owner_id)
     if db_budget:
-        db.delete(db_budget)
-        db.commit()
+        await db.execute(delete(SpendRollup).where(SpendRollup.budget_id == budget_id))
+        await db.delete(db_budget)
+        await bump_data_versions(db, [budgets_version_key(owner_id), transactions_version_key(budget_id)])
+        await db.commit()
     return db_budget
 
-def create_transaction(db: Session, transaction_data: TransactionCreate):
-    """Create a new transaction."""
-    new_transaction = Transaction(
-        amount=transaction_data.amount,
-        category=transaction_data.category,
-        budget_id=transaction_data.budget_id
+def budgets_version_key(owner_id: int):
+    return ("budgets", owner_id)
+
+
+def categories_version_keys(user_id: int):
+    """Version keys for a user's category list: global categories plus their own."""
+    return [("categories", 0), ("categories", user_id)]
+
+
+def transactions_version_key(budget_id: int):
+    return ("transactions", budget_id)
+
+
+def data_version_statement(db, keys):
+    """Return (statement, params) incrementing each (scope, key) version, or None.
+
+    Works with sync and async sessions; None means the dialect has no upsert.
+    """
+    stmt = dialect_insert(db, DataVersion)
+    if stmt is None:
+        return None
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["scope", "key"], set_={"version": DataVersion.version + 1}
+    )
+    # Sorted so concurrent writers lock the rows in the same order.
+    return stmt, [{"scope": scope, "key": key, "version": 1} for scope, key in sorted(set(keys))]
+
+
+async def bump_data_versions(db: AsyncSession, keys):
+    """Bump data versions inside the caller's transaction."""
+    if not keys:
+        return
+    statement = data_version_statement(db, keys)
+    if statement is not None:
+        await db.execute(*statement)
+        return
+    for scope, key in sorted(set(keys)):
+        version = await db.get(DataVersion, (scope, key))
+        if version is None:
+            db.add(DataVersion(scope=scope, key=key, version=1))
+        else:
+            version.version += 1
+
+
+async def get_data_versions(db: AsyncSession, keys):
+    """Return the current version of each (scope, key), 0 if it was never bumped."""
+    rows = await db.execute(
+        select(DataVersion.scope, DataVersion.key, DataVersion.version)
+        .where(tuple_in(db, (DataVersion.scope, DataVersion.key), keys))
+    )
+    versions = {(scope, key): version for scope, key, version in rows}
+    return [versions.get(tuple(key), 0) for key in keys]
+
+
+def period_for(value: datetime) -> date:
+    """Return the rollup period (first day of the month) for a transaction date."""
+    return date(value.year, value.month, 1)
+
+
+def _rollup_key(budget_id: int, category_id: int, value: datetime):
+    if budget_id is None or value is None:
+        return None
+    return budget_id, period_for(value), category_id or 0
+
+
+async def apply_rollup_deltas(db: AsyncSession, deltas):
+    """Add {(budget_id, period, category_id): [total, count]} deltas to the rollups.
+
+    Runs inside the caller's transaction so rollups commit atomically with the
+    transaction rows they describe.
+    """
+    if not deltas:
+        return
+    values = [
+        {"budget_id": budget_id, "period": period, "category_id": category_id,
+         "total": total, "count": count}
+        for (budget_id, period, category_id), (total, count) in (
+            (key, delta) for key, delta in deltas.items() if key is not None
+        )
+    ]
+    if not values:
+        return
+    stmt = dialect_insert(db, SpendRollup)
+    if stmt is not None:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["budget_id", "period", "category_id"],
+            set_={
+                "total": SpendRollup.total + stmt.excluded.total,
+                "count": SpendRollup.count + stmt.excluded.count,
+            },
+        )
+        await db.execute(stmt, values)
+        return
+    for value in values:
+        rollup = await db.get(SpendRollup, (value["budget_id"], value["period"], value["category_id"]))
+        if rollup is None:
+            db.add(SpendRollup(**value))
+        else:
+            rollup.total += value["total"]
+            rollup.count += value["count"]
+
+
+async def rebuild_rollups(db: AsyncSession, budget_id: int = None):
+    """Recompute rollups from the transactions table, e.g. after a backfill.
+
+    Months archived with app.partitions are no longer in the table, so their
+    rollups are dropped.
+    """
+    clear = delete(SpendRollup)
+    rows = select(Transaction.budget_id, Transaction.category_id, Transaction.date, Transaction.amount)
+    if budget_id is not None:
+        clear = clear.where(SpendRollup.budget_id == budget_id)
+        rows = rows.where(Transaction.budget_id == budget_id)
+    await db.execute(clear)
+
+    deltas = defaultdict(lambda: [0.0, 0])
+    result = await db.stream(rows.execution_options(yield_per=10000))
+    async for row in result:
+        delta = deltas[_rollup_key(row.budget_id, row.category_id, row.date)]
+        delta[0] += row.amount
+        delta[1] += 1
+    await apply_rollup_deltas(db, deltas)
+    await db.commit()
+    return len(deltas) - (None in deltas)
+
+
+async def get_budget_summary(
+    db: AsyncSession, budget: models.Budget, period_from: date = None, period_to: date = None, currency: str = None,
+):
+    """Summarise spend against a budget from the rollup table.
+
+    With a currency other than the budget's, the amount is converted at
+    today's rate and each month's totals at the rate as of its first day.
+    """
+    query = select(SpendRollup).where(
+        SpendRollup.budget_id == budget.id, SpendRollup.count > 0
+    )
+    if period_from is not None:
+        query = query.where(SpendRollup.period >= period_for(period_from))
+    if period_to is not None:
+        query = query.where(SpendRollup.period <= period_for(period_to))
+    rollups = (await db.scalars(query.order_by(SpendRollup.period, SpendRollup.category_id))).all()
+
+    currency = currency or budget.currency
+    amount = budget.amount
+    totals = [rollup.total for rollup in rollups]
+    if currency != budget.currency:
+        table = await fx.rates.get()
+        # The budget amount and every month's total in one pass.
+        converted = table.convert(
+            [budget.amount] + totals, [datetime.utcnow().date()] + [rollup.period for rollup in rollups],
+            budget.currency, currency,
+        ).tolist()
+        if any(math.isnan(value) for value in converted):
+            detail = f"No {budget.currency}/{currency} exchange rate for these periods."
+            raise HTTPException(status_code=422, detail=detail)
+        amount, totals = converted[0], converted[1:]
+
+    spent = sum(totals)
+    return {
+        "budget_id": budget.id,
+        "currency": currency,
+        "amount": amount,
+        "spent": spent,
+        "remaining": amount - spent,
+        "rollups": [
+            {
+                "period": rollup.period,
+                "category_id": rollup.category_id or None,
+                "total": total,
+                "count": rollup.count,
+            }
+            for rollup, total in zip(rollups, totals)
+        ],
+    }
+
+
+async def get_budget_overview(db: AsyncSession, owner_id: int, latest: int = OVERVIEW_LATEST_TRANSACTIONS):
+    """Every budget of owner_id with spend totals, a per-category breakdown and its latest transactions.
+
+    Two statements however many budgets there are: one aggregate over the
+    rollups grouped by budget and category, and one window query numbering
+    each budget's transactions newest first.
+    """
+    spent = func.coalesce(func.sum(SpendRollup.total), 0.0)
+    count = func.coalesce(func.sum(SpendRollup.count), 0)
+    totals = await db.execute(
+        select(
+            models.Budget.id, models.Budget.name, models.Budget.currency, models.Budget.amount,
+            SpendRollup.category_id, models.Category.name, spent, count,
+        )
+        .outerjoin(SpendRollup, SpendRollup.budget_id == models.Budget.id)
+        .outerjoin(models.Category, models.Category.id == SpendRollup.category_id)
+        .where(models.Budget.owner_id == owner_id)
+        .group_by(
+            models.Budget.id, models.Budget.name, models.Budget.currency, models.Budget.amount,
+            SpendRollup.category_id, models.Category.name,
+        )
+        .order_by(models.Budget.id, SpendRollup.category_id)
+    )
+    overview = {}
+    for budget_id, name, currency, amount, category_id, category, total, rows in totals:
+        budget = overview.get(budget_id)
+        if budget is None:
+            budget = overview[budget_id] = {
+                "id": budget_id, "name": name, "currency": currency, "amount": amount,
+                "spent": 0.0, "remaining": amount, "categories": [], "latest_transactions": [],
+            }
+        if category_id is None or not rows:
+            continue  # no rollups, or only deleted transactions
+        budget["spent"] += total
+        budget["remaining"] = amount - budget["spent"]
+        budget["categories"].append({
+            "category_id": category_id or None,
+            "category": category,
+            "spent": total,
+            "count": rows,
+        })
+
+    if latest > 0 and overview:
+        position = func.row_number().over(
+            partition_by=Transaction.budget_id, order_by=(Transaction.date.desc(), Transaction.id.desc())
+        ).label("position")
+        ranked = (
+            select(*TRANSACTION_COLUMNS, position)
+            .where(Transaction.budget_id.in_(list(overview)))
+            .subquery()
+        )
+        rows = await db.execute(
+            select(*(ranked.c[column.key] for column in TRANSACTION_COLUMNS))
+            .where(ranked.c.position <= latest)
+            .order_by(ranked.c.budget_id, ranked.c.position)
+        )
+        for row in rows.mappings():
+            overview[row["budget_id"]]["latest_transactions"].append(dict(row))
+    return list(overview.values())
+
+
+def balance_topic(owner_id: int) -> str:
+    return f"budgets:{owner_id}"
+
+
+async def get_budget_balances(db: AsyncSession, budget_ids=None, owner_id: int = None):
+    """Return amount/spent/remaining for budgets, summed from the rollups in one query."""
+    spent = func.coalesce(func.sum(SpendRollup.total), 0.0)
+    query = (
+        select(models.Budget.id, models.Budget.owner_id, models.Budget.amount, spent)
+        .outerjoin(SpendRollup, SpendRollup.budget_id == models.Budget.id)
+        .group_by(models.Budget.id, models.Budget.owner_id, models.Budget.amount)
+        .order_by(models.Budget.id)
+    )
+    if budget_ids is not None:
+        query = query.where(models.Budget.id.in_(budget_ids))
+    if owner_id is not None:
+        query = query.where(models.Budget.owner_id == owner_id)
+    return [
+        {"budget_id": budget_id, "owner_id": owner, "amount": amount, "spent": total, "remaining": amount - total}
+        for budget_id, owner, amount, total in await db.execute(query)
+    ]
+
+
+async def publish_budget_balances(db: AsyncSession, budget_ids):
+    """Push the new balances of budget_ids to their owners' subscribers.
+
+    Called after the write commits. Skipped without a query when no
+    subscriber can be listening.
+    """
+    budget_ids = {budget_id for budget_id in budget_ids if budget_id is not None}
+    if not budget_ids or broker.idle():
+        return
+    try:
+        balances = await get_budget_balances(db, budget_ids)
+    except Exception:
+        # Best effort: the write itself has already committed.
+        logger.exception("Could not load balances to publish")
+        return
+    for balance in balances:
+        topic = balance_topic(balance["owner_id"])
+        if broker.wants(topic):
+            await broker.publish(topic, balance)
+
+
+async def convert_to_budget_currency(db: AsyncSession, values):
+    """Convert rows entered in another currency into their budget's, in place.
+
+    Such rows keep what was entered in currency/original_amount and get
+    amount converted at the rate as of their date, in one vectorized pass
+    over the batch; rows already in the budget's currency get currency None.
+    Returns (index, error) pairs for the rows no rate was found for, which
+    are left unconverted.
+    """
+    pending = [
+        index for index, value in enumerate(values) if value.get("currency") and value.get("original_amount") is None
+    ]
+    for value in values:
+        value.setdefault("currency", None)
+        value.setdefault("original_amount", None)
+    if not pending:
+        return []
+    currencies = dict((await db.execute(
+        select(models.Budget.id, models.Budget.currency)
+        .where(models.Budget.id.in_({values[index]["budget_id"] for index in pending}))
+    )).all())
+    targets = {}
+    for index in pending:
+        value = values[index]
+        target = currencies.get(value["budget_id"])
+        if target is None or value["currency"] == target:
+            value["currency"] = None
+        else:
+            targets[index] = target
+    if not targets:
+        return []
+
+    table = await fx.rates.get()
+    converted = table.convert(
+        [values[index]["amount"] for index in targets],
+        [values[index]["date"] for index in targets],
+        [values[index]["currency"] for index in targets],
+        list(targets.values()),
     )
+    errors = []
+    for (index, target), amount in zip(targets.items(), converted.tolist()):
+        value = values[index]
+        if math.isnan(amount):
+            errors.append((index, f"No {value['currency']}/{target} rate on or before {value['date']:%Y-%m-%d}"))
+        else:
+            value["original_amount"], value["amount"] = value["amount"], amount
+    return errors
+
+
+async def _convert_or_raise(db: AsyncSession, values):
+    errors = await convert_to_budget_currency(db, values)
+    if errors:
+        raise HTTPException(status_code=422, detail=errors[0][1])
+
+
+async def create_transaction(db: AsyncSession, transaction_data: TransactionCreate):
+    """Create a new transaction."""
+    value = {
+        "amount": transaction_data.amount,
+        "category_id": transaction_data.category_id,
+        "date": transaction_data.date or datetime.utcnow(),
+        "budget_id": transaction_data.budget_id,
+        "currency": transaction_data.currency,
+    }
+    await _convert_or_raise(db, [value])
+    await anomalies.observe(db, [value])
+    new_transaction = Transaction(**value)
     db.add(new_transaction)
-    db.commit()
-    db.refresh(new_transaction)
+    await apply_rollup_deltas(db, {
+        _rollup_key(new_transaction.budget_id, new_transaction.category_id, new_transaction.date):
+            (new_transaction.amount, 1),
+    })
+    await bump_data_versions(db, [transactions_version_key(new_transaction.budget_id)])
+    await db.commit()
+    await db.refresh(new_transaction)
+    await publish_budget_balances(db, [new_transaction.budget_id])
     return new_transaction
 
 
-def get_transactions_by_budget(db: Session, budget_id: int):
+async def write_transactions(db: AsyncSession, values, returning: bool = False):
+    """Insert validated transaction rows in one statement and commit them.
+
+    values are dicts with amount, category_id, budget_id, date and
+    optionally currency. Rows in another currency are converted into their
+    budget's and each row is scored against its category stats first
+    (see convert_to_budget_currency), and rollups and data
+    versions are updated in the same transaction; balances are published
+    after the commit. With returning, the inserted rows (with ids) come back
+    in the order of values.
+    """
+    await _convert_or_raise(db, values)
+    await anomalies.observe(db, values)
+    deltas = defaultdict(lambda: [0.0, 0])
+    for value in values:
+        delta = deltas[_rollup_key(value["budget_id"], value["category_id"], value["date"])]
+        delta[0] += value["amount"]
+        delta[1] += 1
+
+    if returning:
+        stmt = insert(Transaction).returning(*TRANSACTION_COLUMNS, sort_by_parameter_order=True)
+        rows = (await db.execute(stmt, values)).all()
+    else:
+        await db.execute(insert(Transaction), values)
+        rows = None
+    await apply_rollup_deltas(db, deltas)
+    await bump_data_versions(db, [transactions_version_key(value["budget_id"]) for value in values])
+    await db.commit()
+    await publish_budget_balances(db, [value["budget_id"] for value in values])
+    return rows
+
+
+async def get_owned_budget_ids(db: AsyncSession, owner_id: int, budget_ids):
+    """Return the subset of budget_ids owned by owner_id, in one query."""
+    if not budget_ids:
+        return set()
+    rows = await db.scalars(select(models.Budget.id).where(
+        models.Budget.id.in_(budget_ids), models.Budget.owner_id == owner_id
+    ))
+    return set(rows)
+
+
+async def resolve_category(name: str, user_id: int = None):
+    """Look a category up by name in the catalog; None if it doesn't exist (or isn't visible to user_id)."""
+    snapshot = await catalog.get()
+    category = snapshot.resolve(name, user_id)
+    if category is None and name not in snapshot.by_name:
+        category = (await catalog.get(max_age=CATALOG_MISS_RELOAD_SECONDS)).resolve(name, user_id)
+    return category
+
+
+async def get_visible_category_ids(owner_id: int, category_ids):
+    """Return the subset of category_ids that are global or belong to owner_id."""
+    if not category_ids:
+        return set()
+    snapshot = await catalog.get()
+    if not all(category_id in snapshot.by_id for category_id in category_ids):
+        # Possibly created on another worker since the snapshot was taken.
+        snapshot = await catalog.get(max_age=CATALOG_MISS_RELOAD_SECONDS)
+    return {category_id for category_id in category_ids if snapshot.is_visible(category_id, owner_id)}
+
+
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}"
+        for error in exc.errors()
+    )
+
+
+async def bulk_create_transactions(db: AsyncSession, rows, owner_id: int):
+    """Validate and insert one chunk of raw transaction rows.
+
+    `rows` is a list of (row_number, dict) pairs. Budget and category
+    ownership is checked once for the whole chunk and the valid rows are
+    written with a single multi-row insert. Returns the number of inserted
+    rows and a list of (row_number, error) pairs.
+    """
+    errors = []
+    valid = []
+    for row_number, raw in rows:
+        try:
+            valid.append((row_number, TransactionCreate.model_validate(raw)))
+        except ValidationError as exc:
+            errors.append((row_number, _format_validation_error(exc)))
+
+    budget_ids = await get_owned_budget_ids(db, owner_id, {tx.budget_id for _, tx in valid})
+    category_ids = await get_visible_category_ids(owner_id, {tx.category_id for _, tx in valid})
+
+    now = datetime.utcnow()
+    values = []
+    row_numbers = []
+    for row_number, tx in valid:
+        if tx.budget_id not in budget_ids:
+            errors.append((row_number, "Budget not found"))
+        elif tx.category_id not in category_ids:
+            errors.append((row_number, "Category not found"))
+        else:
+            values.append({
+                "amount": tx.amount,
+                "category_id": tx.category_id,
+                "budget_id": tx.budget_id,
+                "date": tx.date or now,
+                "currency": tx.currency,
+            })
+            row_numbers.append(row_number)
+
+    missing = await convert_to_budget_currency(db, values)
+    if missing:
+        errors.extend((row_numbers[index], error) for index, error in missing)
+        skipped = {index for index, _ in missing}
+        values = [value for index, value in enumerate(values) if index not in skipped]
+    if values:
+        await write_transactions(db, values)
+    return len(values), errors
+
+
+async def get_transactions_by_budget(db: AsyncSession, budget_id: int):
     """Retrieve transactions for a specific budget."""
-    return db.query(Transaction).filter(Transaction.budget_id == budget_id).all()
+    return (await db.scalars(select(Transaction).where(Transaction.budget_id == budget_id))).all()
+
+
+def encode_cursor(transaction: Transaction) -> str:
+    """Encode the (date, id) keyset position of a transaction as an opaque string."""
+    raw = json.dumps([transaction.date.isoformat(), transaction.id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    """Decode a cursor produced by encode_cursor. Raises ValueError if malformed."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        date, transaction_id = json.loads(raw)
+        return datetime.fromisoformat(date), int(transaction_id)
+    except (TypeError, ValueError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+async def transaction_date_bounds(
+    db: AsyncSession, budget_id: int = None, owner_id: int = None, budget_ids=None, category_id: int = None,
+):
+    """Return a [start, end) datetime range holding every matching transaction, or None.
+
+    Read from the spend rollups, which are kept in step with every write.
+    Transaction queries add it as an explicit date range so PostgreSQL can
+    skip the partitions outside it instead of probing each one. None means
+    there are no rollups to go by, and the caller queries without a range.
+    """
+    query = select(func.min(SpendRollup.period), func.max(SpendRollup.period))
+    if budget_id is not None:
+        query = query.where(SpendRollup.budget_id == budget_id)
+    if budget_ids is not None:
+        query = query.where(SpendRollup.budget_id.in_(budget_ids))
+    if category_id is not None:
+        query = query.where(SpendRollup.category_id == category_id)
+    if owner_id is not None:
+        query = query.join(models.Budget, models.Budget.id == SpendRollup.budget_id).where(
+            models.Budget.owner_id == owner_id
+        )
+    first, last = (await db.execute(query)).one()
+    if first is None:
+        return None
+    end = period_for(last + timedelta(days=31))
+    return datetime(first.year, first.month, 1), datetime(end.year, end.month, 1)
+
+
+def date_bounds_clause(bounds):
+    """WHERE clauses for a transaction_date_bounds range; none for an unknown one."""
+    if bounds is None:
+        return ()
+    start, end = bounds
+    return Transaction.date >= start, Transaction.date < end
+
+
+def keyset_clause(cursor: str):
+    """WHERE clauses for rows after cursor in (date, id) DESC order.
 
+    The separate date comparison is redundant with the row comparison but is
+    what lets the planner prune partitions. Raises ValueError for a bad cursor.
+    """
+    position = decode_cursor(cursor)
+    return tuple_(Transaction.date, Transaction.id) < position, Transaction.date <= position[0]
 
-def get_transaction_by_id(db: Session, transaction_id: int):
-    """Retrieve a transaction by its ID."""
-    return db.query(Transaction).filter(Transaction.id == transaction_id).first()
 
+async def list_transactions(
+    db: AsyncSession,
+    budget_id: int = None,
+    category_id: int = None,
+    owner_id: int = None,
+    date_from: datetime = None,
+    date_to: datetime = None,
+    min_amount: float = None,
+    max_amount: float = None,
+    cursor: str = None,
+    limit: int = DEFAULT_PAGE_SIZE,
+):
+    """Return one page of transactions, newest first, and the cursor for the next page.
 
-def update_transaction(db: Session, transaction_id: int, transaction_data: TransactionUpdate):
-    """Update an existing transaction."""
-    transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
+    Pages are keyed on (date, id) so fetching a deep page costs the same as
+    fetching the first one. Rows are plain column tuples, not ORM objects.
+    With owner_id, only transactions in that user's budgets are returned.
+    """
+    query = select(*TRANSACTION_COLUMNS)
+    if owner_id is not None:
+        # A subquery rather than a join, which with the date range would lead
+        # SQLite into the budget index and a sort instead of walking the
+        # category index in order.
+        query = query.where(Transaction.budget_id.in_(
+            select(models.Budget.id).where(models.Budget.owner_id == owner_id)
+        ))
+    if budget_id is not None or owner_id is not None:
+        bounds = await transaction_date_bounds(db, budget_id=budget_id, owner_id=owner_id, category_id=category_id)
+        query = query.where(*date_bounds_clause(bounds))
+    if budget_id is not None:
+        query = query.where(Transaction.budget_id == budget_id)
+    if category_id is not None:
+        query = query.where(Transaction.category_id == category_id)
+    if date_from is not None:
+        query = query.where(Transaction.date >= date_from)
+    if date_to is not None:
+        query = query.where(Transaction.date < date_to)
+    if min_amount is not None:
+        query = query.where(Transaction.amount >= min_amount)
+    if max_amount is not None:
+        query = query.where(Transaction.amount <= max_amount)
+    if cursor is not None:
+        query = query.where(*keyset_clause(cursor))
+
+    rows = (await db.execute(
+        query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit + 1)
+    )).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+# Spelled exactly like the predicate of ix_transactions_anomalies: SQLite only
+# uses a partial index when the query repeats it, and renders the Boolean
+# column itself as "is_anomaly = 1".
+ANOMALY_FLAGGED = text("transactions.is_anomaly")
+
+
+async def list_anomalies(db: AsyncSession, owner_id: int, cursor: str = None, limit: int = DEFAULT_PAGE_SIZE):
+    """Return one page of owner_id's flagged transactions, newest first.
+
+    Reads only the partial index on flagged rows, keyed on (date, id) like
+    list_transactions.
+    """
+    query = (
+        select(*TRANSACTION_COLUMNS, Transaction.anomaly_score)
+        .join(models.Budget, models.Budget.id == Transaction.budget_id)
+        .where(models.Budget.owner_id == owner_id, ANOMALY_FLAGGED)
+    )
+    bounds = await transaction_date_bounds(db, owner_id=owner_id)
+    query = query.where(*date_bounds_clause(bounds))
+    if cursor is not None:
+        query = query.where(*keyset_clause(cursor))
+
+    rows = (await db.execute(
+        query.order_by(Transaction.date.desc(), Transaction.id.desc()).limit(limit + 1)
+    )).all()
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+
+async def get_transaction_by_id(db: AsyncSession, transaction_id: int, owner_id: int = None):
+    """Retrieve a transaction by its ID; None if it isn't in one of owner_id's budgets.
+
+    There is no date to bound the lookup with, so on PostgreSQL it probes the
+    id index of every partition; each probe is a single index lookup.
+    """
+    query = select(Transaction).where(Transaction.id == transaction_id)
+    if owner_id is not None:
+        query = query.join(models.Budget, models.Budget.id == Transaction.budget_id).where(
+            models.Budget.owner_id == owner_id
+        )
+    return await db.scalar(query)
+
+
+async def update_transaction(db: AsyncSession, transaction_id: int, transaction_data: TransactionUpdate, owner_id: int):
+    """Update an existing transaction of owner_id's."""
+    transaction = await get_transaction_by_id(db, transaction_id, owner_id)
     if not transaction:
         return None
 
+    old_key = _rollup_key(transaction.budget_id, transaction.category_id, transaction.date)
+    old_amount = transaction.amount
+    old_category_id = transaction.category_id
+
     # Update fields only if provided
-    transaction.amount = transaction_data.amount or transaction.amount
-    transaction.category = transaction_data.category or transaction.category
+    if transaction_data.amount is not None and transaction.currency is not None:
+        # Entered in another currency, so the new amount is too.
+        value = {"amount": transaction_data.amount, "currency": transaction.currency,
+                 "date": transaction.date, "budget_id": transaction.budget_id}
+        await _convert_or_raise(db, [value])
+        transaction.amount, transaction.original_amount = value["amount"], value["original_amount"]
+        transaction.currency = value["currency"]
+    elif transaction_data.amount is not None:
+        transaction.amount = transaction_data.amount
+    if transaction_data.category is not None:
+        category = await resolve_category(transaction_data.category, owner_id)
+        if category is None:
+            raise HTTPException(status_code=404, detail="Category not found")
+        transaction.category_id = category["id"]
+
+    if transaction.amount != old_amount or transaction.category_id != old_category_id:
+        await anomalies.forget(db, [{
+            "budget_id": transaction.budget_id, "category_id": old_category_id, "amount": old_amount,
+        }])
+        value = {"budget_id": transaction.budget_id, "category_id": transaction.category_id, "amount": transaction.amount}
+        await anomalies.observe(db, [value])
+        transaction.anomaly_score = value["anomaly_score"]
+        transaction.is_anomaly = value["is_anomaly"]
 
-    db.commit()
-    db.refresh(transaction)
+    new_key = _rollup_key(transaction.budget_id, transaction.category_id, transaction.date)
+    deltas = defaultdict(lambda: [0.0, 0])
+    deltas[old_key][0] -= old_amount
+    deltas[old_key][1] -= 1
+    deltas[new_key][0] += transaction.amount
+    deltas[new_key][1] += 1
+    await apply_rollup_deltas(db, deltas)
+    await bump_data_versions(db, [transactions_version_key(transaction.budget_id)])
+    await db.commit()
+    await db.refresh(transaction)
+    await publish_budget_balances(db, [transaction.budget_id])
     return transaction
 
 
-def delete_transaction(db: Session, transaction_id: int):
-    """Delete a transaction."""
-    transaction = db.query(Transaction).filter(Transaction.id == transaction_id).first()
+async def delete_transaction(db: AsyncSession, transaction_id: int, owner_id: int):
+    """Delete a transaction of owner_id's."""
+    transaction = await get_transaction_by_id(db, transaction_id, owner_id)
     if not transaction:
         return None
 
-    db.delete(transaction)
-    db.commit()
+    await db.delete(transaction)
+    await anomalies.forget(db, [{
+        "budget_id": transaction.budget_id, "category_id": transaction.category_id, "amount": transaction.amount,
+    }])
+    await apply_rollup_deltas(db, {
+        _rollup_key(transaction.budget_id, transaction.category_id, transaction.date):
+            (-transaction.amount, -1),
+    })
+    await bump_data_versions(db, [transactions_version_key(transaction.budget_id)])
+    await db.commit()
+    await publish_budget_balances(db, [transaction.budget_id])
     return transaction
\ No newline at end of file
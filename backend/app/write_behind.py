@@ -0,0 +1,174 @@
+# app/write_behind.py
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+from app.db import open_session, recent_writers
+from app.metrics import Histogram
+from app.schemas import TransactionCreate
+from app.services import write_transactions
+
+logger = logging.getLogger("app.write_behind")
+
+# "direct" commits every POST /transactions/ on its own; "batched" hands them
+# to the group-commit writer below.
+TRANSACTION_WRITE_MODE = os.getenv("TRANSACTION_WRITE_MODE", "direct")
+WRITE_BATCH_MAX_ROWS = int(os.getenv("WRITE_BATCH_MAX_ROWS", "500"))
+WRITE_BATCH_MAX_DELAY_MS = float(os.getenv("WRITE_BATCH_MAX_DELAY_MS", "5"))
+# Callers wait for room once this many rows are queued.
+WRITE_QUEUE_SIZE = int(os.getenv("WRITE_QUEUE_SIZE", "10000"))
+
+BATCH_SIZE = Histogram(
+    "write_behind_batch_rows", "Rows per group commit.",
+    buckets=(1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500),
+)
+FLUSH_LATENCY = Histogram("write_behind_flush_seconds", "Time to insert and commit one batch.")
+WAIT_LATENCY = Histogram("write_behind_wait_seconds", "Time from enqueue until the caller's row committed.")
+
+
+class WriterUnavailable(RuntimeError):
+    """The writer isn't running and never took the row; write it directly instead."""
+
+
+class TransactionWriter:
+    """Group-commit writer for new transactions.
+
+    Callers enqueue a validated row and await a future; a single task
+    collects rows for up to max_delay_ms or max_rows, writes them with one
+    INSERT ... RETURNING and one commit, then resolves each future with its
+    row. If a batch fails, its rows are retried one by one so only the bad
+    rows fail. If the task itself dies, queued callers get WriterUnavailable
+    and the batch in flight, which may or may not have committed, an error.
+    """
+
+    def __init__(self, max_rows: int = WRITE_BATCH_MAX_ROWS, max_delay_ms: float = WRITE_BATCH_MAX_DELAY_MS):
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.queue = None
+        self.task = None
+        self.batch = []
+
+    @property
+    def running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    async def start(self):
+        self.queue = asyncio.Queue(WRITE_QUEUE_SIZE)
+        self.task = asyncio.get_running_loop().create_task(self._run())
+        self.task.add_done_callback(self._stopped)
+
+    def _stopped(self, task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Transaction writer died", exc_info=task.exception())
+        self._resolve(self.batch, exception=RuntimeError("Transaction writer stopped mid-batch"))
+        self.batch = []
+        self._fail_queued()
+
+    def _fail_queued(self):
+        while True:
+            try:
+                item = self.queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            if item is not None:
+                self._resolve([item], exception=WriterUnavailable("Transaction writer is not running"))
+
+    async def stop(self):
+        """Stop accepting rows and wait until everything queued is committed."""
+        if self.task is None:
+            return
+        task, self.task = self.task, None
+        await self.queue.put(None)
+        await task
+
+    async def submit(self, transaction: TransactionCreate, principal: int = None):
+        """Queue one transaction and return its committed row.
+
+        principal is the submitting user, kept on the primary afterwards like
+        any other writer (see app.db.RoutingSession).
+        """
+        if not self.running:
+            raise WriterUnavailable("Transaction writer is not running")
+        future = asyncio.get_running_loop().create_future()
+        value = {
+            "amount": transaction.amount,
+            "category_id": transaction.category_id,
+            "budget_id": transaction.budget_id,
+            "date": transaction.date or datetime.utcnow(),
+            "currency": transaction.currency,
+        }
+        await self.queue.put((value, principal, future, time.perf_counter()))
+        if not self.running:
+            # Died while we waited for room; nobody will take the row.
+            self._fail_queued()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            item = await self.queue.get()
+            if item is None:
+                break
+            batch = [item]
+            deadline = loop.time() + self.max_delay
+            while len(batch) < self.max_rows:
+                try:
+                    item = self.queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        item = await asyncio.wait_for(self.queue.get(), timeout)
+                    except asyncio.TimeoutError:
+                        break
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            self.batch = batch
+            await self._flush(batch)
+            self.batch = []
+
+    async def _flush(self, batch):
+        started = time.perf_counter()
+        try:
+            await self._write(batch)
+        except Exception as exc:
+            if len(batch) == 1:
+                self._resolve(batch, exception=exc)
+            else:
+                logger.warning("Batch of %d transactions failed, retrying row by row: %s", len(batch), exc)
+                for item in batch:
+                    try:
+                        await self._write([item])
+                    except Exception as row_exc:
+                        self._resolve([item], exception=row_exc)
+        BATCH_SIZE.observe(len(batch))
+        FLUSH_LATENCY.observe(time.perf_counter() - started)
+
+    async def _write(self, batch):
+        async with open_session() as db:
+            rows = await write_transactions(db, [value for value, _, _, _ in batch], returning=True)
+        for _, principal, _, _ in batch:
+            if principal is not None:
+                recent_writers.set(principal, True)
+        self._resolve(batch, rows=rows)
+
+    @staticmethod
+    def _resolve(batch, rows=None, exception=None):
+        now = time.perf_counter()
+        for index, (_, _, future, queued) in enumerate(batch):
+            if future.done():
+                continue  # the caller went away
+            if exception is not None:
+                future.set_exception(exception)
+            else:
+                future.set_result(rows[index])
+                WAIT_LATENCY.observe(now - queued)
+
+
+writer = TransactionWriter()
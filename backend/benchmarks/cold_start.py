@@ -0,0 +1,78 @@
+# benchmarks/cold_start.py
+#
+# Measures how long a fresh worker takes to become ready: it starts uvicorn,
+# polls /ready until it answers 200 and then times the first few requests
+# against the warm (or cold) pool. Repeats for several runs:
+#
+#     python -m benchmarks.cold_start --runs 5
+#     python -m benchmarks.cold_start --runs 5 --env DB_POOL_PREWARM=0
+#
+# Run from the backend directory with DATABASE_URL set.
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+from benchmarks.common import request, summarize
+
+
+def wait_ready(url, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if request(f"{url}/ready")[0] == 200:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.01)
+    return False
+
+
+def cold_start(port, env, timeout, first_requests):
+    """Start one worker and return (seconds until ready, first request latencies in ms)."""
+    url = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        env={**os.environ, **env},
+    )
+    try:
+        if not wait_ready(url, timeout):
+            raise RuntimeError(f"Server on port {port} was not ready after {timeout} s")
+        ready = time.perf_counter() - started
+        latencies = []
+        for _ in range(first_requests):
+            begun = time.perf_counter()
+            request(f"{url}/ready")
+            latencies.append((time.perf_counter() - begun) * 1000)
+        return ready, latencies
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure worker cold-start time.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--first-requests", type=int, default=10,
+                        help="Requests timed right after the worker reports ready.")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the server, e.g. DB_POOL_PREWARM=0.")
+    args = parser.parse_args()
+    env = dict(item.split("=", 1) for item in args.env)
+
+    ready_ms, first = [], []
+    for run in range(args.runs):
+        seconds, latencies = cold_start(args.port, env, args.timeout, args.first_requests)
+        ready_ms.append(seconds * 1000)
+        first.extend(latencies)
+        print(f"run {run + 1}: ready after {seconds * 1000:.0f} ms, first request {latencies[0]:.1f} ms")
+    print("time to ready:", summarize(ready_ms))
+    print("first requests:", summarize(first))
+
+
+if __name__ == "__main__":
+    main()
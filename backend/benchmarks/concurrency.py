@@ -0,0 +1,74 @@
+# benchmarks/concurrency.py
+#
+# Drives many concurrent clients at one I/O-bound endpoint and reports
+# throughput and latency percentiles. Run it against a single worker before
+# and after a change to compare:
+#
+#     uvicorn app.main:app --workers 1 &
+#     python -m benchmarks.concurrency --concurrency 200 --path /budgets/
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from benchmarks.common import request, summarize
+
+
+def run(url, headers, concurrency, duration):
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                code, _ = request(url, headers=headers)
+            except OSError:
+                code = None
+            local.append((time.perf_counter() - started) * 1000)
+            if code != 200:
+                failed += 1
+        with lock:
+            latencies.extend(local)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return latencies, errors[0], elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent request throughput for one endpoint.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default="/budgets/")
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--duration", type=float, default=15.0)
+    args = parser.parse_args()
+
+    email, password = f"bench-{uuid.uuid4().hex[:8]}@example.com", "benchmark"
+    request(f"{args.url}/users/register", {"email": email, "password": password})
+    _, body = request(f"{args.url}/users/login", {"username": email, "password": password}, form=True)
+    headers = {"Authorization": f"Bearer {json.loads(body)['access_token']}"}
+    request(f"{args.url}/budgets/", {"name": "Benchmark", "amount": 1000}, headers=headers)
+
+    latencies, errors, elapsed = run(f"{args.url}{args.path}", headers, args.concurrency, args.duration)
+    print(json.dumps({
+        "path": args.path,
+        "concurrency": args.concurrency,
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "errors": errors,
+        **summarize(latencies),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+# benchmarks/generate_data.py
+#
+# Fills a database with synthetic users, budgets, categories and transactions
+# for load tests. Every generated user can log in with BENCHMARK_PASSWORD:
+#
+#     python -m benchmarks.generate_data --database-url postgresql://... \
+#         --users 1000 --budgets-per-user 5 --transactions 5000000
+#
+# On PostgreSQL transactions are streamed in with COPY; other databases use
+# batched multi-row inserts. Spend rollups are written alongside so budget
+# summaries are consistent without a rebuild.
+
+import argparse
+import csv
+import io
+import os
+import random
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+from app.db import Base
+from app.models import Budget, Category, SpendRollup, Transaction, User
+from app.passwords import get_password_hash
+from app.seed_categories import PREDEFINED_CATEGORIES
+from app.services import period_for
+from benchmarks.common import BENCHMARK_PASSWORD, benchmark_email
+
+
+def _insert_returning_ids(session: Session, model, rows):
+    return list(session.scalars(insert(model).returning(model.id, sort_by_parameter_order=True), rows))
+
+
+def _copy_transactions(session: Session, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cursor = session.connection().connection.cursor()
+    cursor.copy_expert("COPY transactions (amount, category_id, budget_id, date) FROM STDIN WITH CSV", buffer)
+
+
+def generate(
+    session: Session,
+    users: int,
+    budgets_per_user: int,
+    categories_per_user: int,
+    transactions: int,
+    years: int = 3,
+    batch_size: int = 50000,
+    seed: int = 1,
+):
+    rng = random.Random(seed)
+    use_copy = session.get_bind().dialect.name == "postgresql"
+    hashed_password = get_password_hash(BENCHMARK_PASSWORD)
+    started = time.perf_counter()
+
+    existing = set(session.scalars(select(Category.name).where(Category.name.in_(PREDEFINED_CATEGORIES))))
+    missing = [{"name": name, "is_custom": False} for name in PREDEFINED_CATEGORIES if name not in existing]
+    if missing:
+        session.execute(insert(Category), missing)
+    global_ids = list(session.scalars(select(Category.id).where(Category.user_id == None)))
+
+    first = (session.scalar(select(User.id).order_by(User.id.desc()).limit(1)) or 0) + 1
+    user_ids = _insert_returning_ids(session, User, [
+        {"email": benchmark_email(i), "hashed_password": hashed_password}
+        for i in range(first, first + users)
+    ])
+    custom_ids = {user_id: [] for user_id in user_ids}
+    if categories_per_user:
+        rows = [
+            {"name": f"bench-{user_id}-{k}", "is_custom": True, "user_id": user_id}
+            for user_id in user_ids
+            for k in range(categories_per_user)
+        ]
+        for row, category_id in zip(rows, _insert_returning_ids(session, Category, rows)):
+            custom_ids[row["user_id"]].append(category_id)
+    budget_rows = [
+        {"name": f"Budget {b}", "amount": float(rng.randrange(1000, 100000, 500)), "owner_id": user_id}
+        for user_id in user_ids
+        for b in range(budgets_per_user)
+    ]
+    budgets = [
+        (budget_id, global_ids + custom_ids[row["owner_id"]])
+        for row, budget_id in zip(budget_rows, _insert_returning_ids(session, Budget, budget_rows))
+    ]
+    session.commit()
+
+    start = datetime.utcnow() - timedelta(days=365 * years)
+    span_seconds = 365 * years * 24 * 3600
+    rollups = defaultdict(lambda: [0.0, 0])
+    written = 0
+    while written < transactions:
+        rows = []
+        for _ in range(min(batch_size, transactions - written)):
+            budget_id, category_ids = budgets[rng.randrange(len(budgets))]
+            category_id = rng.choice(category_ids)
+            amount = round(rng.lognormvariate(3.5, 1.0), 2)
+            date = start + timedelta(seconds=rng.randrange(span_seconds))
+            rows.append((amount, category_id, budget_id, date))
+            rollup = rollups[(budget_id, period_for(date), category_id)]
+            rollup[0] += amount
+            rollup[1] += 1
+        if use_copy:
+            _copy_transactions(session, rows)
+        else:
+            session.execute(insert(Transaction), [
+                {"amount": a, "category_id": c, "budget_id": b, "date": d} for a, c, b, d in rows
+            ])
+        session.commit()
+        written += len(rows)
+        elapsed = time.perf_counter() - started
+        print(f"{written}/{transactions} transactions ({written / elapsed:,.0f} rows/s)")
+
+    rollup_rows = [
+        {"budget_id": b, "period": p, "category_id": c, "total": total, "count": count}
+        for (b, p, c), (total, count) in rollups.items()
+    ]
+    for i in range(0, len(rollup_rows), batch_size):
+        session.execute(insert(SpendRollup), rollup_rows[i:i + batch_size])
+    session.commit()
+    return {
+        "users": len(user_ids),
+        "first_user_index": first,
+        "budgets": len(budgets),
+        "transactions": written,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic benchmark data.")
+    parser.add_argument("--database-url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--budgets-per-user", type=int, default=3)
+    parser.add_argument("--categories-per-user", type=int, default=2)
+    parser.add_argument("--transactions", type=int, default=1000000)
+    parser.add_argument("--years", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    Base.metadata.create_all(bind=engine)
+    with Session(bind=engine) as session:
+        summary = generate(
+            session,
+            users=args.users,
+            budgets_per_user=args.budgets_per_user,
+            categories_per_user=args.categories_per_user,
+            transactions=args.transactions,
+            years=args.years,
+            batch_size=args.batch_size,
+            seed=args.seed,
+        )
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,209 @@
+# benchmarks/load.py
+#
+# Mixed-workload load driver. Each client logs in as one of the generated
+# users (see benchmarks.generate_data) and loops over a weighted mix of
+# register/login, budget CRUD, transaction create/list and category lookups:
+#
+#     python -m benchmarks.load --url http://127.0.0.1:8000 --concurrency 50 \
+#         --duration 60 --users 100 --output after.json
+#
+# The JSON report can be compared across commits with benchmarks.report.
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from benchmarks.common import BENCHMARK_PASSWORD, benchmark_email, request
+from benchmarks.report import build_report, print_report
+
+DEFAULT_MIX = {
+    "POST /users/register": 1,
+    "POST /users/login": 1,
+    "GET /budgets/": 15,
+    "POST /budgets/": 2,
+    "PUT /budgets/{id}": 2,
+    "DELETE /budgets/{id}": 1,
+    "GET /budgets/{id}/summary": 5,
+    "POST /transactions/": 15,
+    "GET /transactions/{budget_id}": 20,
+    "GET /transactions/{budget_id} (next page)": 5,
+    "GET /categories/": 10,
+}
+
+
+class Client:
+    """One simulated user with its own token, budgets and categories."""
+
+    def __init__(self, base_url, email, rng):
+        self.base_url = base_url
+        self.email = email
+        self.rng = rng
+        self.headers = {}
+        self.budget_ids = []
+        self.category_ids = []
+        self.scratch_budgets = []
+        self.cursors = {}
+
+    def call(self, method, path, data=None):
+        return request(self.base_url + path, data, headers=self.headers, method=method)
+
+    def login(self):
+        code, body = request(
+            f"{self.base_url}/users/login",
+            {"username": self.email, "password": BENCHMARK_PASSWORD},
+            form=True,
+        )
+        if code == 200:
+            self.headers = {"Authorization": f"Bearer {json.loads(body)['access_token']}"}
+        return code
+
+    def prepare(self):
+        if self.login() != 200:
+            request(f"{self.base_url}/users/register", {"email": self.email, "password": BENCHMARK_PASSWORD})
+            self.login()
+        _, body = self.call("GET", "/budgets/")
+        self.budget_ids = [budget["id"] for budget in json.loads(body)]
+        if not self.budget_ids:
+            _, body = self.call("POST", "/budgets/", {"name": "Load test", "amount": 50000})
+            self.budget_ids = [json.loads(body)["id"]]
+        _, body = self.call("GET", "/categories/")
+        self.category_ids = [category["id"] for category in json.loads(body)]
+
+    def run(self, name):
+        rng = self.rng
+        budget_id = rng.choice(self.budget_ids)
+        if name == "POST /users/register":
+            return request(
+                f"{self.base_url}/users/register",
+                {"email": f"load-{uuid.uuid4().hex}@example.com", "password": BENCHMARK_PASSWORD},
+            )[0]
+        if name == "POST /users/login":
+            return self.login()
+        if name == "GET /budgets/":
+            return self.call("GET", "/budgets/")[0]
+        if name == "POST /budgets/":
+            code, body = self.call("POST", "/budgets/", {"name": "Scratch", "amount": 1000})
+            if code == 200:
+                self.scratch_budgets.append(json.loads(body)["id"])
+            return code
+        if name == "PUT /budgets/{id}":
+            if not self.scratch_budgets:
+                return None
+            target = rng.choice(self.scratch_budgets)
+            return self.call("PUT", f"/budgets/{target}", {"name": "Scratch", "amount": rng.randint(500, 5000)})[0]
+        if name == "DELETE /budgets/{id}":
+            if not self.scratch_budgets:
+                return None
+            return self.call("DELETE", f"/budgets/{self.scratch_budgets.pop()}")[0]
+        if name == "GET /budgets/{id}/summary":
+            return self.call("GET", f"/budgets/{budget_id}/summary")[0]
+        if name == "POST /transactions/":
+            if not self.category_ids:
+                return None
+            date = datetime.utcnow() - timedelta(days=rng.randint(0, 365))
+            return self.call("POST", "/transactions/", {
+                "amount": round(rng.lognormvariate(3.5, 1.0), 2),
+                "category_id": rng.choice(self.category_ids),
+                "budget_id": budget_id,
+                "date": date.isoformat(),
+            })[0]
+        if name == "GET /transactions/{budget_id}":
+            code, body = self.call("GET", f"/transactions/{budget_id}?limit=50")
+            if code == 200:
+                self.cursors[budget_id] = json.loads(body).get("next_cursor")
+            return code
+        if name == "GET /transactions/{budget_id} (next page)":
+            cursor = self.cursors.get(budget_id)
+            if not cursor:
+                return None
+            code, body = self.call("GET", f"/transactions/{budget_id}?limit=50&cursor={cursor}")
+            if code == 200:
+                self.cursors[budget_id] = json.loads(body).get("next_cursor")
+            return code
+        if name == "GET /categories/":
+            return self.call("GET", "/categories/")[0]
+        raise ValueError(f"Unknown operation {name}")
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.rpartition("=")
+        mix[name.strip()] = float(weight)
+    return mix
+
+
+def run_load(base_url, concurrency, duration, users, first_user, mix, seed):
+    samples = {name: [] for name in mix}
+    errors = {name: 0 for name in mix}
+    lock = threading.Lock()
+    names, weights = list(mix), list(mix.values())
+    clients = [
+        Client(base_url, benchmark_email(first_user + i % max(users, 1)), random.Random(seed + i))
+        for i in range(concurrency)
+    ]
+    for client in clients:
+        client.prepare()
+
+    deadline = time.perf_counter() + duration
+
+    def worker(client):
+        local = {name: [] for name in names}
+        failed = {name: 0 for name in names}
+        while time.perf_counter() < deadline:
+            name = client.rng.choices(names, weights)[0]
+            started = time.perf_counter()
+            try:
+                code = client.run(name)
+            except OSError:
+                code = 0
+            if code is None:
+                continue
+            local[name].append((time.perf_counter() - started) * 1000)
+            if code >= 400 or code == 0:
+                failed[name] += 1
+        with lock:
+            for name in names:
+                samples[name].extend(local[name])
+                errors[name] += failed[name]
+
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples, errors, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a mixed workload against the API.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--users", type=int, default=20, help="Generated users to log in as.")
+    parser.add_argument("--first-user", type=int, default=1, help="Index of the first generated user.")
+    parser.add_argument("--mix", type=parse_mix, default=DEFAULT_MIX,
+                        help="Comma-separated 'operation=weight' pairs overriding the default mix.")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the JSON report to this file.")
+    args = parser.parse_args()
+
+    samples, errors, elapsed = run_load(
+        args.url, args.concurrency, args.duration, args.users, args.first_user, args.mix, args.seed
+    )
+    report = build_report(
+        samples, errors, elapsed,
+        url=args.url, concurrency=args.concurrency, duration=args.duration, mix=args.mix,
+    )
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+# benchmarks/login_storm.py
+#
+# Measures latency of a non-auth endpoint (GET /budgets/ with a cached token)
+# while a burst of concurrent logins hammers bcrypt. Run against a live server:
+#
+#     uvicorn app.main:app &
+#     python -m benchmarks.login_storm --url http://127.0.0.1:8000
+#
+# Compare the "quiet" and "storm" percentiles: with hashing off the request
+# threadpool they should stay close together.
+
+import argparse
+import json
+import threading
+import time
+import uuid
+from benchmarks.common import request, summarize
+
+
+def probe(url, headers, duration):
+    """Hit url sequentially for duration seconds and return latencies in ms."""
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        request(url, headers=headers)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def storm(url, credentials, concurrency, stop):
+    """Run concurrent logins until stop is set; return status code counts."""
+    codes = {}
+    lock = threading.Lock()
+
+    def worker():
+        while not stop.is_set():
+            code, _ = request(url, credentials, form=True)
+            with lock:
+                codes[code] = codes.get(code, 0) + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    return threads, codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Non-auth latency during a login storm.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent login clients.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per phase.")
+    args = parser.parse_args()
+
+    email, password = f"bench-{uuid.uuid4().hex[:8]}@example.com", "benchmark"
+    request(f"{args.url}/users/register", {"email": email, "password": password})
+    _, body = request(f"{args.url}/users/login", {"username": email, "password": password}, form=True)
+    headers = {"Authorization": f"Bearer {json.loads(body)['access_token']}"}
+    probe_url = f"{args.url}/budgets/"
+
+    quiet = probe(probe_url, headers, args.duration)
+
+    stop = threading.Event()
+    threads, codes = storm(f"{args.url}/users/login", {"username": email, "password": password}, args.concurrency, stop)
+    loaded = probe(probe_url, headers, args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    print(json.dumps({
+        "concurrency": args.concurrency,
+        "quiet": summarize(quiet),
+        "storm": summarize(loaded),
+        "login_status_codes": codes,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
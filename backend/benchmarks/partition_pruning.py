@@ -0,0 +1,164 @@
+# benchmarks/partition_pruning.py
+#
+# Compares a plain transactions table with one range-partitioned by month
+# (the layout of the c9d5e1f7a3b8 migration) at realistic history sizes. It
+# builds both side by side in a scratch PostgreSQL database with
+# generate_series, then times the queries the services issue and a retention
+# delete, and prints how many partitions each plan touched:
+#
+#     python -m benchmarks.partition_pruning \
+#         --database-url postgresql://localhost/bench --rows 20000000 --years 5
+#
+# Point it at a throwaway database: it creates and drops bench_* tables. Loading
+# tens of millions of rows takes a few minutes per table.
+
+import argparse
+import json
+import statistics
+import time
+from datetime import date
+from sqlalchemy import create_engine, text
+from app.partitions import add_months
+
+PLAIN = "bench_tx_plain"
+PARTITIONED = "bench_tx_partitioned"
+COLUMNS = """
+    id bigint NOT NULL,
+    amount double precision NOT NULL,
+    category_id integer,
+    date timestamp without time zone NOT NULL,
+    budget_id integer
+"""
+
+
+def build(connection, rows: int, years: int, budgets: int, start: date):
+    end = add_months(start, 12 * years)
+    connection.execute(text(f"DROP TABLE IF EXISTS {PLAIN}, {PARTITIONED} CASCADE"))
+    connection.execute(text(f"CREATE TABLE {PLAIN} ({COLUMNS}, PRIMARY KEY (id))"))
+    connection.execute(text(f"CREATE TABLE {PARTITIONED} ({COLUMNS}, PRIMARY KEY (id, date)) PARTITION BY RANGE (date)"))
+    period = start
+    while period < end:
+        connection.execute(text(
+            f"CREATE TABLE {PARTITIONED}_p{period:%Y_%m} PARTITION OF {PARTITIONED} "
+            f"FOR VALUES FROM ('{period}') TO ('{add_months(period, 1)}')"
+        ))
+        period = add_months(period, 1)
+
+    seconds = (end - start).days * 86400
+    for table in (PLAIN, PARTITIONED):
+        started = time.perf_counter()
+        connection.execute(text(
+            f"INSERT INTO {table} (id, amount, category_id, date, budget_id) "
+            "SELECT g, round((random() * 500)::numeric, 2), 1 + g % 8, "
+            "       :start + (random() * :seconds) * interval '1 second', 1 + (random() * (:budgets - 1))::int "
+            "FROM generate_series(1, :rows) AS g"
+        ), {"start": start, "seconds": seconds, "budgets": budgets, "rows": rows})
+        connection.execute(text(f"CREATE INDEX ON {table} (budget_id, date, id)"))
+        connection.execute(text(f"CREATE INDEX ON {table} (category_id, date, id)"))
+        connection.execute(text(f"ANALYZE {table}"))
+        print(f"loaded {table}: {rows} rows in {time.perf_counter() - started:.1f} s")
+    return end
+
+
+def explain(connection, sql: str, params):
+    plan = connection.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql), params).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    relations = set()
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+    buffers = plan[0]["Plan"].get("Shared Hit Blocks", 0) + plan[0]["Plan"].get("Shared Read Blocks", 0)
+    return len(relations), buffers
+
+
+def timed(connection, sql: str, params, repeat: int):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        connection.execute(text(sql), params).all()
+        samples.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(samples), 2)
+
+
+def queries(start: date, end: date, budget: int):
+    month = add_months(start, (12 * (end.year - start.year) + end.month - start.month) // 2)
+    return {
+        # GET /budgets/{id}/summary-style scan of one month
+        "month total": (
+            "SELECT category_id, sum(amount), count(*) FROM {table} "
+            "WHERE date >= :lo AND date < :hi GROUP BY category_id",
+            {"lo": month, "hi": add_months(month, 1)},
+        ),
+        # list_transactions first page, with the bounds derived from the rollups
+        "budget page (bounded)": (
+            "SELECT id, budget_id, category_id, date, amount FROM {table} "
+            "WHERE budget_id = :budget AND date >= :lo AND date < :hi ORDER BY date DESC, id DESC LIMIT 51",
+            {"budget": budget, "lo": add_months(end, -3), "hi": end},
+        ),
+        # the same page without bounds, as before this change
+        "budget page (unbounded)": (
+            "SELECT id, budget_id, category_id, date, amount FROM {table} "
+            "WHERE budget_id = :budget ORDER BY date DESC, id DESC LIMIT 51",
+            {"budget": budget},
+        ),
+        # a deep keyset page: the row comparison alone can't prune, the extra date bound can
+        "keyset page": (
+            "SELECT id, budget_id, category_id, date, amount FROM {table} "
+            "WHERE budget_id = :budget AND (date, id) < (:cursor, 0) AND date <= :cursor "
+            "ORDER BY date DESC, id DESC LIMIT 51",
+            {"budget": budget, "cursor": month},
+        ),
+    }
+
+
+def retention(connection, start: date):
+    """Remove the oldest month: DELETE on the plain table, DETACH + DROP on the partitioned one."""
+    started = time.perf_counter()
+    deleted = connection.execute(text(f"DELETE FROM {PLAIN} WHERE date < :cutoff"), {"cutoff": add_months(start, 1)}).rowcount
+    delete_ms = (time.perf_counter() - started) * 1000
+    started = time.perf_counter()
+    connection.execute(text(f"ALTER TABLE {PARTITIONED} DETACH PARTITION {PARTITIONED}_p{start:%Y_%m}"))
+    connection.execute(text(f"DROP TABLE {PARTITIONED}_p{start:%Y_%m}"))
+    detach_ms = (time.perf_counter() - started) * 1000
+    return {"rows": deleted, "delete_ms": round(delete_ms, 1), "detach_drop_ms": round(detach_ms, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark partition pruning on a partitioned transactions table.")
+    parser.add_argument("--database-url", required=True)
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--budgets", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--keep", action="store_true", help="Keep the bench_* tables afterwards.")
+    args = parser.parse_args()
+
+    engine = create_engine(args.database_url)
+    start = date(2020, 1, 1)
+    with engine.begin() as connection:
+        end = build(connection, args.rows, args.years, args.budgets, start)
+
+    results = {}
+    with engine.connect() as connection:
+        for name, (sql, params) in queries(start, end, budget=args.budgets // 2).items():
+            for table in (PLAIN, PARTITIONED):
+                statement = sql.format(table=table)
+                relations, buffers = explain(connection, statement, params)
+                results[f"{name} [{table}]"] = {
+                    "median_ms": timed(connection, statement, params, args.repeat),
+                    "relations_scanned": relations,
+                    "buffers": buffers,
+                }
+    with engine.begin() as connection:
+        results["retention (oldest month)"] = retention(connection, start)
+        if not args.keep:
+            connection.execute(text(f"DROP TABLE IF EXISTS {PLAIN}, {PARTITIONED} CASCADE"))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
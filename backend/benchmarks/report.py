@@ -0,0 +1,90 @@
+# benchmarks/report.py
+#
+# Turns raw latency samples into a per-endpoint report (throughput and
+# p50/p95/p99) and compares two saved reports:
+#
+#     python -m benchmarks.report compare before.json after.json
+
+import argparse
+import json
+import subprocess
+import sys
+from datetime import datetime
+from benchmarks.common import summarize
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_report(samples, errors, elapsed: float, **meta) -> dict:
+    """Build a report from {endpoint: [latency_ms]} and {endpoint: error_count}."""
+    endpoints = {}
+    for name in sorted(set(samples) | set(errors)):
+        latencies = samples.get(name, [])
+        endpoints[name] = {
+            **summarize(latencies),
+            "errors": errors.get(name, 0),
+            "throughput_rps": round(len(latencies) / elapsed, 2) if elapsed else None,
+        }
+    total = sum(len(latencies) for latencies in samples.values())
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        **meta,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(report: dict, out=sys.stdout):
+    out.write(f"commit {report.get('commit')}  {report['throughput_rps']} req/s over {report['elapsed_seconds']} s\n")
+    out.write(f"{'endpoint':<44}{'count':>8}{'err':>6}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}\n")
+    for name, row in report["endpoints"].items():
+        out.write(
+            f"{name:<44}{row['requests']:>8}{row['errors']:>6}{row['throughput_rps']:>9}"
+            f"{row['p50_ms'] or '-':>9}{row['p95_ms'] or '-':>9}{row['p99_ms'] or '-':>9}\n"
+        )
+
+
+def compare(before: dict, after: dict, out=sys.stdout):
+    """Print the relative change of throughput and p50/p95/p99 per endpoint."""
+    out.write(f"{before.get('commit')} -> {after.get('commit')}\n")
+    out.write(f"{'endpoint':<44}{'rps':>10}{'p50':>10}{'p95':>10}{'p99':>10}\n")
+    for name in sorted(set(before["endpoints"]) & set(after["endpoints"])):
+        a, b = before["endpoints"][name], after["endpoints"][name]
+        cells = []
+        for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms"):
+            if a.get(key) and b.get(key) is not None:
+                cells.append(f"{(b[key] - a[key]) / a[key] * 100:+.1f}%")
+            else:
+                cells.append("-")
+        out.write(f"{name:<44}" + "".join(f"{cell:>10}" for cell in cells) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect benchmark reports.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    show = sub.add_parser("show")
+    show.add_argument("report")
+    diff = sub.add_parser("compare")
+    diff.add_argument("before")
+    diff.add_argument("after")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        with open(args.report) as f:
+            print_report(json.load(f))
+    else:
+        with open(args.before) as f, open(args.after) as g:
+            compare(json.load(f), json.load(g))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+# benchmarks/serialization.py
+#
+# Compares the cost of building a large list response two ways, end to end
+# from the query: ORM objects validated one by one through the response_model
+# and encoded with the stdlib json encoder (FastAPI's default path), versus
+# column rows encoded with orjson (app.serialization), with and without bulk
+# TypeAdapter validation:
+#
+#     python -m benchmarks.serialization --rows 50000 --repeat 5
+#
+# Runs against a throwaway in-memory SQLite database; no server is needed.
+
+import argparse
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import create_engine, insert, select
+from sqlalchemy.orm import Session
+from app import serialization
+from app.db import Base
+from app.models import Budget, Category, Transaction, User
+from app.schemas import TransactionResponse
+from app.services import TRANSACTION_COLUMNS
+from benchmarks.common import summarize
+
+
+def populate(session: Session, rows: int, seed: int = 1):
+    rng = random.Random(seed)
+    session.add(User(id=1, email="bench@example.com", hashed_password="x"))
+    session.add(Budget(id=1, name="Bench", amount=1e9, owner_id=1))
+    session.add(Category(id=1, name="Bench", is_custom=False))
+    session.flush()
+    start = datetime(2024, 1, 1)
+    session.execute(insert(Transaction), [
+        {
+            "amount": round(rng.lognormvariate(3.5, 1.0), 2),
+            "category_id": 1,
+            "budget_id": 1,
+            "date": start + timedelta(seconds=rng.randrange(365 * 24 * 3600)),
+        }
+        for _ in range(rows)
+    ])
+    session.commit()
+
+
+def orm_response_model(session: Session) -> bytes:
+    transactions = session.scalars(select(Transaction)).all()
+    items = [TransactionResponse.model_validate(transaction) for transaction in transactions]
+    return json.dumps(jsonable_encoder(items)).encode()
+
+
+def rows_orjson(session: Session) -> bytes:
+    rows = serialization.rows_to_dicts(session.execute(select(*TRANSACTION_COLUMNS)).all())
+    return serialization.json_response(rows, validate=False).body
+
+
+def rows_type_adapter(session: Session) -> bytes:
+    rows = serialization.rows_to_dicts(session.execute(select(*TRANSACTION_COLUMNS)).all())
+    return serialization.json_response(rows, List[TransactionResponse], validate=True).body
+
+
+PATHS = {
+    "orm + response_model + json": orm_response_model,
+    "rows + orjson": rows_orjson,
+    "rows + TypeAdapter": rows_type_adapter,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare list response serialization paths.")
+    parser.add_argument("--rows", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    with Session(bind=engine) as session:
+        populate(session, args.rows)
+
+    print(f"{'path':<32}{'p50 ms':>10}{'min ms':>10}{'bytes':>12}")
+    baseline = None
+    for name, build in PATHS.items():
+        timings = []
+        for _ in range(args.repeat):
+            with Session(bind=engine) as session:
+                started = time.perf_counter()
+                body = build(session)
+                timings.append((time.perf_counter() - started) * 1000)
+        p50 = summarize(timings)["p50_ms"]
+        baseline = baseline or p50
+        print(f"{name:<32}{p50:>10}{min(timings):>10.2f}{len(body):>12}  x{baseline / p50:.1f}")
+
+
+if __name__ == "__main__":
+    main()